@@ -0,0 +1,153 @@
+"""
+Benchmarks for the botasaurus cache.
+
+Usage:
+    python benchmarks/cache_benchmark.py reads --items 100000 --size 1000
+    python benchmarks/cache_benchmark.py storages --items 100000 --size 1000
+    python benchmarks/cache_benchmark.py postgres --items 100000 --size 1000 --host localhost --password postgres
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from time import perf_counter
+
+
+def timed(label, fn):
+    start = perf_counter()
+    result = fn()
+    elapsed = perf_counter() - start
+    print(f"    {label:<32} {elapsed:8.3f}s")
+    return result
+
+
+def create_items(count, size):
+    return [{"id": i, "html": "<div class='product'>lorem ipsum</div>" * max(1, size // 38)} for i in range(count)]
+
+
+def benchmark_reads(args):
+    from botasaurus.cache import Cache, _get_cache_path_from_hash, safe_get
+    from botasaurus.io_executor import map_io, choose_io_strategy, estimate_average_file_size
+
+    directory = tempfile.mkdtemp()
+    try:
+        Cache.set_cache_directory(os.path.join(directory, "cache"))
+        items = create_items(args.items, args.size)
+        timed(f"write {args.items} items", lambda: [Cache.put("benchmark", item["id"], item) for item in items])
+
+        paths = [_get_cache_path_from_hash("benchmark", Cache.hash(item["id"])) for item in items]
+        strategy = choose_io_strategy(len(paths), estimate_average_file_size(paths))
+        print(f"  Reading {len(paths)} files of ~{args.size} bytes, auto strategy: {strategy}")
+
+        timed("serial loop", lambda: [safe_get(path) for path in paths])
+        timed("threads", lambda: map_io(safe_get, paths, strategy="threads"))
+        timed("processes", lambda: map_io(safe_get, paths, strategy="processes"))
+        timed("auto (Cache.get_items)", lambda: Cache.get_items("benchmark", [item["id"] for item in items]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def create_storages(directory):
+    """Returns (name, storage) for each cache storage that can be imported."""
+    from botasaurus.cache import Cache
+    from botasaurus.cache_storage import FileCacheStorage
+    from botasaurus.segment_cache_storage import SegmentCacheStorage
+
+    Cache.set_cache_directory(os.path.join(directory, "cache"))
+    storages = [
+        ("file", FileCacheStorage()),
+        ("segment", SegmentCacheStorage(os.path.join(directory, "segments"))),
+    ]
+    try:
+        from sqlite_cache_storage import SqliteCacheStorage
+        storages.append(("sqlite", SqliteCacheStorage(os.path.join(directory, "cache.db"))))
+    except ImportError:
+        print("  Skipping sqlite, install sqlite-cache-storage to include it")
+    try:
+        from lmdb_cache_storage import LmdbCacheStorage
+        storages.append(("dbm", LmdbCacheStorage(os.path.join(directory, "cache.dbm"), backend="dbm")))
+        import lmdb  # noqa: F401
+        storages.append(("lmdb", LmdbCacheStorage(os.path.join(directory, "cache.lmdb"), backend="lmdb")))
+    except ImportError:
+        print("  Skipping lmdb, install lmdb-cache-storage to include it")
+    return storages
+
+
+def benchmark_storages(args):
+    from botasaurus.cache_storage import get_many, put_many
+
+    directory = tempfile.mkdtemp()
+    try:
+        items = create_items(args.items, args.size)
+        keys = [item["id"] for item in items]
+        print(f"  Writing and reading {args.items} items of ~{args.size} bytes")
+        for name, storage in create_storages(directory):
+            print(f"  {name}")
+            timed("put", lambda: [storage.put("benchmark", item["id"], item) for item in items])
+            timed("get", lambda: [storage.get("benchmark", key) for key in keys])
+            timed("put_many", lambda: put_many(storage, "benchmark", [(item["id"], item) for item in items]))
+            timed("get_many", lambda: get_many(storage, "benchmark", keys))
+            if hasattr(storage, "close"):
+                storage.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def benchmark_postgres(args):
+    from pg_cache_storage import PostgresCacheStorage
+    from botasaurus.cache_storage import get_many, put_many
+
+    items = create_items(args.items, args.size)
+    keys = [item["id"] for item in items]
+    print(f"  Writing and reading {args.items} items of ~{args.size} bytes")
+    formats = [("text", None), ("jsonb", None), ("bytea", "gzip"), ("bytea", "zstd")]
+    for storage_format, compression in formats:
+        name = storage_format if compression is None else f"{storage_format} ({compression})"
+        storage = PostgresCacheStorage(
+            host=args.host, port=args.port, username=args.username, password=args.password, db_name=args.db_name,
+            table_name=f"botasaurus_benchmark_{storage_format}", storage_format=storage_format, compression=compression, pool=True,
+        )
+        # Truncated rather than cleared, as deleted rows would count in the table size until a vacuum
+        with storage._get_connection() as conn:
+            conn.execute("TRUNCATE %s" % storage.table_name)
+        print(f"  {name}")
+        timed("put_many", lambda: put_many(storage, "benchmark", [(item["id"], item) for item in items]))
+        timed("get_many", lambda: get_many(storage, "benchmark", keys))
+        timed(f"get x {min(len(keys), 1000)}", lambda: [storage.get("benchmark", key) for key in keys[:1000]])
+        with storage._get_connection() as conn:
+            size = conn.execute("SELECT pg_total_relation_size(%s) AS size", (storage.table_name,)).fetchone()["size"]
+            conn.execute("DROP TABLE %s" % storage.table_name)
+        print(f"    {'table size':<32} {size / 1024 / 1024:8.1f} MB")
+        storage.close()
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="Botasaurus cache benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reads = subparsers.add_parser("reads", help="Compare strategies for reading many cache files")
+    reads.add_argument("--items", type=int, default=100000)
+    reads.add_argument("--size", type=int, default=1000, help="Approximate size of each item in bytes")
+    reads.set_defaults(handler=benchmark_reads)
+
+    storages = subparsers.add_parser("storages", help="Compare cache storages one item at a time and in batches")
+    storages.add_argument("--items", type=int, default=100000)
+    storages.add_argument("--size", type=int, default=1000, help="Approximate size of each item in bytes")
+    storages.set_defaults(handler=benchmark_storages)
+
+    postgres = subparsers.add_parser("postgres", help="Compare the storage formats of PostgresCacheStorage")
+    postgres.add_argument("--items", type=int, default=100000)
+    postgres.add_argument("--size", type=int, default=1000, help="Approximate size of each item in bytes")
+    postgres.add_argument("--host", default="localhost")
+    postgres.add_argument("--port", type=int, default=5432)
+    postgres.add_argument("--username", default="postgres")
+    postgres.add_argument("--password", default="postgres")
+    postgres.add_argument("--db-name", default="cache")
+    postgres.set_defaults(handler=benchmark_postgres)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = create_parser().parse_args()
+    args.handler(args)
@@ -2,11 +2,13 @@ from functools import wraps
 from traceback import print_exc, format_exc
 from datetime import timedelta
 from typing import Any, Callable, Optional, Union, List
-from botasaurus.decorators_common import evaluate_proxy, print_running, write_output, IS_PRODUCTION, AsyncQueueResult, AsyncResult,  run_parallel, save_error_logs
+from botasaurus.decorators_common import evaluate_proxy, print_running, write_output, IS_PRODUCTION, AsyncQueueResult, AsyncResult,  run_parallel, save_error_logs, stream_results, iter_stream_input
 from .utils import is_errors_instance, NotFoundException
 from .list_utils import flatten
 from .dontcache import is_dont_cache
-from .cache_storage import FileCacheStorage
+from .cache_storage import resolve_cache_storage
+from .cache_revalidation import get_cached, partition_cached, iter_partitioned
+from .single_flight import run_single_flight
 from botasaurus_driver.driver import Driver
 from pathlib import Path
 
@@ -33,6 +35,7 @@ def browser(
     metadata: Optional[Any] = None,
     cache: Union[bool, str] = False,
     expires_in: Optional[timedelta] = None,
+    single_flight: Union[bool, str] = False,
     cache_storage=None,
     block_images: bool = False,
     block_images_and_css: bool = False,
@@ -49,6 +52,7 @@ def browser(
     beep: bool = False,
     close_on_crash: bool = False,
     async_queue: bool = False,
+    stream: Union[bool, str] = False,
     run_async: bool = False,
     profile: Optional[Union[Callable[[Any], str], str]] = None,
     proxy: Optional[Union[Callable[[Any], str], str]] = None,
@@ -75,13 +79,14 @@ def browser(
         def wrapper_browser(*args, **kwargs) -> Any:
             print_running()
 
-            nonlocal parallel, data, cache, expires_in, cache_storage, block_images_and_css, block_images, window_size, metadata, add_arguments,chrome_executable_path, extensions, tiny_profile, wait_for_complete_page_load, lang, headless, beep, close_on_crash, async_queue, run_async, profile, proxy, user_agent, reuse_driver, raise_exception, must_raise_exceptions, output, output_formats, max_retry, retry_wait, create_driver, create_error_logs, enable_xvfb_virtual_display, host, port, remove_default_browser_check_argument
+            nonlocal parallel, data, cache, expires_in, single_flight, cache_storage, block_images_and_css, block_images, window_size, metadata, add_arguments,chrome_executable_path, extensions, tiny_profile, wait_for_complete_page_load, lang, headless, beep, close_on_crash, async_queue, stream, run_async, profile, proxy, user_agent, reuse_driver, raise_exception, must_raise_exceptions, output, output_formats, max_retry, retry_wait, create_driver, create_error_logs, enable_xvfb_virtual_display, host, port, remove_default_browser_check_argument
             
             parallel = kwargs.get("parallel", parallel)
             data = kwargs.get("data", data)
             cache = kwargs.get("cache", cache)
             expires_in = kwargs.get("expires_in", expires_in)
-            storage = kwargs.get("cache_storage", cache_storage) or FileCacheStorage
+            single_flight = kwargs.get("single_flight", single_flight)
+            storage = resolve_cache_storage(kwargs.get("cache_storage", cache_storage))
             block_images = kwargs.get("block_images", block_images)
             block_images_and_css = kwargs.get("block_images_and_css", block_images_and_css)
             add_arguments = kwargs.get("add_arguments", add_arguments)
@@ -96,6 +101,7 @@ def browser(
             beep = kwargs.get("beep", beep)
             close_on_crash = kwargs.get("close_on_crash", close_on_crash)
             async_queue = kwargs.get("async_queue", async_queue)
+            stream = kwargs.get("stream", stream)
             run_async = kwargs.get("run_async", run_async)
             profile = kwargs.get("profile", profile)
             proxy = kwargs.get("proxy", proxy)
@@ -129,7 +135,7 @@ def browser(
             def run_task(data, retry_attempt, retry_driver=None) -> Any:
                 if cache is True:
                     # Returns {"data": value} or None
-                    cached = storage.get(fn_name, data, expires_in)
+                    cached, _ = get_cached(storage, fn_name, data, expires_in, known_misses=known_misses)
                     if cached is not None:
                         return cached["data"]
                     
@@ -268,6 +274,14 @@ def browser(
 
                     return result
 
+            def run_item(data_item):
+                if single_flight and cache is True:
+                    # Duplicate inputs running at the same time share one execution
+                    return run_single_flight(
+                        fn_name, data_item, lambda: run_task(data_item, 0), single_flight == "cross_process"
+                    )
+                return run_task(data_item, 0)
+
             number_of_workers = parallel() if callable(parallel) else parallel
 
             if number_of_workers is not None and not isinstance(number_of_workers, int):
@@ -275,6 +289,25 @@ def browser(
 
             used_data = args[0] if len(args) > 0 else data
             used_data = used_data() if callable(used_data) else used_data
+
+            if stream:
+                # Results are yielded and written as they complete, so the input can be a generator of any size
+                known_misses = set()
+                stream_input = iter_stream_input(used_data)
+                if cache is True:
+                    entries = iter_partitioned(
+                        storage, fn_name, stream_input, expires_in, known_misses, keep_misses=single_flight != "cross_process"
+                    )
+                else:
+                    entries = ((data_item, False, None) for data_item in stream_input)
+                n = int(number_of_workers) if number_of_workers and number_of_workers > 1 else 1
+
+                def close_drivers():
+                    if not dont_close_driver:
+                        close_driver_pool(_driver_pool)
+
+                return stream_results(run_item, entries, n, stream == "ordered", output, output_formats, fn_name, close_drivers)
+
             orginal_data = used_data
 
             return_first = False
@@ -282,6 +315,16 @@ def browser(
                 return_first = True
                 used_data = [used_data]
 
+            results_by_index, known_misses = {}, None
+            if cache is True:
+                # Cached inputs are resolved in bulk before any worker starts, so only misses take a worker.
+                # Misses are read again when another process may cache them first.
+                results_by_index, known_misses = partition_cached(
+                    storage, fn_name, used_data, expires_in, keep_misses=single_flight != "cross_process"
+                )
+            missed_indices = [index for index in range(len(used_data)) if index not in results_by_index]
+            missed_data = [used_data[index] for index in missed_indices]
+
             result = []
             has_number_of_workers = number_of_workers is not None and not (
                 number_of_workers == False
@@ -290,23 +333,26 @@ def browser(
             if not has_number_of_workers or number_of_workers <= 1:
                 n = 1
             else:
-                n = min(len(used_data), int(number_of_workers))
+                n = min(len(missed_data), int(number_of_workers))
 
             if n <= 1:
-                for index in range(len(used_data)):
-                    data_item = used_data[index]
-                    current_result = run_task(data_item, 0)
+                for data_item in missed_data:
+                    current_result = run_item(data_item)
                     result.append(current_result)
             else:
 
                 def run(data_item):
-                    current_result = run_task(data_item, 0)
+                    current_result = run_item(data_item)
                     return current_result
 
                 if callable(parallel):
                     print(f"Running {n} Browsers in Parallel")
                 
-                result = run_parallel(run, used_data, n, True)
+                result = run_parallel(run, missed_data, n, True)
+
+            # Merges the results of misses with the cached ones, in input order
+            results_by_index.update(zip(missed_indices, result))
+            result = [results_by_index[index] for index in range(len(used_data))]
 
             if not dont_close_driver:
                 close_driver_pool(_driver_pool)
@@ -333,6 +379,10 @@ def browser(
             raise ValueError(
                 "The options 'run_async' and 'async_queue' cannot be applied at the same time. Please set only one of them to True."
             )
+        if stream and async_queue:
+            raise ValueError(
+                "The options 'stream' and 'async_queue' cannot be applied at the same time. Please set only one of them to True."
+            )
 
         if run_async:
 
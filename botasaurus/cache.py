@@ -1,12 +1,18 @@
 import json
 import os
 from hashlib import md5
+from threading import get_ident
 from shutil import rmtree
 from json.decoder import JSONDecodeError
 from .output import get_output_directory, get_output_path
 from .decorators_utils import create_directory_if_not_exists
 from .utils import read_json, relative_path, write_json as format_write_json
 from .dontcache import DontCache
+from .cache_index import KeyIndex
+from .io_executor import map_io, map_files, get_io_executor
+from .cache_keys import canonical_hash, validate_key_hashing
+from .cache_stats import note_bytes_read, note_bytes_written
+from .cache_codecs import CorruptedCacheItemException, CACHE_FILE_MAGIC, MAX_HEADER_LENGTH, get_codec, encode_cache_item, decode_cache_item, parse_header
 
 
 class CacheMissException(Exception):
@@ -18,80 +24,198 @@ class CacheMissException(Exception):
 def get_directory_path(file_path):
     return os.path.dirname(file_path)
 
-def write_json(data, path):
+TEMP_FILE_SUFFIX = ".tmp"
+
+def write_atomic(content, path):
+    """
+    Write bytes to a temporary file next to path and rename it over path, 
+    so readers never see a half written file, even if the process is killed.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{get_ident()}{TEMP_FILE_SUFFIX}"
     try:
-        with open(path, 'w', encoding="utf-8") as fp:
-            json.dump(data, fp)
+        with open(tmp_path, 'wb') as fp:
+            fp.write(content)
+            if Cache.fsync:
+                fp.flush()
+                os.fsync(fp.fileno())
     except FileNotFoundError:
         create_directory_if_not_exists(get_directory_path(path))
-        return write_json(data, path)
+        return write_atomic(content, path)
+
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        _remove(tmp_path)
+        raise
+
+def write_json(data, path):
+    write_atomic(json.dumps(data).encode('utf-8'), path)
+
+def read_cache_item(path):
+    with open(path, 'rb') as fp:
+        content = fp.read()
+    note_bytes_read(len(content))
+    return decode_cache_item(content, path)
+
+def is_cache_item_corrupted(path):
+    """Checks the header of compressed items against the file size, and decodes items stored as plain JSON."""
+    with open(path, 'rb') as fp:
+        head = fp.read(MAX_HEADER_LENGTH)
+        if not head.startswith(CACHE_FILE_MAGIC):
+            try:
+                json.loads(head + fp.read())
+                return False
+            except ValueError:
+                return True
+        try:
+            payload_start, length, _ = parse_header(head, path)
+        except CorruptedCacheItemException:
+            return True
+        return os.fstat(fp.fileno()).st_size != payload_start + length
+
+def write_cache_item(data, path, compression=None):
+    codec = get_codec(compression if compression is not None else Cache.compression)
+    content = encode_cache_item(data, codec)
+    note_bytes_written(len(content))
+    write_atomic(content, path)
 
 
 def getfnname(func):
     return func if isinstance(func, str) else func.__name__
 
-def _get_cache_path(func, data):
-    fn_name = getfnname(func)
-    fn_cache_dir = f'{Cache.cache_directory}{fn_name}/'
+SHARDED_MARKER = ".sharded"
+SEGMENT_MARKER = ".segments"  # written by SegmentCacheStorage
 
-    # Serialize the data to a JSON string and encode to bytes
-    serialized_data = json.dumps(data).encode('utf-8')
-    
-    # Generate a hash from the serialized data
-    data_hash = md5(serialized_data).hexdigest()
-    if Cache.cache_directory == "cache/":
-      cache_path = os.path.join(fn_cache_dir, data_hash + ".json")
-    else:
-      cache_path = os.path.join(relative_path(fn_cache_dir), data_hash + ".json")
-    # Create a unique cache file path with a .json extension
-    cache_path = os.path.join(fn_cache_dir, data_hash + ".json")
-    return cache_path
+def _get_fn_cache_dir(fn_name):
+    return f'{Cache.cache_directory}{fn_name}/'
+
+sharded_fns = {}
+def _is_sharded(fn_name):
+    # The layout is recorded on disk by a marker file, so a cache directory keeps
+    # working regardless of which layout the current process prefers.
+    if fn_name not in sharded_fns:
+        marker = relative_path(_get_fn_cache_dir(fn_name) + SHARDED_MARKER)
+        sharded_fns[fn_name] = os.path.exists(marker)
+    return sharded_fns[fn_name]
+
+def _get_cache_path_from_hash(fn_name, data_hash):
+    fn_cache_dir = _get_fn_cache_dir(fn_name)
+    if _is_sharded(fn_name):
+        # cache/<fn>/ab/cd/abcd....json keeps every directory small
+        return relative_path(os.path.join(fn_cache_dir, data_hash[:2], data_hash[2:4], data_hash + ".json"))
+    return relative_path(os.path.join(fn_cache_dir, data_hash + ".json"))
+
+def _get_cache_path(func, data):
+    return _get_cache_path_from_hash(getfnname(func), _hash(data))
 
 def _hash( data):
+    if Cache.key_hashing == "canonical":
+        return canonical_hash(data)
+    return _legacy_hash(data)
+
+def _legacy_hash(data):
     # Serialize the data to a JSON string and encode to bytes
     serialized_data = json.dumps(data).encode('utf-8')
     
     # Generate a hash from the serialized data
     return  md5(serialized_data).hexdigest()
 
+def _migrate_legacy_key(fn_name, key_data):
+    """Moves the item cached under the legacy hash of key_data to its canonical hash. Returns whether an item was moved."""
+    legacy_hash, data_hash = _legacy_hash(key_data), canonical_hash(key_data)
+    if legacy_hash == data_hash:
+        return False
+    legacy_path = _get_cache_path_from_hash(fn_name, legacy_hash)
+    if not _has(legacy_path):
+        return False
+
+    path = _get_cache_path_from_hash(fn_name, data_hash)
+    create_directory_if_not_exists(get_directory_path(path))
+    try:
+        os.replace(legacy_path, path)
+    except FileNotFoundError:
+        # Migrated by another thread
+        return _has(path)
+    if Cache.indexed:
+        index = _get_index(fn_name)
+        index.discard(legacy_hash)
+        index.add(data_hash)
+    return True
+
+def _has_or_migrate(fn_name, key_data, path):
+    if _has(path):
+        return True
+    return Cache.key_hashing == "canonical" and Cache.migrate_keys_on_read and _migrate_legacy_key(fn_name, key_data)
+
 
 def _has(cache_path):
     return os.path.exists(cache_path)
 
 def _get(cache_path):
+    # Only unparsable JSON and bad headers are ValueErrors. Items needing a missing codec raise CodecUnavailableError and are kept.
     try:
-        return read_json(cache_path)
-    except (JSONDecodeError, FileNotFoundError):
-        # These are files which are corrupted, likely as user paused when files were being written.
+        return read_cache_item(cache_path)
+    except (ValueError, FileNotFoundError):
+        # These are files which are corrupted, likely written by older versions when the user paused while files were being written.
         _remove(cache_path)
         raise CacheMissException(cache_path)
 
 def safe_get(cache_path):
     try:
-        return read_json(cache_path)
-    except (JSONDecodeError, FileNotFoundError):
+        return read_cache_item(cache_path)
+    except (ValueError, FileNotFoundError):
         _remove(cache_path)
-        # These are files which are corrupted, likely as user paused when files were being written.
+        # These are files which are corrupted, likely written by older versions when the user paused while files were being written.
         return None
 
 def _read_json_files(file_paths):
-    from joblib import Parallel, delayed
-    results = Parallel(n_jobs=-1)(delayed(safe_get)(file_path) for file_path in file_paths)
-    return results
+    return map_files(safe_get, file_paths)
+
+def _iter_map_batches(fn, items, batch_size, n_workers=None):
+    """
+    Yields (item, fn(item)) in order, running fn over the next batch while the current one is being consumed,
+    so at most 2 batches are held in memory.
+    """
+    from itertools import islice
+
+    if n_workers is None:
+        executor = get_io_executor()
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+
+    items = iter(items)
+    try:
+        pending = None
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            next_results = (batch, executor.map(fn, batch))
+            if pending is not None:
+                yield from zip(*pending)
+            pending = next_results
+        if pending is not None:
+            yield from zip(*pending)
+    finally:
+        if n_workers is not None:
+            executor.shutdown(wait=False)
+
+def _iter_read_json_files(file_paths, batch_size, n_workers=None):
+    for _, data in _iter_map_batches(safe_get, file_paths, batch_size, n_workers):
+        yield data
 
 def safe_corrupted_get(cache_path):
     try:
-        read_json(cache_path)
-        return 0
-    except (JSONDecodeError, FileNotFoundError):
-        _remove(cache_path)
-        # These are files which are corrupted, likely as user paused when files were being written.
-        return 1
+        if not is_cache_item_corrupted(cache_path):
+            return 0
+    except FileNotFoundError:
+        pass
+    _remove(cache_path)
+    return 1
     
 def _delete_corrupted_cached_items(file_paths):
-    from joblib import Parallel, delayed
-    results = Parallel(n_jobs=-1)(delayed(safe_corrupted_get)(file_path) for file_path in file_paths)
-    return results
+    return map_files(safe_corrupted_get, file_paths)
 
 def _remove(cache_path):
     if os.path.exists(cache_path):
@@ -101,10 +225,10 @@ def _remove(cache_path):
             pass
 # used by decorators 
 def _put(result, cache_path):
-    write_json(result, cache_path)
+    write_cache_item(result, cache_path)
 def _delete_items(file_paths):
-    from joblib import Parallel, delayed
-    Parallel(n_jobs=-1)(delayed(_remove)(file_path) for file_path in file_paths)
+    # Removing files reads nothing, so their size does not matter
+    map_io(_remove, file_paths)
 
 def get_files_without_json_extension(directory_path):
     # Get a list of all files in the directory
@@ -113,11 +237,53 @@ def get_files_without_json_extension(directory_path):
     
     files = os.listdir(directory_path)
     
-    # Use rstrip to remove the .json extension from all filenames in the list
-    files_without_json_extension = [file.rstrip('.json') for file in files]
+    # Remove the .json extension, skipping markers and other non cache files
+    files_without_json_extension = [file[:-5] for file in files if file.endswith('.json')]
     
     return files_without_json_extension
 
+def get_sharded_files_without_json_extension(directory_path):
+    if not os.path.exists(directory_path):
+        return []
+
+    results = []
+    for level1 in os.scandir(directory_path):
+        if not level1.is_dir():
+            continue
+        for level2 in os.scandir(level1.path):
+            if level2.is_dir():
+                results.extend(get_files_without_json_extension(level2.path))
+    return results
+
+def _iter_files_without_json_extension(directory_path):
+    with os.scandir(directory_path) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json'):
+                yield entry.name[:-5]
+
+def _iter_cached_files(fn_name):
+    # Lazily lists the cached hashes, so huge caches are never loaded into a list
+    if Cache.indexed:
+        yield from _get_index(fn_name).keys()
+        return
+
+    cache_dir = relative_path(_get_fn_cache_dir(fn_name))
+    if not os.path.exists(cache_dir):
+        return
+
+    if not _is_sharded(fn_name):
+        yield from _iter_files_without_json_extension(cache_dir)
+        return
+
+    with os.scandir(cache_dir) as level1_entries:
+        for level1 in level1_entries:
+            if not level1.is_dir():
+                continue
+            with os.scandir(level1.path) as level2_entries:
+                for level2 in level2_entries:
+                    if level2.is_dir():
+                        yield from _iter_files_without_json_extension(level2.path)
+
 def is_affirmative(input_string):
     # List of affirmative representations
     affirmative_values = {"true", "yes", "y", "1", "yeah", "yep", "sure", "ok", "okay", "affirmative", "t"}
@@ -153,109 +319,288 @@ def _create_cache_directory_if_not_exists(func=None):
             
             if fn_name not in created_fns:
                 created_fns.add(fn_name)
-                fn_cache_dir = f'{Cache.cache_directory}{fn_name}/'
+                fn_cache_dir = _get_fn_cache_dir(fn_name)
+                cache_dir = relative_path(fn_cache_dir)
+                is_new = not os.path.exists(cache_dir)
                 create_directory_if_not_exists(fn_cache_dir)
+                if is_new and Cache.sharded:
+                    _mark_as_sharded(fn_name)
 
-def get_cached_files(func):
-        fn_name = getfnname(func)
-        fn_cache_dir = f'{Cache.cache_directory}{fn_name}/'
-        cache_dir = relative_path(fn_cache_dir)
+def _mark_as_sharded(fn_name):
+    marker = relative_path(_get_fn_cache_dir(fn_name) + SHARDED_MARKER)
+    with open(marker, 'w', encoding="utf-8"):
+        pass
+    sharded_fns[fn_name] = True
+
+def _list_cached_files(fn_name):
+        cache_dir = relative_path(_get_fn_cache_dir(fn_name))
+        if _is_sharded(fn_name):
+            return get_sharded_files_without_json_extension(cache_dir)
         results =  get_files_without_json_extension(cache_dir)
         return results
 
-def _delete_items_by_filter(func, items, should_delete_item):
-        # Filter items to be tested from cache
-        testitems = Cache.filter_items_in_cache(func, items)
-        
-        # Retrieve data for the test items from cache
-        # testitems_data = Cache.get_items(func, testitems)
-        
-        # List to collect detected honeypots
-        collected_honeypots = []
-        # print(len(testitems))
-        # Iterate over each test item and its corresponding data
-        for i in range(len(testitems)):
-            # Check if the item is a honeypot based on the provided function
-            key = testitems[i]
-            try:
-              data = Cache.get(func, key)
-            except CacheMissException:
-              continue
-            
-            if should_delete_item(key, data):
-                # If it's a honeypot, add it to the collected honeypots list
-                collected_honeypots.append(testitems[i])
-
-        if collected_honeypots:
-            if get_output_directory() == "output/":
-                path = "./output/items_to_be_deleted.json"
-            else: 
-                path = get_output_path("items_to_be_deleted.json")
-            format_write_json(collected_honeypots, path)
-            while True:
-                result = input(f"Should we delete {len(collected_honeypots)} items in {path}? (Y/n): ")
-
-                if is_affirmative(result):
-                    item_plural = pluralize('item', len(collected_honeypots))
-                    print(f"Deleting {len(collected_honeypots)} {item_plural}...")
-                    Cache.delete_items(func, collected_honeypots)
-                    break
-                elif is_negative(result):
-                    print("No items were deleted")
-                    break
-                    
-        else:
-            print("No items were deleted")
-        # Return the number of collected honeypots
-        return len(collected_honeypots)   
+INDEX_FILENAME = ".index"
+fn_indexes = {}
+def _get_index(fn_name):
+    index = fn_indexes.get(fn_name)
+    if index is None:
+        index = fn_indexes.setdefault(fn_name, KeyIndex(relative_path(_get_fn_cache_dir(fn_name) + INDEX_FILENAME)))
+    if not index.exists():
+        # First use of the index for this function, so build it from the files on disk
+        _create_cache_directory_if_not_exists(fn_name)
+        since = index.mark()
+        index.rebuild(_list_cached_files(fn_name), since)
+    return index
 
-def _delete_items_by_filter_no_items(func, should_delete_item):
-        # Filter items to be tested from cache
-        testitems = Cache.get_items_hashes(func)
-        
-        # Retrieve data for the test items from cache
-        # testitems_data = Cache.get_items(func, testitems)
-        
-        # List to collect detected honeypots
-        collected_honeypots = []
-        # print(len(testitems))
-        # Iterate over each test item and its corresponding data
-        for i in range(len(testitems)):
-            # Check if the item is a honeypot based on the provided function
-            key = testitems[i]
+def get_cached_files(func):
+        fn_name = getfnname(func)
+        if Cache.indexed:
+            return _get_index(fn_name).keys()
+        return _list_cached_files(fn_name)
+
+def _get_cached_hashes_lookup(func):
+        # Supports the "in" operator, without copying the index
+        if Cache.indexed:
+            index = _get_index(getfnname(func))
+            index.refresh()
+            return index
+        return set(get_cached_files(func))
+
+def _count_cached_files(func):
+        if Cache.indexed:
+            return _get_index(getfnname(func)).count()
+        return len(get_cached_files(func))
+
+def _remove_stale_temp_files(fn_name, min_age_seconds=600):
+    # Left behind by processes killed in the middle of a write. Recent ones may still be in use by a running scraper.
+    from time import time
+    cache_dir = relative_path(_get_fn_cache_dir(fn_name))
+    removed = 0
+    for dirpath, _, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            if filename.endswith(TEMP_FILE_SUFFIX):
+                path = os.path.join(dirpath, filename)
+                try:
+                    if time() - os.path.getmtime(path) > min_age_seconds:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
+
+def _migrate_to_sharded_layout(fn_name):
+    cache_dir = relative_path(_get_fn_cache_dir(fn_name))
+    if not os.path.exists(cache_dir) or _is_sharded(fn_name):
+        return 0
+
+    hashes = get_files_without_json_extension(cache_dir)
+    created_dirs = set()
+    for data_hash in hashes:
+        shard_dir = os.path.join(cache_dir, data_hash[:2], data_hash[2:4])
+        if shard_dir not in created_dirs:
+            os.makedirs(shard_dir, exist_ok=True)
+            created_dirs.add(shard_dir)
+        os.replace(os.path.join(cache_dir, data_hash + ".json"), os.path.join(shard_dir, data_hash + ".json"))
+
+    # Written last, so an interrupted migration is simply resumed by running it again.
+    _mark_as_sharded(fn_name)
+    return len(hashes)
+
+EVICTION_POLICIES = ("lru", "fifo")
+GC_DELETE_BATCH_SIZE = 10000
+
+def _list_function_names():
+    cache_dir = relative_path(Cache.cache_directory)
+    if not os.path.exists(cache_dir):
+        return []
+    # Skips segment directories placed inside the cache directory, which are not caches of a function
+    return [
+        entry.name for entry in os.scandir(cache_dir)
+        if entry.is_dir() and not os.path.exists(os.path.join(entry.path, SEGMENT_MARKER))
+    ]
+
+def _iter_cached_file_stats(fn_name, policy):
+    # Yields (eviction order, size, modified time, hash, path), where a lower eviction order is evicted first
+    def scan(directory, depth):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if depth and entry.is_dir():
+                    yield from scan(entry.path, depth - 1)
+                elif entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    order = stat.st_atime if policy == "lru" else stat.st_mtime
+                    yield order, stat.st_size, stat.st_mtime, entry.name[:-5], entry.path
+
+    cache_dir = relative_path(_get_fn_cache_dir(fn_name))
+    if os.path.exists(cache_dir):
+        yield from scan(cache_dir, 2 if _is_sharded(fn_name) else 0)
+
+def _get_limits(fn_name):
+    # Function limits override the global ones, except for the global size and entries caps, which apply to the whole cache
+    global_limits = Cache.limits.get(None, {})
+    limits = {
+        "expires_in": global_limits.get("expires_in"),
+        "policy": global_limits.get("policy", "lru"),
+        "max_size_bytes": None,
+        "max_entries": None,
+    }
+    limits.update({key: value for key, value in Cache.limits.get(fn_name, {}).items() if value is not None})
+    return limits
+
+def _delete_gc_files(fn_name, files):
+    _delete_items([path for _, _, _, _, path in files])
+    if Cache.indexed:
+        _get_index(fn_name).discard_many([data_hash for _, _, _, data_hash, _ in files])
+    return len(files), sum(size for _, size, _, _, _ in files)
+
+def _evict_over_limits(files, max_size_bytes, max_entries):
+    # files must be sorted by eviction order. Returns (evicted, kept).
+    total_size = sum(file[1] for file in files)
+    evict_count = 0
+    while evict_count < len(files) and (
+        (max_entries is not None and len(files) - evict_count > max_entries) or
+        (max_size_bytes is not None and total_size > max_size_bytes)
+    ):
+        total_size -= files[evict_count][1]
+        evict_count += 1
+    return files[:evict_count], files[evict_count:]
+
+def _gc_function(fn_name, keep_survivors):
+    """Removes the expired items of a function, then evicts items over its limits. Returns (deleted, freed bytes, survivors)."""
+    from time import time
+    limits = _get_limits(fn_name)
+    expires_in = limits["expires_in"]
+    expired_before = time() - expires_in.total_seconds() if expires_in is not None else None
+    is_capped = limits["max_size_bytes"] is not None or limits["max_entries"] is not None
+    keep_survivors = keep_survivors or is_capped
+
+    deleted, freed = 0, 0
+    expired, survivors = [], []
+    for file in _iter_cached_file_stats(fn_name, limits["policy"]):
+        if expired_before is not None and file[2] < expired_before:
+            expired.append(file)
+            if len(expired) >= GC_DELETE_BATCH_SIZE:
+                count, size = _delete_gc_files(fn_name, expired)
+                deleted, freed, expired = deleted + count, freed + size, []
+        elif keep_survivors:
+            survivors.append(file)
+    count, size = _delete_gc_files(fn_name, expired)
+    deleted, freed = deleted + count, freed + size
+
+    if is_capped:
+        survivors.sort()
+        evicted, survivors = _evict_over_limits(survivors, limits["max_size_bytes"], limits["max_entries"])
+        count, size = _delete_gc_files(fn_name, evicted)
+        deleted, freed = deleted + count, freed + size
+
+    return deleted, freed, survivors
+
+gc_sweeper = None
+
+FILTER_PROGRESS_INTERVAL = 5  # seconds between progress reports of Cache.delete_items_by_filter
+
+def _get_items_to_be_deleted_path():
+    if get_output_directory() == "output/":
+        return "./output/items_to_be_deleted.json"
+    return get_output_path("items_to_be_deleted.json")
+
+def _confirm_deletion(keys):
+    path = _get_items_to_be_deleted_path()
+    format_write_json(keys, path)
+    while True:
+        result = input(f"Should we delete {len(keys)} items in {path}? (Y/n): ")
+        if is_affirmative(result):
+            return True
+        elif is_negative(result):
+            return False
+
+def _delete_items_by_filter(func, should_delete_item, items=None, confirm=True, dry_run=False, cache_storage=None, batch_size=1000, n_workers=None):
+    from time import time
+    fn_name = getfnname(func)
+
+    # Every candidate is read and tested in the I/O pool, so only whether it matched is kept in memory
+    if cache_storage is not None:
+        def evaluate(item):
+            cached = cache_storage.get(fn_name, item)
+            return cached is not None and bool(should_delete_item(item, cached["data"]))
+
+        def delete(keys):
+            map_io(lambda item: cache_storage.delete(fn_name, item), keys)
+    else:
+        def evaluate(key):
+            data_hash = _hash(key) if items is not None else key
             try:
-              data = Cache.get_item_by_hash(func, key)
-            except CacheMissException:
-              continue
-            
-            if should_delete_item(key, data):
-                # If it's a honeypot, add it to the collected honeypots list
-                collected_honeypots.append(testitems[i])
-
-        if collected_honeypots:
-            if get_output_directory() == "output/":
-                path = "./output/items_to_be_deleted.json"
-            else: 
-                path = get_output_path("items_to_be_deleted.json")
-            format_write_json(collected_honeypots, path)
-            while True:
-                result = input(f"Should we delete {len(collected_honeypots)} items in {path}? (Y/n): ")
-
-                if is_affirmative(result):
-                    item_plural = pluralize('item', len(collected_honeypots))
-                    print(f"Deleting {len(collected_honeypots)} {item_plural}...")
-                    Cache.delete_items_by_hashes(func, collected_honeypots)
-                    break
-                elif is_negative(result):
-                    print("No items were deleted")
-                    break
-                    
-        else:
-            print("No items were deleted")
-        # Return the number of collected honeypots
-        return len(collected_honeypots)     
+                data = read_cache_item(_get_cache_path_from_hash(fn_name, data_hash))
+            except (ValueError, FileNotFoundError):
+                return False
+            return bool(should_delete_item(key, data))
+
+        def delete(keys):
+            hashes = [_hash(key) for key in keys] if items is not None else keys
+            Cache.delete_items_by_hashes(fn_name, hashes)
+
+    if items is not None:
+        candidates = items
+        total = len(items) if hasattr(items, "__len__") else None
+    else:
+        _create_cache_directory_if_not_exists(fn_name)
+        candidates = _iter_cached_files(fn_name)
+        total = _count_cached_files(fn_name) if Cache.indexed else None
+
+    # Without confirmation, matches are deleted batch by batch as they are found
+    deletes_while_checking = not confirm and not dry_run
+    matched_keys = []
+    checked, matched = 0, 0
+    last_report = time()
+    for key, is_match in _iter_map_batches(evaluate, candidates, batch_size, n_workers):
+        checked += 1
+        if is_match:
+            matched += 1
+            if not dry_run:
+                matched_keys.append(key)
+            if deletes_while_checking and len(matched_keys) >= batch_size:
+                delete(matched_keys)
+                matched_keys = []
+
+        if time() - last_report >= FILTER_PROGRESS_INTERVAL:
+            last_report = time()
+            of_total = f"/{total}" if total is not None else ""
+            print(f"Checked {checked}{of_total} items, {matched} matched")
+
+    item_plural = pluralize('item', matched)
+    if dry_run:
+        print(f"{matched} {item_plural} would be deleted")
+        return matched
+
+    if not matched:
+        print("No items were deleted")
+        return 0
+
+    if deletes_while_checking:
+        delete(matched_keys)
+        print(f"Deleted {matched} {item_plural}")
+        return matched
+
+    if not _confirm_deletion(matched_keys):
+        print("No items were deleted")
+        return matched
+
+    print(f"Deleting {matched} {item_plural}...")
+    delete(matched_keys)
+    return matched
+
 class Cache:
     cache_directory = 'cache/'  # Default cache folder
+    sharded = False  # Whether new function caches use the cache/<fn>/ab/cd/<hash>.json layout
+    indexed = False  # Whether cached hashes are tracked in a per function .index file
+    fsync = False  # Whether cache writes are flushed to disk before being renamed into place
+    compression = None  # Default compression of cached items: None, "gzip", "zstd" or a codec instance
+    limits = {}  # Limits enforced by Cache.gc, by function name, None holding the global ones
+    key_hashing = "legacy"  # How key data is hashed: "legacy" or "canonical"
+    migrate_keys_on_read = False  # Whether items cached under legacy hashes are moved to canonical hashes when read
 
     REFRESH = "REFRESH"
     
@@ -263,13 +608,133 @@ class Cache:
     def set_cache_directory(folder):
         """Set the cache folder for all cache operations."""
         Cache.cache_directory = str(folder).rstrip('/') + '/'
+        sharded_fns.clear()
+        fn_indexes.clear()
+
+    @staticmethod
+    def set_sharded_layout(enabled=True):
+        """
+        Store new function caches as cache/<fn>/ab/cd/<hash>.json instead of one flat folder.
+        Existing flat caches keep working and can be converted with Cache.migrate_to_sharded_layout.
+        """
+        Cache.sharded = enabled
+
+    @staticmethod
+    def set_compression(compression):
+        """
+        Set the default compression of cached items to None, "gzip", "zstd" or a codec like ZstdCodec(level=10).
+        Items are always read according to how they were written, so existing uncompressed items keep working.
+        """
+        get_codec(compression)  # validates the value
+        Cache.compression = compression
+
+    @staticmethod
+    def train_compression_dictionary(func, sample_size=1000, dict_size=112640):
+        """
+        Train a zstd dictionary from a random sample of the items cached for func. 
+        Use it with Cache.set_compression(ZstdCodec(dictionary=dictionary)) and save it, 
+        as it must be loaded again to read the compressed items.
+        """
+        from .cache_codecs import train_zstd_dictionary
+        hashes = get_cached_files(func)
+        count = min(sample_size, len(hashes)) if sample_size is not None else len(hashes)
+        samples = Cache.get_random_items(func, count)
+        return train_zstd_dictionary([sample for sample in samples if sample is not None], dict_size)
 
     @staticmethod
-    def put(func, key_data, data):
-        """Write data to a cache file in JSON format."""
+    def set_key_hashing(key_hashing, migrate_on_read=False):
+        """
+        Set how cache keys are hashed, for every cache storage:
+            "legacy": md5 of json.dumps(key_data), so {"a": 1, "b": 2} and {"b": 2, "a": 1} are different keys.
+            "canonical": blake2b of the key data with sorted dict keys, compact separators and 1.0 written as 1.
+
+        Switching to "canonical" makes existing items unreachable. Move them with Cache.migrate_keys, or pass 
+        migrate_on_read=True to move each item when it is first read.
+        """
+        validate_key_hashing(key_hashing)
+        Cache.key_hashing = key_hashing
+        Cache.migrate_keys_on_read = migrate_on_read
+
+    @staticmethod
+    def migrate_keys(func, items):
+        """Move the items cached under the legacy hashes of items to their canonical hashes. Returns the number of moved items."""
+        fn_name = getfnname(func)
+        _create_cache_directory_if_not_exists(fn_name)
+        moved = map_io(lambda item: _migrate_legacy_key(fn_name, item), items)
+        return sum(moved)
+
+    @staticmethod
+    def set_stats_enabled(enabled=True, log_interval=None):
+        """
+        Record hits, misses, expirations, bytes and latencies of the cache storage used by the decorators,
+        by function and backend. If log_interval is given, the stats are printed every log_interval seconds.
+        """
+        from .cache_stats import set_stats_enabled
+        set_stats_enabled(enabled, log_interval)
+
+    @staticmethod
+    def stats(func=None):
+        """Returns the stats recorded since Cache.set_stats_enabled, as {func_name: {backend: stats}}."""
+        from .cache_stats import get_stats
+        return get_stats(getfnname(func) if func is not None else None)
+
+    @staticmethod
+    def reset_stats():
+        from .cache_stats import reset_stats
+        reset_stats()
+
+    @staticmethod
+    def set_fsync(enabled=True):
+        """
+        Flush every cache file to disk before renaming it into place. Writes are always atomic, 
+        fsync additionally protects cached items against power loss at the cost of slower writes.
+        """
+        Cache.fsync = enabled
+
+    @staticmethod
+    def set_index_enabled(enabled=True):
+        """
+        Track the cached hashes of every function in an append-only cache/<fn>/.index file.
+        Counting and filtering items then reads the index instead of listing the cache folder.
+        All processes writing to the cache folder should enable the index, else rebuild it with Cache.rebuild_index.
+        """
+        Cache.indexed = enabled
+
+    @staticmethod
+    def rebuild_index(func):
+        """Rebuild the index of a function from the files on disk."""
+        fn_name = getfnname(func)
+        _create_cache_directory_if_not_exists(fn_name)
+        index = fn_indexes.setdefault(fn_name, KeyIndex(relative_path(_get_fn_cache_dir(fn_name) + INDEX_FILENAME)))
+        since = index.mark()
+        hashes = _list_cached_files(fn_name)
+        index.rebuild(hashes, since)
+        return len(hashes)
+
+    @staticmethod
+    def migrate_to_sharded_layout(func=None):
+        """Move the items of a flat cache into the sharded layout. If func is None, all function caches are migrated."""
+        fn_names = [getfnname(func)] if func is not None else _list_function_names()
+
+        migrated = 0
+        for fn_name in fn_names:
+            count = _migrate_to_sharded_layout(fn_name)
+            if count:
+                item_plural = pluralize('item', count)
+                print(f"Moved {count} {item_plural} of {fn_name} to the sharded layout")
+            migrated += count
+        return migrated
+
+    @staticmethod
+    def put(func, key_data, data, compression=None):
+        """Write data to a cache file in JSON format, compressed with the given or default compression."""
         _create_cache_directory_if_not_exists(func)
-        path = _get_cache_path(func, key_data)
-        write_json(data, path)
+        fn_name = getfnname(func)
+        data_hash = _hash(key_data)
+        path = _get_cache_path_from_hash(fn_name, data_hash)
+        write_cache_item(data, path, compression)
+        if Cache.indexed:
+            _get_index(fn_name).add(data_hash)
 
     @staticmethod
     def hash(data):
@@ -279,7 +744,7 @@ class Cache:
     def has(func, key_data):
         _create_cache_directory_if_not_exists(func)
         path = _get_cache_path(func, key_data)
-        return _has(path)
+        return _has_or_migrate(getfnname(func), key_data, path)
 
     @staticmethod
     def get(func, key_data, raise_exception=True):
@@ -291,7 +756,7 @@ class Cache:
 
         _create_cache_directory_if_not_exists(func)
         path = _get_cache_path(func, key_data)
-        if _has(path):
+        if _has_or_migrate(getfnname(func), key_data, path):
             try:
               return _get(path)
             except CacheMissException:
@@ -326,15 +791,19 @@ class Cache:
         if max is not None:
             hashes = hashes[:max]
         fn_name = getfnname(func)
-        paths = [relative_path(f'{Cache.cache_directory}{fn_name}/{r}.json') for r in hashes]
+        paths = [_get_cache_path_from_hash(fn_name, r) for r in hashes]
         return _read_json_files(paths)
 
     @staticmethod
     def delete_corrupted_items(func):
         hashes = Cache.get_items_hashes(func, None)
         fn_name = getfnname(func)
-        paths = [relative_path(f'{Cache.cache_directory}{fn_name}/{r}.json') for r in hashes]
-        corrupted_items_removed = sum(_delete_corrupted_cached_items(paths))
+        paths = [_get_cache_path_from_hash(fn_name, r) for r in hashes]
+        removed = _delete_corrupted_cached_items(paths)
+        if Cache.indexed:
+            _get_index(fn_name).discard_many([h for h, was_removed in zip(hashes, removed) if was_removed])
+        corrupted_items_removed = sum(removed)
+        _remove_stale_temp_files(fn_name)
         if corrupted_items_removed:
             item_plural = pluralize('item', corrupted_items_removed)
             print(f"Deleted {corrupted_items_removed} corrupted {item_plural}")
@@ -345,8 +814,63 @@ class Cache:
 
     @staticmethod
     def generate_cache_path_from_hash(func, hash):
-        func = getfnname(func)
-        return relative_path(f'{Cache.cache_directory}{func}/{hash}.json')
+        return _get_cache_path_from_hash(getfnname(func), hash)
+
+    @staticmethod
+    def iter_items_with_keys(func, items=None, batch_size=1000, n_workers=None):
+        """
+        Lazily yield (key, data) pairs of cached items, using constant memory regardless of the cache size.
+        If items is None, all cached items are yielded with their hashes as keys, 
+        else each item is yielded with its cached data, which is None if the item is not cached.
+
+        Args:
+            batch_size: Number of items read ahead while the previous batch is consumed.
+            n_workers: Number of threads reading the files, defaults to the shared I/O thread pool.
+        """
+        from itertools import tee
+
+        fn_name = getfnname(func)
+        if items is None:
+            keys = _iter_cached_files(fn_name)
+            keys, hashes = tee(keys)
+        else:
+            keys, hashes = tee(items)
+            hashes = (Cache.hash(item) for item in hashes)
+
+        paths = (_get_cache_path_from_hash(fn_name, r) for r in hashes)
+        yield from zip(keys, _iter_read_json_files(paths, batch_size, n_workers))
+
+    @staticmethod
+    def iter_items(func, items=None, batch_size=1000, n_workers=None):
+        """Lazily yield cached items, like Cache.get_items, using constant memory regardless of the cache size."""
+        for _, data in Cache.iter_items_with_keys(func, items, batch_size, n_workers):
+            yield data
+
+    @staticmethod
+    def export(func, path, items=None, batch_size=1000):
+        """
+        Write the cached items of func to a single ndjson archive, compressed if path ends with .gz or .zst.
+        If items is given, they are stored with their data, which allows importing them into any cache storage.
+        Returns the number of exported items.
+        """
+        from .cache_archive import export_cache
+        return export_cache(func, path, items, batch_size)
+
+    @staticmethod
+    def import_(path, cache_storage=None, batch_size=1000):
+        """Write the items of an archive created by Cache.export to the file cache, or to cache_storage like SqliteCacheStorage()."""
+        from .cache_archive import import_cache
+        return import_cache(path, cache_storage, batch_size)
+
+    @staticmethod
+    def migrate_storage(func, source=None, destination=None, items=None, key_field=None, resume=True, batch_size=1000, n_workers=None):
+        """
+        Copy the cached items of func between cache storages, like from the file cache to SqliteCacheStorage().
+        Items are re-keyed from items, or from the key_field of each cached dict when copying from the file cache.
+        Returns the number of copied items.
+        """
+        from .cache_migration import migrate_cache
+        return migrate_cache(func, source, destination, items, key_field, resume, batch_size, n_workers)
 
     @staticmethod
     def get_random_items(func, n=5):
@@ -359,7 +883,7 @@ class Cache:
             random.shuffle(hashes)
 
         fn_name = getfnname(func)
-        paths = [relative_path(f'{Cache.cache_directory}{fn_name}/{r}.json') for r in hashes]
+        paths = [_get_cache_path_from_hash(fn_name, r) for r in hashes]
         return _read_json_files(paths)
     @staticmethod
     def get_items_hashes(func, items=None):
@@ -438,24 +962,32 @@ class Cache:
     def delete(func, key_data):
         """Remove a specific cache file."""
         _create_cache_directory_if_not_exists(func)
-        path = _get_cache_path(func, key_data)
+        fn_name = getfnname(func)
+        data_hash = _hash(key_data)
+        path = _get_cache_path_from_hash(fn_name, data_hash)
         _remove(path)
+        if Cache.indexed:
+            _get_index(fn_name).discard(data_hash)
 
     @staticmethod
     def delete_items(func, items):
         """Remove a specific cache file."""
         hashes = Cache.get_items_hashes(func, items)
         fn_name = getfnname(func)
-        paths = [relative_path(f'{Cache.cache_directory}{fn_name}/{r}.json') for r in hashes]
+        paths = [_get_cache_path_from_hash(fn_name, r) for r in hashes]
         _delete_items(paths)
+        if Cache.indexed:
+            _get_index(fn_name).discard_many(hashes)
         return len(hashes)
            
     @staticmethod
     def delete_items_by_hashes(func, hashes):
         """Remove a specific cache file."""
         fn_name = getfnname(func)
-        paths = [relative_path(f'{Cache.cache_directory}{fn_name}/{r}.json') for r in hashes]
+        paths = [_get_cache_path_from_hash(fn_name, r) for r in hashes]
         _delete_items(paths)
+        if Cache.indexed:
+            _get_index(fn_name).discard_many(hashes)
         return len(hashes)
            
     @staticmethod
@@ -467,18 +999,108 @@ class Cache:
 
         if func is not None:
             fn_name = getfnname(func)
-            fn_cache_dir = f'{Cache.cache_directory}{fn_name}/'
+            fn_cache_dir = _get_fn_cache_dir(fn_name)
             cache_dir = relative_path(fn_cache_dir)
             if os.path.exists(cache_dir):
                 rmtree(cache_dir, ignore_errors=True)
             if fn_name in created_fns:
                 created_fns.remove(fn_name)
+            sharded_fns.pop(fn_name, None)
+            fn_indexes.pop(fn_name, None)
         else:
             cache_dir = relative_path(Cache.cache_directory)
             if os.path.exists(cache_dir):
                 rmtree(cache_dir, ignore_errors=True)
             cache_check_done = False
             created_fns = set()
+            sharded_fns.clear()
+            fn_indexes.clear()
+
+    @staticmethod
+    def set_limits(func=None, max_size_bytes=None, max_entries=None, expires_in=None, policy=None):
+        """
+        Set the limits enforced by Cache.gc. If func is None, the limits apply to the whole cache,
+        and its expires_in and policy are the defaults of every function.
+
+        Args:
+            max_size_bytes: Maximum total size of the cached files.
+            max_entries: Maximum number of cached items.
+            expires_in: timedelta after which items are removed.
+            policy: "lru" to evict the least recently read items first, or "fifo" to evict the oldest items first.
+                    "lru" relies on file access times, so it behaves like "fifo" on disks mounted with noatime.
+        """
+        if policy is not None and policy not in EVICTION_POLICIES:
+            raise ValueError(f'Unknown eviction policy "{policy}". Use one of: {", ".join(EVICTION_POLICIES)}')
+        fn_name = getfnname(func) if func is not None else None
+        Cache.limits[fn_name] = {
+            "max_size_bytes": max_size_bytes,
+            "max_entries": max_entries,
+            "expires_in": expires_in,
+            "policy": policy,
+        }
+
+    @staticmethod
+    def gc(func=None):
+        """
+        Remove expired items and evict items over the limits set with Cache.set_limits.
+        If func is None, every function cache is collected. Returns the number of deleted items and freed bytes.
+        """
+        global_limits = Cache.limits.get(None, {})
+        is_globally_capped = func is None and (
+            global_limits.get("max_size_bytes") is not None or global_limits.get("max_entries") is not None
+        )
+        fn_names = [getfnname(func)] if func is not None else _list_function_names()
+
+        deleted, freed = 0, 0
+        survivors = []
+        for fn_name in fn_names:
+            count, size, fn_survivors = _gc_function(fn_name, is_globally_capped)
+            deleted, freed = deleted + count, freed + size
+            survivors.extend((file, fn_name) for file in fn_survivors)
+
+        if is_globally_capped:
+            survivors.sort(key=lambda survivor: survivor[0])
+            files = [file for file, _ in survivors]
+            evicted, _ = _evict_over_limits(files, global_limits.get("max_size_bytes"), global_limits.get("max_entries"))
+            evicted_by_fn = {}
+            for file, fn_name in survivors[:len(evicted)]:
+                evicted_by_fn.setdefault(fn_name, []).append(file)
+            for fn_name, files in evicted_by_fn.items():
+                count, size = _delete_gc_files(fn_name, files)
+                deleted, freed = deleted + count, freed + size
+
+        if deleted:
+            item_plural = pluralize('item', deleted)
+            print(f"Garbage collected {deleted} cached {item_plural}, freeing {freed / (1024 * 1024):.1f} MB")
+        return {"deleted": deleted, "freed_bytes": freed}
+
+    @staticmethod
+    def start_gc_sweeper(interval=3600, func=None):
+        """Run Cache.gc every interval seconds in a background thread, until Cache.stop_gc_sweeper is called."""
+        global gc_sweeper
+        from threading import Event, Thread
+        Cache.stop_gc_sweeper()
+        stop = Event()
+
+        def sweep():
+            while not stop.wait(interval):
+                try:
+                    Cache.gc(func)
+                except Exception as e:
+                    print(f"Cache garbage collection failed: {e}")
+
+        thread = Thread(target=sweep, daemon=True, name="botasaurus-cache-gc")
+        thread.start()
+        gc_sweeper = (thread, stop)
+
+    @staticmethod
+    def stop_gc_sweeper():
+        global gc_sweeper
+        if gc_sweeper is not None:
+            thread, stop = gc_sweeper
+            stop.set()
+            thread.join()
+            gc_sweeper = None
 
     # @staticmethod
     # def delete_items_by_filter(func, items, should_delete_item):
@@ -508,30 +1130,44 @@ class Cache:
 
 
     @staticmethod
-    def delete_items_by_filter(func, should_delete_item, items=None):
-        if items == None:
-            return _delete_items_by_filter_no_items(func, should_delete_item)
-        else:
-            return _delete_items_by_filter(func, items, should_delete_item)
-     
+    def delete_items_by_filter(func, should_delete_item, items=None, confirm=True, dry_run=False, cache_storage=None, batch_size=1000, n_workers=None):
+        """
+        Delete the cached items for which should_delete_item(key, data) is True. Items are read and tested 
+        in parallel, a batch at a time, and progress is printed for long runs.
+
+        Args:
+            items: Inputs to test. If None, every cached item is tested, with its hash as the key.
+            confirm: Ask before deleting, listing the matched items in output/items_to_be_deleted.json. 
+                     If False, matched items are deleted as they are found, which suits cron jobs.
+            dry_run: Only count the matched items.
+            cache_storage: Storage to filter, like SqliteCacheStorage(), instead of the file cache. Requires items.
+        """
+        if cache_storage is not None:
+            from .cache_storage import FileCacheStorage, default_file_cache_storage
+            if cache_storage is FileCacheStorage or cache_storage is default_file_cache_storage:
+                cache_storage = None
+            elif items is None:
+                raise ValueError("items must be passed to filter a cache_storage, as its keys can not be listed")
+        return _delete_items_by_filter(func, should_delete_item, items, confirm, dry_run, cache_storage, batch_size, n_workers)
+
     @staticmethod
     def filter_items_in_cache(func, items):
-        cached_items  = set(Cache.get_items_hashes(func))
+        cached_items  = _get_cached_hashes_lookup(func)
         return [item for item in items if Cache.hash(item) in cached_items]
       
     @staticmethod
     def filter_items_not_in_cache(func, items):
-        cached_items  = set(Cache.get_items_hashes(func))
+        cached_items  = _get_cached_hashes_lookup(func)
         return [item for item in items if Cache.hash(item) not in cached_items]
                             
     @staticmethod
     def print_cached_items_count(func):
-        cached_items_count  = len(get_cached_files(func))
+        cached_items_count  = _count_cached_files(func)
         nm = getfnname(func)
         print(f"Number of cached items for {nm}: {cached_items_count}")
         return cached_items_count
 
     @staticmethod
     def get_cached_items_count(func):
-        cached_items_count  = len(get_cached_files(func))
-        return cached_items_count
\ No newline at end of file
+        cached_items_count  = _count_cached_files(func)
+        return cached_items_count
\ No newline at end of file
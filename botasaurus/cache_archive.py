@@ -0,0 +1,119 @@
+import json
+from .cache import (
+    Cache, getfnname, _create_cache_directory_if_not_exists, _get_cache_path_from_hash, _get_index,
+    _iter_cached_files, _iter_map_batches, read_cache_item, write_cache_item,
+)
+from .io_executor import map_io
+
+ARCHIVE_FORMAT = "botasaurus-cache"
+ARCHIVE_VERSION = 1
+
+
+def open_archive(path, mode):
+    """Opens an ndjson archive in text mode, compressed according to its extension: .gz, .zst or none."""
+    path = str(path)
+    if path.endswith(".gz"):
+        import gzip
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        from .cache_codecs import _import_zstandard
+        return _import_zstandard().open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def export_cache(func, path, items=None, batch_size=1000, n_workers=None):
+    """
+    Writes the cached items of func to an ndjson archive, one {"func", "hash", "data", "key"} record per line.
+    If items is None, every cached item is exported with its hash only, as the inputs are not stored.
+    """
+    fn_name = getfnname(func)
+    _create_cache_directory_if_not_exists(fn_name)
+
+    def read(key):
+        data_hash = Cache.hash(key) if items is not None else key
+        try:
+            return data_hash, True, read_cache_item(_get_cache_path_from_hash(fn_name, data_hash))
+        except (ValueError, FileNotFoundError):
+            return data_hash, False, None
+
+    candidates = items if items is not None else _iter_cached_files(fn_name)
+    exported = 0
+    with open_archive(path, "w") as fp:
+        fp.write(json.dumps({"format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION, "key_hashing": Cache.key_hashing}) + "\n")
+        for key, (data_hash, is_cached, data) in _iter_map_batches(read, candidates, batch_size, n_workers):
+            if not is_cached:
+                continue
+            record = {"func": fn_name, "hash": data_hash, "data": data}
+            if items is not None:
+                record["key"] = key
+            fp.write(json.dumps(record) + "\n")
+            exported += 1
+    return exported
+
+
+def _iter_batches(fp, batch_size):
+    batch = []
+    for line in fp:
+        if line.strip():
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def import_cache(path, cache_storage=None, batch_size=1000):
+    """
+    Writes the items of an archive created by export_cache to the file cache, or to cache_storage.
+    Records exported without their inputs can only be imported into the file cache, and only with the key hashing
+    they were exported with, as their hash can't be recomputed. Returns the number of imported items.
+    """
+    from .cache_storage import FileCacheStorage, default_file_cache_storage, put_many
+    is_file_cache = cache_storage is None or cache_storage is FileCacheStorage or cache_storage is default_file_cache_storage
+
+    def put(record):
+        # Records with their input are hashed again, so they follow the key hashing of this cache
+        if "key" in record:
+            Cache.put(record["func"], record["key"], record["data"])
+            return True
+        if key_hashing != Cache.key_hashing:
+            raise ValueError(
+                f"{path} was exported with the {key_hashing} key hashing without the inputs, so it can't be imported "
+                f"with the {Cache.key_hashing} key hashing. Import it with Cache.set_key_hashing(\"{key_hashing}\"), "
+                f"or export it again with its inputs."
+            )
+        fn_name = record["func"]
+        _create_cache_directory_if_not_exists(fn_name)
+        write_cache_item(record["data"], _get_cache_path_from_hash(fn_name, record["hash"]))
+        if Cache.indexed:
+            _get_index(fn_name).add(record["hash"])
+        return True
+
+    def put_batch(batch):
+        """Returns the number of imported records of batch."""
+        if is_file_cache:
+            return sum(map_io(put, batch, strategy="threads"))
+        # Other storages get each function's records in one put_many call
+        entries_by_func = {}
+        for record in batch:
+            if "key" in record:
+                entries_by_func.setdefault(record["func"], []).append((record["key"], record["data"]))
+        for fn_name, entries in entries_by_func.items():
+            put_many(cache_storage, fn_name, entries)
+        return sum(len(entries) for entries in entries_by_func.values())
+
+    imported, skipped = 0, 0
+    with open_archive(path, "r") as fp:
+        header = json.loads(fp.readline())
+        if header.get("format") != ARCHIVE_FORMAT:
+            raise ValueError(f"{path} is not a botasaurus cache archive")
+        key_hashing = header.get("key_hashing", "legacy")
+        for batch in _iter_batches(fp, batch_size):
+            count = put_batch(batch)
+            imported += count
+            skipped += len(batch) - count
+
+    if skipped:
+        print(f"Skipped {skipped} items exported without their inputs, which can only be imported into the file cache")
+    return imported
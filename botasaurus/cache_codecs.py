@@ -0,0 +1,171 @@
+import json
+from threading import local
+
+# Uncompressed items are stored as plain JSON, readable by older versions and any JSON reader. Compressed items
+# are framed as b"#btc1 <payload length> <codec>\n<payload>". The length lets readers detect truncated items
+# and the codec lets them decode items written with any compression.
+CACHE_FILE_MAGIC = b"#btc1 "
+MAX_HEADER_LENGTH = 64
+
+
+class CorruptedCacheItemException(ValueError):
+    """Exception raised when a cache item was not completely written."""
+    def __init__(self, path):
+        self.path = path
+        super().__init__(f"Corrupted cache item: '{path}'")
+
+
+class CodecUnavailableError(Exception):
+    """
+    Exception raised when an item was compressed with a codec or zstd dictionary this process doesn't have.
+    Not a ValueError, as the item is intact and must not be deleted as corrupted.
+    """
+
+
+class JsonCodec:
+    """Stores the JSON as is."""
+    name = "json"
+
+    def compress(self, payload):
+        return payload
+
+    def decompress(self, payload):
+        return payload
+
+
+class GzipCodec:
+    name = "gzip"
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, payload):
+        import gzip
+        return gzip.compress(payload, compresslevel=self.level)
+
+    def decompress(self, payload):
+        import gzip
+        return gzip.decompress(payload)
+
+
+_zstd_dictionaries = {}
+
+def _import_zstandard():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise ImportError("zstd compression requires the zstandard package. Install it using: python -m pip install zstandard")
+
+
+def load_zstd_dictionary(dictionary):
+    """Registers a dictionary created by train_zstd_dictionary, so items compressed with it can be read."""
+    zstandard = _import_zstandard()
+    if isinstance(dictionary, zstandard.ZstdCompressionDict):
+        compression_dict = dictionary
+    else:
+        compression_dict = zstandard.ZstdCompressionDict(bytes(dictionary))
+    _zstd_dictionaries[compression_dict.dict_id()] = compression_dict
+    return compression_dict
+
+
+def train_zstd_dictionary(samples, dict_size=112640):
+    """
+    Trains a zstd dictionary from sample items. Dictionaries greatly improve the compression
+    of small, similar items like most scraper results.
+
+    Returns the dictionary as bytes, which can be saved and passed to ZstdCodec(dictionary=...).
+    """
+    zstandard = _import_zstandard()
+    encoded = [json.dumps(sample).encode('utf-8') for sample in samples]
+    return zstandard.train_dictionary(dict_size, encoded).as_bytes()
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self, level=3, dictionary=None):
+        self.level = level
+        self.dictionary = load_zstd_dictionary(dictionary) if dictionary is not None else None
+        # zstandard compressors are not thread safe, so each thread gets its own
+        self._local = local()
+
+    def compress(self, payload):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            zstandard = _import_zstandard()
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+            self._local.compressor = compressor
+        return compressor.compress(payload)
+
+    def decompress(self, payload):
+        zstandard = _import_zstandard()
+        dict_id = zstandard.get_frame_parameters(payload).dict_id
+        if dict_id:
+            dictionary = _zstd_dictionaries.get(dict_id)
+            if dictionary is None:
+                raise CodecUnavailableError(f"Item was compressed with zstd dictionary {dict_id}, load it first using load_zstd_dictionary")
+            return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(payload)
+        return zstandard.ZstdDecompressor().decompress(payload)
+
+
+JSON_CODEC = JsonCodec()
+_default_codecs = {
+    "json": JSON_CODEC,
+    "gzip": GzipCodec(),
+    "zstd": ZstdCodec(),
+}
+
+def register_codec(codec):
+    """
+    Makes items written with a custom codec readable, by the name they are stored with.
+    Codecs passed as compression are registered when first used, other processes must register them too.
+    """
+    _default_codecs.setdefault(codec.name, codec)
+    return codec
+
+
+def get_codec(compression=None):
+    """Accepts None, "gzip", "zstd" or a codec instance like ZstdCodec(level=10)."""
+    if compression is None or compression is False or compression == "none":
+        return JSON_CODEC
+    if isinstance(compression, str):
+        if compression not in _default_codecs:
+            raise ValueError(f'Unknown compression "{compression}". Use one of: none, gzip, zstd')
+        return _default_codecs[compression]
+    return register_codec(compression)
+
+
+def encode_cache_item(data, codec=JSON_CODEC):
+    payload = json.dumps(data).encode('utf-8')
+    if codec is JSON_CODEC:
+        return payload
+    payload = codec.compress(payload)
+    return b"%s%d %s\n%s" % (CACHE_FILE_MAGIC, len(payload), codec.name.encode('ascii'), payload)
+
+
+def parse_header(content, path=None):
+    header_end = content.find(b"\n")
+    if header_end == -1:
+        raise CorruptedCacheItemException(path)
+    try:
+        length, codec = content[len(CACHE_FILE_MAGIC):header_end].split(b" ")
+        return header_end + 1, int(length), codec.decode('ascii')
+    except ValueError:
+        raise CorruptedCacheItemException(path)
+
+
+def decode_cache_item(content, path=None):
+    if isinstance(content, str):
+        return json.loads(content)
+
+    if not content.startswith(CACHE_FILE_MAGIC):
+        return json.loads(content)
+
+    payload_start, length, codec_name = parse_header(content, path)
+    payload = content[payload_start:]
+    if len(payload) != length:
+        raise CorruptedCacheItemException(path)
+    if codec_name not in _default_codecs:
+        raise CodecUnavailableError(f'Item was compressed with the unknown codec "{codec_name}", register it first using register_codec')
+    return json.loads(_default_codecs[codec_name].decompress(payload))
@@ -0,0 +1,171 @@
+import os
+from threading import Lock
+from .file_lock import file_lock
+
+# Logs with fewer lines are never compacted
+MIN_LINES_TO_COMPACT = 1000
+# Lines this process appends before it reads the log, to check whether it needs compacting
+CHECK_INTERVAL_LINES = 10000
+
+
+def _apply_lines(keys, content):
+    """Apply the complete lines of content to keys. Returns the number of bytes and lines applied."""
+    end = content.rfind(b"\n") + 1
+    lines = content[:end].decode("ascii").splitlines()
+    for line in lines:
+        if line.startswith("+"):
+            keys.add(line[1:])
+        elif line.startswith("-"):
+            keys.discard(line[1:])
+    return end, len(lines)
+
+
+class KeyIndex:
+    """
+    Append-only log of the hashes stored in a function cache.
+
+    Every put appends "+<hash>" and every delete appends "-<hash>", so processes
+    sharing a cache directory only need to read the lines written since their last
+    refresh to know which items are cached, instead of listing the whole directory.
+
+    Appends hold a shared lock on <path>.lock and rewrites of the log hold an exclusive
+    one, so no line is lost when the log is replaced. The log is compacted once it holds
+    more dead lines (deleted or duplicate keys) than live keys.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self._keys = set()
+        self._offset = 0
+        self._inode = None
+        self._lines = 0
+        self._appended_lines = 0
+        self._lock = Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _append(self, lines):
+        with file_lock(self.lock_path, shared=True):
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, lines.encode("ascii"))
+            finally:
+                os.close(fd)
+
+        with self._lock:
+            self._appended_lines += lines.count("\n")
+            check = self._appended_lines >= CHECK_INTERVAL_LINES
+        if check:
+            self.refresh()
+
+    def add(self, key):
+        self._append(f"+{key}\n")
+        with self._lock:
+            self._keys.add(key)
+
+    def discard(self, key):
+        self._append(f"-{key}\n")
+        with self._lock:
+            self._keys.discard(key)
+
+    def discard_many(self, keys):
+        if not keys:
+            return
+        self._append("".join(f"-{key}\n" for key in keys))
+        with self._lock:
+            self._keys.difference_update(keys)
+
+    def refresh(self):
+        """Apply the lines appended by other processes since the last refresh, compacting the log if needed."""
+        with self._lock:
+            self._appended_lines = 0
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._keys = set()
+                self._offset = 0
+                self._inode = None
+                self._lines = 0
+                return
+
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                # The index was rebuilt, so read it from the start
+                self._keys = set()
+                self._offset = 0
+                self._inode = stat.st_ino
+                self._lines = 0
+
+            if stat.st_size > self._offset:
+                with open(self.path, "rb") as fp:
+                    fp.seek(self._offset)
+                    content = fp.read()
+
+                # A trailing line which is still being written is read on the next refresh
+                applied_bytes, applied_lines = _apply_lines(self._keys, content)
+                self._offset += applied_bytes
+                self._lines += applied_lines
+
+            live = len(self._keys)
+            needs_compaction = self._lines >= MIN_LINES_TO_COMPACT and self._lines - live > live
+
+        if needs_compaction:
+            self.compact()
+
+    def has(self, key):
+        with self._lock:
+            return key in self._keys
+
+    __contains__ = has
+
+    def keys(self):
+        self.refresh()
+        with self._lock:
+            return list(self._keys)
+
+    def count(self):
+        self.refresh()
+        with self._lock:
+            return len(self._keys)
+
+    def mark(self):
+        """Return the current end of the log, to pass to rebuild along with keys listed after this call."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def compact(self):
+        """Rewrite the log with one line per live key."""
+        self._rewrite(set(), (None, 0))
+
+    def rebuild(self, keys, since=None):
+        """
+        Replace the log with the given keys, dropping the history of deletes.
+        If since is a mark taken before the keys were listed, the lines appended after it are applied on top of them.
+        """
+        self._rewrite(set(keys), since)
+
+    def _rewrite(self, keys, since):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        # Appends wait while the log is read and replaced, so none of them is written to the old file
+        with file_lock(self.lock_path):
+            if since is not None and os.path.exists(self.path):
+                inode, offset = since
+                with open(self.path, "rb") as fp:
+                    if inode == os.fstat(fp.fileno()).st_ino:
+                        fp.seek(offset)
+                    _apply_lines(keys, fp.read())
+
+            with open(tmp_path, "w", encoding="ascii") as fp:
+                fp.write("".join(f"+{key}\n" for key in keys))
+            os.replace(tmp_path, self.path)
+            stat = os.stat(self.path)
+
+        with self._lock:
+            self._keys = keys
+            self._offset = stat.st_size
+            self._inode = stat.st_ino
+            self._lines = len(keys)
@@ -0,0 +1,35 @@
+import json
+from hashlib import blake2b
+
+# "legacy" hashes json.dumps(key_data) as is, "canonical" hashes a normalized form of it
+KEY_HASHING_MODES = ("legacy", "canonical")
+
+
+def validate_key_hashing(key_hashing):
+    if key_hashing not in KEY_HASHING_MODES:
+        raise ValueError(f'Unknown key hashing "{key_hashing}". Use one of: {", ".join(KEY_HASHING_MODES)}')
+
+
+def _normalize(data):
+    if isinstance(data, float):
+        # 1.0 and 1 are the same input, and -0.0 is 0
+        return int(data) if data.is_integer() else data
+    if isinstance(data, dict):
+        # Keys are converted the way JSON converts them, so mixed key types can be sorted
+        return {
+            key if isinstance(key, str) else json.dumps(_normalize(key)): _normalize(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, (list, tuple)):
+        return [_normalize(value) for value in data]
+    return data
+
+
+def canonical_dumps(data):
+    """Serializes data so that equal inputs give the same string, whatever the order of their dict keys."""
+    return json.dumps(_normalize(data), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def canonical_hash(data, digest_size=16):
+    """Returns the blake2b hex digest of canonical_dumps(data). 16 bytes give 32 characters, like md5."""
+    return blake2b(canonical_dumps(data).encode("utf-8"), digest_size=digest_size).hexdigest()
@@ -0,0 +1,101 @@
+from collections import deque
+from itertools import islice
+from time import time
+from .cache import (
+    Cache, getfnname, _create_cache_directory_if_not_exists, _get_cache_path_from_hash, _iter_cached_files,
+    _count_cached_files, read_cache_item,
+)
+from .cache_storage import FileCacheStorage, default_file_cache_storage, get_many, has_many, put_many
+from .io_executor import get_io_workers
+
+MIGRATE_PROGRESS_INTERVAL = 5  # seconds between progress reports of migrate_cache
+
+
+def _resolve(storage):
+    if storage is None or storage is FileCacheStorage:
+        return default_file_cache_storage
+    return storage
+
+
+def _read_by_hashes(fn_name, hashes, key_field):
+    """Returns the (key_data, data) of the cached files of hashes whose data holds its input in key_field."""
+    entries = []
+    for data_hash in hashes:
+        try:
+            data = read_cache_item(_get_cache_path_from_hash(fn_name, data_hash))
+        except (ValueError, FileNotFoundError):
+            continue
+        key_data = data.get(key_field) if isinstance(data, dict) else None
+        # Data whose field does not hash to its file name was not cached under that input, so its key is unknown
+        if key_data is not None and Cache.hash(key_data) == data_hash:
+            entries.append((key_data, data))
+    return entries
+
+
+def migrate_cache(func, source=None, destination=None, items=None, key_field=None, resume=True,
+                  batch_size=1000, n_workers=None, progress=True):
+    """
+    Copies the cached items of func from the source storage to the destination storage, both defaulting to the file cache.
+
+    Storages key items by different hashes of the input, so items are re-keyed from their inputs: either items,
+    or when copying from the file cache, the key_field of each cached dict, like "link". Batches are read by
+    n_workers threads and written with put_many. With resume, items the destination already has are skipped,
+    so an interrupted migration continues where it stopped. Items are stored as new, restarting their expiry.
+    Returns the number of copied items.
+    """
+    fn_name = getfnname(func)
+    source, destination = _resolve(source), _resolve(destination)
+    if source is destination:
+        raise ValueError("source and destination must be different cache storages")
+
+    if items is not None:
+        candidates = items
+        total = len(items) if hasattr(items, "__len__") else None
+
+        def read_batch(batch):
+            if resume:
+                batch = [key_data for key_data, is_cached in zip(batch, has_many(destination, fn_name, batch)) if not is_cached]
+            return [(key_data, cached["data"]) for key_data, cached in zip(batch, get_many(source, fn_name, batch)) if cached is not None]
+    elif isinstance(source, FileCacheStorage) and key_field is not None:
+        _create_cache_directory_if_not_exists(fn_name)
+        candidates = _iter_cached_files(fn_name)
+        total = _count_cached_files(fn_name) if Cache.indexed else None
+
+        def read_batch(batch):
+            entries = _read_by_hashes(fn_name, batch, key_field)
+            if resume and entries:
+                entries = [entry for entry, is_cached in zip(entries, has_many(destination, fn_name, [key_data for key_data, _ in entries])) if not is_cached]
+            return entries
+    else:
+        raise ValueError("items must be passed to migrate from this cache storage, or key_field to migrate from the file cache, as the inputs are not stored")
+
+    from concurrent.futures import ThreadPoolExecutor
+    n_workers = n_workers or get_io_workers()
+    candidates = iter(candidates)
+    checked, copied = 0, 0
+    last_report = time()
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        # At most n_workers batches are read ahead of the one being written
+        pending = deque()
+        while True:
+            while len(pending) < n_workers:
+                batch = list(islice(candidates, batch_size))
+                if not batch:
+                    break
+                pending.append((len(batch), executor.submit(read_batch, batch)))
+            if not pending:
+                break
+
+            batch_length, future = pending.popleft()
+            entries = future.result()
+            if entries:
+                put_many(destination, fn_name, entries)
+            checked += batch_length
+            copied += len(entries)
+
+            if progress and time() - last_report >= MIGRATE_PROGRESS_INTERVAL:
+                last_report = time()
+                of_total = f"/{total}" if total is not None else ""
+                print(f"Checked {checked}{of_total} items, copied {copied}")
+
+    return copied
@@ -0,0 +1,123 @@
+from threading import Lock
+from traceback import print_exc
+
+# Refreshes run in a small pool of their own, so they never take the slots of the scraper
+MAX_REFRESH_WORKERS = 4
+# Beyond this many queued refreshes, stale items are served without scheduling more
+MAX_PENDING_REFRESHES = 1000
+# Inputs looked up per get_many call before a run
+PREFETCH_BATCH_SIZE = 1000
+
+_executor = None
+_in_flight = set()
+_lock = Lock()
+
+
+def partition_cached(storage, fn_name, items, expires_in, keep_misses=True):
+    """
+    Looks up items before any of them runs, in batches with the get_many of storages that have it.
+    Returns (hits, known_misses), where hits maps the index of each cached item to its value, and
+    known_misses holds the hashes of the other items, so get_cached doesn't read their first occurrence again.
+    Without keep_misses, known_misses is empty and misses are read again when their task runs.
+    """
+    from .cache import Cache
+    from .cache_storage import get_many
+
+    hits, known_misses = {}, set()
+    for start in range(0, len(items), PREFETCH_BATCH_SIZE):
+        batch = items[start:start + PREFETCH_BATCH_SIZE]
+        for offset, cached in enumerate(get_many(storage, fn_name, batch, expires_in)):
+            if cached is not None:
+                hits[start + offset] = cached["data"]
+            elif keep_misses:
+                known_misses.add(Cache.hash(batch[offset]))
+    return hits, known_misses
+
+
+def iter_partitioned(storage, fn_name, items, expires_in, known_misses, keep_misses=True):
+    """
+    Yields (item, is_cached, value) for items of any iterable, looked up a batch at a time like partition_cached,
+    so streams hold one batch in memory. known_misses is updated in place with the misses of the current batch.
+    """
+    from itertools import islice
+
+    items = iter(items)
+    while True:
+        batch = list(islice(items, PREFETCH_BATCH_SIZE))
+        if not batch:
+            return
+        hits, batch_misses = partition_cached(storage, fn_name, batch, expires_in, keep_misses)
+        # Misses of earlier batches not run yet are read again, which only costs a lookup
+        known_misses.clear()
+        known_misses.update(batch_misses)
+        for index, item in enumerate(batch):
+            yield item, index in hits, hits.get(index)
+
+
+def get_cached(storage, fn_name, data, expires_in, stale_while_revalidate=False, known_misses=None):
+    """
+    Returns (cached, is_stale), where cached is {"data": value} or None.
+    With stale_while_revalidate, items past expires_in are returned as stale instead of being treated as misses,
+    for any age if it is True, or until expires_in + stale_while_revalidate if it is a timedelta.
+    Storages without a get_with_age method are read as usual.
+    Inputs in known_misses, as returned by partition_cached, are not read again. Each hash is taken out of
+    known_misses when used, so duplicates of an input read the item cached by its first occurrence.
+    """
+    if known_misses:
+        from .cache import Cache
+        try:
+            # remove is atomic, so of concurrent duplicates, only one skips the read
+            known_misses.remove(Cache.hash(data))
+            return None, False
+        except KeyError:
+            pass
+
+    get_with_age = getattr(storage, "get_with_age", None)
+    if not stale_while_revalidate or expires_in is None or get_with_age is None:
+        return storage.get(fn_name, data, expires_in), False
+
+    cached = get_with_age(fn_name, data)
+    if cached is None:
+        return None, False
+
+    age = cached["age"]
+    if age <= expires_in.total_seconds():
+        return cached, False
+    if stale_while_revalidate is True or age <= (expires_in + stale_while_revalidate).total_seconds():
+        return cached, True
+    return None, False
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(max_workers=MAX_REFRESH_WORKERS, thread_name_prefix="botasaurus-refresh")
+    return _executor
+
+
+def schedule_refresh(fn_name, data, refresh):
+    """
+    Runs refresh() in the background, unless a refresh of the same input is already queued or running.
+    Returns whether the refresh was scheduled.
+    """
+    from .cache import Cache
+    key = (fn_name, Cache.hash(data))
+    with _lock:
+        if key in _in_flight or len(_in_flight) >= MAX_PENDING_REFRESHES:
+            return False
+        _in_flight.add(key)
+
+    def run():
+        try:
+            refresh()
+        except Exception:
+            print_exc()
+        finally:
+            with _lock:
+                _in_flight.discard(key)
+
+    _get_executor().submit(run)
+    return True
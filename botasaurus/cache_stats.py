@@ -0,0 +1,255 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Event, Lock, Thread
+from time import perf_counter
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, float("inf"))
+OPERATIONS = ("get", "put", "delete")
+
+stats_enabled = False
+_stats = {}  # (func_name, backend) -> counters
+_stats_lock = Lock()
+# What the storage reported during the current operation. map_io runs its tasks in a copy of the caller's
+# context, so reports from the I/O threads of batch operations reach the same usage.
+_current_usage = ContextVar("botasaurus_cache_usage", default=None)
+_logger = None
+
+
+def _new_counters():
+    counters = {
+        "hits": 0,
+        "misses": 0,
+        "expirations": 0,
+        "puts": 0,
+        "deletes": 0,
+        "bytes_read": 0,
+        "bytes_written": 0,
+    }
+    for operation in OPERATIONS:
+        counters[f"{operation}_latency"] = [0] * len(LATENCY_BUCKETS)
+        counters[f"{operation}_seconds"] = 0.0
+    return counters
+
+
+class _Usage:
+    """Bytes and expirations reported during one operation, possibly from several threads."""
+
+    def __init__(self):
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.expirations = 0
+        self.lock = Lock()
+
+
+# Called by the storages, so bytes and expirations are known without changing the get/put/delete contract
+
+def note_bytes_read(size):
+    usage = _current_usage.get()
+    if usage is not None:
+        with usage.lock:
+            usage.bytes_read += size
+
+
+def note_bytes_written(size):
+    usage = _current_usage.get()
+    if usage is not None:
+        with usage.lock:
+            usage.bytes_written += size
+
+
+def note_expired(count=1):
+    usage = _current_usage.get()
+    if usage is not None:
+        with usage.lock:
+            usage.expirations += count
+
+
+def _record(func_name, backend, operation, elapsed, usage, hit=None):
+    _record_many(func_name, backend, operation, elapsed, usage, 1, 1 if hit else 0)
+
+
+def _record_many(func_name, backend, operation, elapsed, usage, count, hits=0):
+    """Records count operations done in one call, each taking an equal share of elapsed."""
+    if not count:
+        return
+    with _stats_lock:
+        counters = _stats.get((func_name, backend))
+        if counters is None:
+            counters = _stats[(func_name, backend)] = _new_counters()
+        counters[f"{operation}_latency"][bisect_left(LATENCY_BUCKETS, elapsed / count)] += count
+        counters[f"{operation}_seconds"] += elapsed
+        counters["bytes_read"] += usage.bytes_read
+        counters["bytes_written"] += usage.bytes_written
+        if operation == "get":
+            counters["hits"] += hits
+            counters["misses"] += count - hits
+            counters["expirations"] += usage.expirations
+        elif operation == "put":
+            counters["puts"] += count
+        else:
+            counters["deletes"] += count
+
+
+class InstrumentedCacheStorage:
+    """Wraps a cache storage to record hits, misses, expirations, bytes and latencies of its operations."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.backend = type(inner).__name__
+
+    def _call(self, fn, *args):
+        """Returns (fn(*args), elapsed seconds, usage reported by the storage meanwhile)."""
+        usage = _Usage()
+        token = _current_usage.set(usage)
+        try:
+            start = perf_counter()
+            result = fn(*args)
+            return result, perf_counter() - start, usage
+        finally:
+            _current_usage.reset(token)
+
+    def get(self, func_name, key_data, expires_in=None):
+        cached, elapsed, usage = self._call(self.inner.get, func_name, key_data, expires_in)
+        _record(func_name, self.backend, "get", elapsed, usage, hit=cached is not None)
+        return cached
+
+    def _get_with_age(self, func_name, key_data):
+        cached, elapsed, usage = self._call(self.inner.get_with_age, func_name, key_data)
+        _record(func_name, self.backend, "get", elapsed, usage, hit=cached is not None)
+        return cached
+
+    def put(self, func_name, key_data, data):
+        _, elapsed, usage = self._call(self.inner.put, func_name, key_data, data)
+        _record(func_name, self.backend, "put", elapsed, usage)
+
+    def delete(self, func_name, key_data):
+        _, elapsed, usage = self._call(self.inner.delete, func_name, key_data)
+        _record(func_name, self.backend, "delete", elapsed, usage)
+
+    def _get_many(self, func_name, items, expires_in=None):
+        results, elapsed, usage = self._call(self.inner.get_many, func_name, items, expires_in)
+        hits = sum(cached is not None for cached in results)
+        _record_many(func_name, self.backend, "get", elapsed, usage, len(results), hits)
+        return results
+
+    def _has_many(self, func_name, items, expires_in=None):
+        results, elapsed, usage = self._call(self.inner.has_many, func_name, items, expires_in)
+        _record_many(func_name, self.backend, "get", elapsed, usage, len(results), sum(results))
+        return results
+
+    def _put_many(self, func_name, entries):
+        _, elapsed, usage = self._call(self.inner.put_many, func_name, entries)
+        _record_many(func_name, self.backend, "put", elapsed, usage, len(entries))
+
+    def _delete_many(self, func_name, items):
+        _, elapsed, usage = self._call(self.inner.delete_many, func_name, items)
+        _record_many(func_name, self.backend, "delete", elapsed, usage, len(items))
+
+    # Optional methods, only offered when the inner storage has them, so callers can fall back to get
+    _OPTIONAL_METHODS = {
+        "get_with_age": "_get_with_age",
+        "get_many": "_get_many",
+        "has_many": "_has_many",
+        "put_many": "_put_many",
+        "delete_many": "_delete_many",
+    }
+
+    def __getattr__(self, name):
+        # Anything else, like clear or close, is the inner storage's
+        value = getattr(self.inner, name)
+        if name in self._OPTIONAL_METHODS:
+            return getattr(self, self._OPTIONAL_METHODS[name])
+        return value
+
+
+def _percentile(buckets, fraction):
+    total = sum(buckets)
+    if not total:
+        return None
+    target = total * fraction
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, buckets):
+        seen += count
+        if seen >= target:
+            return bound
+    return LATENCY_BUCKETS[-1]
+
+
+def _summarize(counters):
+    gets = counters["hits"] + counters["misses"]
+    summary = {
+        "hits": counters["hits"],
+        "misses": counters["misses"],
+        "expirations": counters["expirations"],
+        "hit_ratio": counters["hits"] / gets if gets else None,
+        "puts": counters["puts"],
+        "deletes": counters["deletes"],
+        "bytes_read": counters["bytes_read"],
+        "bytes_written": counters["bytes_written"],
+    }
+    for operation in OPERATIONS:
+        buckets = counters[f"{operation}_latency"]
+        count = sum(buckets)
+        summary[f"{operation}_latency"] = {
+            "count": count,
+            "mean": counters[f"{operation}_seconds"] / count if count else None,
+            "p50": _percentile(buckets, 0.5),
+            "p99": _percentile(buckets, 0.99),
+            "buckets": dict(zip(LATENCY_BUCKETS, buckets)),
+        }
+    return summary
+
+
+def get_stats(func_name=None):
+    """Returns {func_name: {backend: summary}}, for every function or only func_name."""
+    with _stats_lock:
+        items = [(key, dict(counters, **{f"{op}_latency": list(counters[f"{op}_latency"]) for op in OPERATIONS})) for key, counters in _stats.items()]
+
+    result = {}
+    for (name, backend), counters in items:
+        if func_name is None or name == func_name:
+            result.setdefault(name, {})[backend] = _summarize(counters)
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def format_stats():
+    lines = []
+    for func_name, backends in get_stats().items():
+        for backend, summary in backends.items():
+            hit_ratio = f"{summary['hit_ratio']:.1%}" if summary["hit_ratio"] is not None else "-"
+            get_p50 = summary["get_latency"]["p50"]
+            lines.append(
+                f"Cache {func_name} [{backend}]: {summary['hits']} hits, {summary['misses']} misses "
+                f"({summary['expirations']} expired), hit ratio {hit_ratio}, {summary['puts']} puts, "
+                f"{summary['bytes_read']} bytes read, {summary['bytes_written']} bytes written, "
+                f"get p50 <= {get_p50 * 1000 if get_p50 is not None else 0:g} ms"
+            )
+    return "\n".join(lines)
+
+
+def set_stats_enabled(enabled=True, log_interval=None):
+    global stats_enabled, _logger
+    stats_enabled = enabled
+
+    if _logger is not None:
+        _logger[1].set()
+        _logger = None
+
+    if enabled and log_interval:
+        stop = Event()
+
+        def log_periodically():
+            while not stop.wait(log_interval):
+                text = format_stats()
+                if text:
+                    print(text)
+
+        thread = Thread(target=log_periodically, daemon=True, name="botasaurus-cache-stats")
+        thread.start()
+        _logger = (thread, stop)
@@ -1,21 +1,50 @@
 from datetime import timedelta
-from typing import Any, Optional, Dict
+from typing import Any, Optional, Dict, List, Tuple
+from collections import OrderedDict
+from threading import Lock
+from time import time
+import json
+import os
+from . import cache_stats
 from .cache import (
-    Cache, _get_cache_path, _has, _get, CacheMissException
+    Cache, _get_cache_path, _has_or_migrate, _get, CacheMissException
 )
+from .io_executor import map_io
+
+
+class _default_instance_method:
+    """
+    Method of FileCacheStorage which runs on default_file_cache_storage when called on the class,
+    so calls like FileCacheStorage.get(func_name, key_data) of the static methods of earlier versions keep working.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner=None):
+        return self.func.__get__(instance if instance is not None else default_file_cache_storage, owner)
+
 
 class FileCacheStorage:
     """File-based cache storage using existing cache.py helpers."""
-    
-    @staticmethod
-    def get(func_name: str, key_data, expires_in: Optional[timedelta] = None) -> Optional[Dict[str, Any]]:
+
+    def __init__(self, compression=None):
+        """
+        Args:
+            compression: None to use Cache.compression, or "none", "gzip", "zstd" or a codec like ZstdCodec(level=10).
+        """
+        self.compression = compression
+
+    @_default_instance_method
+    def get(self, func_name: str, key_data, expires_in: Optional[timedelta] = None) -> Optional[Dict[str, Any]]:
         """
         Returns:
             {"data": value} if cache hit (value can be None)
             None if cache miss or expired
         """
         path = _get_cache_path(func_name, key_data)
-        if _has(path):
+        if _has_or_migrate(func_name, key_data, path):
             if expires_in is not None:
                 if Cache.is_item_older_than(
                         func_name,
@@ -25,18 +54,273 @@ class FileCacheStorage:
                         microseconds=expires_in.microseconds,
                     ):
                         Cache.delete(func_name, key_data)
+                        cache_stats.note_expired()
                         return None
             try:
                 return {"data": _get(path)}
             except CacheMissException:
                 return None
         return None
-    
-    @staticmethod
-    def put(func_name: str, key_data, data: Any) -> None:
-        Cache.put(func_name, key_data, data)
-    
-    @staticmethod
-    def delete(func_name: str, key_data) -> None:
+
+    @_default_instance_method
+    def get_with_age(self, func_name: str, key_data) -> Optional[Dict[str, Any]]:
+        """Returns {"data": value, "age": seconds since it was cached}, or None if not cached."""
+        path = _get_cache_path(func_name, key_data)
+        if not _has_or_migrate(func_name, key_data, path):
+            return None
+        try:
+            modified_time = os.path.getmtime(path)
+            return {"data": _get(path), "age": time() - modified_time}
+        except (FileNotFoundError, CacheMissException):
+            return None
+
+    @_default_instance_method
+    def put(self, func_name: str, key_data, data: Any) -> None:
+        Cache.put(func_name, key_data, data, self.compression)
+
+    @_default_instance_method
+    def delete(self, func_name: str, key_data) -> None:
         Cache.delete(func_name, key_data)
 
+    def _has(self, func_name: str, key_data, expires_in: Optional[timedelta]) -> bool:
+        path = _get_cache_path(func_name, key_data)
+        if not _has_or_migrate(func_name, key_data, path):
+            return False
+        if expires_in is None:
+            return True
+        try:
+            return time() - os.path.getmtime(path) <= expires_in.total_seconds()
+        except FileNotFoundError:
+            return False
+
+    # The batch methods spread the files over the I/O thread pool
+
+    @_default_instance_method
+    def get_many(self, func_name: str, items: List[Any], expires_in: Optional[timedelta] = None) -> List[Optional[Dict[str, Any]]]:
+        """Returns the result of get for each of items, in order."""
+        return map_io(lambda key_data: self.get(func_name, key_data, expires_in), items)
+
+    @_default_instance_method
+    def has_many(self, func_name: str, items: List[Any], expires_in: Optional[timedelta] = None) -> List[bool]:
+        """Returns whether each of items is cached and not expired, without reading the files."""
+        return map_io(lambda key_data: self._has(func_name, key_data, expires_in), items)
+
+    @_default_instance_method
+    def put_many(self, func_name: str, entries: List[Tuple[Any, Any]]) -> None:
+        """Stores each (key_data, data) of entries."""
+        map_io(lambda entry: self.put(func_name, entry[0], entry[1]), entries)
+
+    @_default_instance_method
+    def delete_many(self, func_name: str, items: List[Any]) -> None:
+        map_io(lambda key_data: self.delete(func_name, key_data), items)
+
+
+default_file_cache_storage = FileCacheStorage()
+
+
+# Storages may implement get_many, has_many, put_many and delete_many to serve many items in one round trip.
+# These functions use them when available, and fall back to one call per item otherwise.
+
+def get_many(storage, func_name: str, items, expires_in: Optional[timedelta] = None) -> List[Optional[Dict[str, Any]]]:
+    items = list(items)
+    if hasattr(storage, "get_many"):
+        return storage.get_many(func_name, items, expires_in)
+    return [storage.get(func_name, key_data, expires_in) for key_data in items]
+
+
+def has_many(storage, func_name: str, items, expires_in: Optional[timedelta] = None) -> List[bool]:
+    items = list(items)
+    if hasattr(storage, "has_many"):
+        return storage.has_many(func_name, items, expires_in)
+    return [cached is not None for cached in get_many(storage, func_name, items, expires_in)]
+
+
+def put_many(storage, func_name: str, entries) -> None:
+    entries = list(entries)
+    if hasattr(storage, "put_many"):
+        storage.put_many(func_name, entries)
+    else:
+        for key_data, data in entries:
+            storage.put(func_name, key_data, data)
+
+
+def delete_many(storage, func_name: str, items) -> None:
+    items = list(items)
+    if hasattr(storage, "delete_many"):
+        storage.delete_many(func_name, items)
+    else:
+        for key_data in items:
+            storage.delete(func_name, key_data)
+
+
+def resolve_cache_storage(cache_storage):
+    """Returns the storage used by the decorators for the cache_storage option."""
+    if cache_storage is None or cache_storage is FileCacheStorage:
+        # FileCacheStorage used to be passed as a class
+        cache_storage = default_file_cache_storage
+    if cache_stats.stats_enabled and not isinstance(cache_storage, cache_stats.InstrumentedCacheStorage):
+        return cache_stats.InstrumentedCacheStorage(cache_storage)
+    return cache_storage
+
+
+class MemoryCache:
+    """
+    Bounded in-memory LRU tier in front of another cache storage.
+
+    Reads are served from memory when possible, writes and deletes go through to the inner storage.
+    Cached values are shared between callers, so treat them as read-only.
+
+    Example:
+        @request(cache=True, cache_storage=MemoryCache(SqliteCacheStorage(), max_items=10000))
+    """
+
+    def __init__(self, inner=None, max_items: Optional[int] = 10000, max_bytes: Optional[int] = None):
+        """
+        Args:
+            inner: Storage to read from and write through to. Defaults to the file cache.
+            max_items: Maximum number of items held in memory.
+            max_bytes: Maximum total size of the JSON of the items held in memory.
+        """
+        self.inner = resolve_cache_storage(inner)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        # (func_name, hash) -> (data, created_at, size), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+    def _make_key(self, func_name: str, key_data):
+        return (func_name, Cache.hash(key_data))
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _store(self, key, data, created_at):
+        size = len(json.dumps(data)) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (data, created_at, size)
+            self._bytes += size
+            while (self.max_items is not None and len(self._entries) > self.max_items) or \
+                  (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def _get_from_memory(self, key, expires_in):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                data, created_at, _ = entry
+                if expires_in is None:
+                    self._entries.move_to_end(key)
+                    return {"data": data}
+                # Items loaded from inner storages without get_with_age have an unknown age, so they are read again
+                if created_at is not None:
+                    if time() - created_at <= expires_in.total_seconds():
+                        self._entries.move_to_end(key)
+                        return {"data": data}
+                    self._pop(key)
+        return None
+
+    def _get_from_inner(self, func_name: str, key, key_data, expires_in: Optional[timedelta]) -> Optional[Dict[str, Any]]:
+        """Reads an item from the inner storage and holds it in memory with the time it was cached."""
+        get_with_age = getattr(self.inner, "get_with_age", None)
+        if get_with_age is None:
+            cached, created_at = self.inner.get(func_name, key_data, expires_in), None
+        else:
+            cached = get_with_age(func_name, key_data)
+            if cached is not None and expires_in is not None and cached["age"] > expires_in.total_seconds():
+                # Expired items are left to the inner storage, which deletes them
+                cached = self.inner.get(func_name, key_data, expires_in)
+                created_at = None
+            elif cached is not None:
+                cached, created_at = {"data": cached["data"]}, time() - cached["age"]
+
+        if cached is not None:
+            self._store(key, cached["data"], created_at)
+        else:
+            with self._lock:
+                self._pop(key)
+        return cached
+
+    def get(self, func_name: str, key_data, expires_in: Optional[timedelta] = None) -> Optional[Dict[str, Any]]:
+        key = self._make_key(func_name, key_data)
+        cached = self._get_from_memory(key, expires_in)
+        if cached is not None:
+            return cached
+        return self._get_from_inner(func_name, key, key_data, expires_in)
+
+    def get_with_age(self, func_name: str, key_data) -> Optional[Dict[str, Any]]:
+        key = self._make_key(func_name, key_data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None:
+                self._entries.move_to_end(key)
+                return {"data": entry[0], "age": time() - entry[1]}
+
+        get_with_age = getattr(self.inner, "get_with_age", None)
+        if get_with_age is None:
+            return None
+        cached = get_with_age(func_name, key_data)
+        if cached is not None:
+            self._store(key, cached["data"], time() - cached["age"])
+        return cached
+
+    def put(self, func_name: str, key_data, data: Any) -> None:
+        self.inner.put(func_name, key_data, data)
+        self._store(self._make_key(func_name, key_data), data, time())
+
+    def delete(self, func_name: str, key_data) -> None:
+        self.inner.delete(func_name, key_data)
+        with self._lock:
+            self._pop(self._make_key(func_name, key_data))
+
+    def get_many(self, func_name: str, items: List[Any], expires_in: Optional[timedelta] = None) -> List[Optional[Dict[str, Any]]]:
+        keys = [self._make_key(func_name, key_data) for key_data in items]
+        results = [self._get_from_memory(key, expires_in) for key in keys]
+        missed = [index for index, cached in enumerate(results) if cached is None]
+        if missed and hasattr(self.inner, "get_with_age"):
+            # Items not in memory are read with their age, so later reads can check their expiry in memory
+            inner_results = map_io(lambda index: self._get_from_inner(func_name, keys[index], items[index], expires_in), missed)
+            for index, cached in zip(missed, inner_results):
+                results[index] = cached
+        elif missed:
+            # Items not in memory are read from the inner storage in one batch
+            for index, cached in zip(missed, get_many(self.inner, func_name, [items[index] for index in missed], expires_in)):
+                results[index] = cached
+                if cached is not None:
+                    self._store(keys[index], cached["data"], None)
+                else:
+                    with self._lock:
+                        self._pop(keys[index])
+        return results
+
+    def has_many(self, func_name: str, items: List[Any], expires_in: Optional[timedelta] = None) -> List[bool]:
+        results = [self._get_from_memory(self._make_key(func_name, key_data), expires_in) is not None for key_data in items]
+        missed = [index for index, is_cached in enumerate(results) if not is_cached]
+        if missed:
+            for index, is_cached in zip(missed, has_many(self.inner, func_name, [items[index] for index in missed], expires_in)):
+                results[index] = is_cached
+        return results
+
+    def put_many(self, func_name: str, entries: List[Tuple[Any, Any]]) -> None:
+        put_many(self.inner, func_name, entries)
+        now = time()
+        for key_data, data in entries:
+            self._store(self._make_key(func_name, key_data), data, now)
+
+    def delete_many(self, func_name: str, items: List[Any]) -> None:
+        delete_many(self.inner, func_name, items)
+        with self._lock:
+            for key_data in items:
+                self._pop(self._make_key(func_name, key_data))
+
+    def clear(self) -> None:
+        """Empty the memory tier, keeping the inner storage as is."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
@@ -1,5 +1,12 @@
+from threading import Lock
 from botasaurus_requests.request_class import Request
 
+# Threads running the requests of async def scrapers, shared by all event loops of the process
+ASYNC_REQUEST_THREADS = 64
+
+_async_request_executor = None
+_async_request_executor_lock = Lock()
+
 def create_request(proxy=None,  user_agent=None):
     reqs = Request(
             proxy,
@@ -10,3 +17,53 @@ def create_request(proxy=None,  user_agent=None):
         reqs.proxy =  proxy
         
     return reqs
+
+
+def get_async_request_executor():
+    global _async_request_executor
+    if _async_request_executor is None:
+        with _async_request_executor_lock:
+            if _async_request_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _async_request_executor = ThreadPoolExecutor(max_workers=ASYNC_REQUEST_THREADS, thread_name_prefix="botasaurus-request")
+    return _async_request_executor
+
+
+class AsyncRequest:
+    """
+    Passed to async def scrapers in place of the Request. Its HTTP methods are awaitable, running the blocking
+    request in a thread pool of ASYNC_REQUEST_THREADS threads, so at most that many of them are in flight.
+    Other attributes are those of the Request.
+    """
+
+    def __init__(self, reqs):
+        self.reqs = reqs
+
+    def __getattr__(self, name):
+        return getattr(self.reqs, name)
+
+    async def _run(self, method, *args, **kwargs):
+        import asyncio
+        from functools import partial
+        return await asyncio.get_running_loop().run_in_executor(get_async_request_executor(), partial(getattr(self.reqs, method), *args, **kwargs))
+
+    async def get(self, *args, **kwargs):
+        return await self._run("get", *args, **kwargs)
+
+    async def post(self, *args, **kwargs):
+        return await self._run("post", *args, **kwargs)
+
+    async def put(self, *args, **kwargs):
+        return await self._run("put", *args, **kwargs)
+
+    async def patch(self, *args, **kwargs):
+        return await self._run("patch", *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await self._run("delete", *args, **kwargs)
+
+    async def head(self, *args, **kwargs):
+        return await self._run("head", *args, **kwargs)
+
+    async def options(self, *args, **kwargs):
+        return await self._run("options", *args, **kwargs)
@@ -6,10 +6,11 @@ from datetime import timedelta
 from .utils import is_errors_instance
 
 from .cache import Cache, _get,CacheMissException, _has, _get_cache_path, _create_cache_directory_if_not_exists
-from .cache_storage import FileCacheStorage
+from .cache_storage import resolve_cache_storage
+from .cache_revalidation import get_cached, schedule_refresh
 from .dontcache import is_dont_cache
 
-def cache(_func=None, *, cache=True, expires_in: Optional[timedelta] = None, cache_storage=None):
+def cache(_func=None, *, cache=True, expires_in: Optional[timedelta] = None, stale_while_revalidate=False, cache_storage=None):
     """
     Cache decorator to store and retrieve function results.
     
@@ -19,6 +20,8 @@ def cache(_func=None, *, cache=True, expires_in: Optional[timedelta] = None, cac
                    Example: timedelta(days=7), timedelta(minutes=30)
                    If the cached item is older than this duration, it will be treated as expired
                    and the function will be executed again.
+        stale_while_revalidate: Return expired items right away and refresh them in the background.
+                   True serves them whatever their age, a timedelta only until expires_in + stale_while_revalidate.
         cache_storage: Optional storage backend. Defaults to FileCacheStorage.
     
     Example:
@@ -32,32 +35,39 @@ def cache(_func=None, *, cache=True, expires_in: Optional[timedelta] = None, cac
     def decorator_cache(func):
         @wraps(func)    
         def wrapper_cache(*args, **kwargs):
-            nonlocal cache, expires_in, cache_storage
+            nonlocal cache, expires_in, stale_while_revalidate, cache_storage
 
             cache_enabled = kwargs.pop("cache", cache)
             expires_in_val = kwargs.pop("expires_in", expires_in)
-            storage = kwargs.pop("cache_storage", cache_storage) or FileCacheStorage
+            stale_while_revalidate_val = kwargs.pop("stale_while_revalidate", stale_while_revalidate)
+            storage = resolve_cache_storage(kwargs.pop("cache_storage", cache_storage))
 
             if not cache_enabled:
                 return func(*args, **kwargs)
             
             key_data = [args, kwargs]
             
+            def run_and_store():
+                result = func(*args, **kwargs)
+                
+                # Store result
+                if cache_enabled is True or cache_enabled == 'REFRESH':
+                    if is_dont_cache(result):
+                        storage.delete(func.__name__, key_data)
+                    else:
+                        storage.put(func.__name__, key_data, result)
+                return result
+
             if cache_enabled is True:
                 # Returns {"data": value} or None
-                cached = storage.get(func.__name__, key_data, expires_in_val)
+                cached, is_stale = get_cached(storage, func.__name__, key_data, expires_in_val, stale_while_revalidate_val)
                 if cached is not None:
+                    if is_stale:
+                        schedule_refresh(func.__name__, key_data, run_and_store)
                     return cached["data"]  # Extract actual value
             
             # Execute function
-            result = func(*args, **kwargs)
-            
-            # Store result
-            if cache_enabled is True or cache_enabled == 'REFRESH':
-                if is_dont_cache(result):
-                    storage.delete(func.__name__, key_data)
-                else:
-                    storage.put(func.__name__, key_data, result)
+            result = run_and_store()
             
             if is_dont_cache(result):
                 result = result.data
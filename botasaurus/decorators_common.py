@@ -6,7 +6,7 @@ from .utils import write_file
 
 from .formats import Formats
 
-from .output import fix_excel_filename, write_excel, write_json, write_csv, fix_csv_filename, fix_json_filename
+from .output import fix_excel_filename, write_excel, write_json, write_csv, fix_csv_filename, fix_json_filename, JsonStreamWriter, CsvStreamWriter, ExcelStreamWriter
 
 from .decorators_utils import (
     create_directory_if_not_exists,
@@ -214,6 +214,122 @@ def write_output(output, output_formats, data, result, fn_name):
     print_filenames(written_filenames)
 
 
+class StreamOutput:
+    """Writes the results of the stream option as they arrive, to the same files as write_output."""
+
+    def __init__(self, output, output_formats, fn_name):
+        self.output = output
+        self.writers = []
+        if output is None or callable(output):
+            return
+
+        default_filename = fn_name if output == "default" else output
+        for fm in output_formats or ["JSON"]:
+            if fm == Formats.JSON:
+                self.writers.append(JsonStreamWriter(default_filename))
+            elif fm == Formats.CSV:
+                self.writers.append(CsvStreamWriter(default_filename))
+            elif fm == Formats.EXCEL:
+                self.writers.append(ExcelStreamWriter(default_filename))
+
+    def write(self, data_item, result):
+        if callable(self.output):
+            # Dynamic output handling, called for each input
+            self.output(data_item, result)
+        for writer in self.writers:
+            writer.write(result)
+
+    def close(self):
+        print_filenames([writer.close() for writer in self.writers])
+
+
+# Results completed ahead of the one awaited by stream="ordered" are buffered, up to this many
+STREAM_MAX_BUFFERED = 1000
+
+def iter_stream(run, entries, n_workers, ordered):
+    """
+    Yields (data_item, result) for each (data_item, is_cached, value) of entries, running run(data_item)
+    for the ones not cached, in n_workers threads. Results come in completion order, or in input order
+    if ordered, while at most 2 * n_workers runs are queued, so the memory used doesn't grow with the input.
+    """
+    if n_workers <= 1:
+        for data_item, is_cached, value in entries:
+            yield data_item, value if is_cached else run(data_item)
+        return
+
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    max_running = 2 * n_workers
+    executor = ThreadPoolExecutor(max_workers=n_workers)
+    # future -> data_item of the runs not yielded yet
+    running = {}
+    # (data_item, future or None if cached, value) in input order, only used when ordered
+    pending = deque()
+
+    def wait_first_completed():
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield running.pop(future), future.result()
+
+    try:
+        for data_item, is_cached, value in entries:
+            if not ordered:
+                if is_cached:
+                    yield data_item, value
+                    continue
+                running[executor.submit(run, data_item)] = data_item
+                if len(running) >= max_running:
+                    yield from wait_first_completed()
+                continue
+
+            future = None
+            if not is_cached:
+                future = executor.submit(run, data_item)
+                running[future] = data_item
+            pending.append((data_item, future, value))
+            # Yields the head of the input once done, waiting for it while too many runs are queued
+            while pending and (pending[0][1] is None or pending[0][1].done() or
+                               len(running) >= max_running or len(pending) >= STREAM_MAX_BUFFERED):
+                head_item, head_future, head_value = pending.popleft()
+                if head_future is not None:
+                    del running[head_future]
+                    head_value = head_future.result()
+                yield head_item, head_value
+
+        while pending:
+            head_item, head_future, head_value = pending.popleft()
+            if head_future is not None:
+                del running[head_future]
+                head_value = head_future.result()
+            yield head_item, head_value
+        while running:
+            yield from wait_first_completed()
+    finally:
+        # Runs not started yet are dropped when the stream is closed early or a run raised
+        for future in running:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+def stream_results(run, entries, n_workers, ordered, output, output_formats, fn_name, on_finish=None):
+    """Generator returned by the decorators with the stream option, writing each result to the output as it is yielded."""
+    stream_output = StreamOutput(output, output_formats, fn_name)
+    try:
+        for data_item, result in iter_stream(run, entries, n_workers, ordered):
+            stream_output.write(data_item, result)
+            yield data_item, result
+    finally:
+        stream_output.close()
+        if on_finish is not None:
+            on_finish()
+
+
+def iter_stream_input(data):
+    """Lists, tuples and iterators like generators are streamed item by item, any other input is a single item."""
+    if isinstance(data, (list, tuple)) or hasattr(data, "__next__"):
+        return iter(data)
+    return iter([data])
+
+
 def clean_error_logs(error_logs_dir, sort_key):
     # Get list of all folders in the error_logs directory
     folders = [folder for folder in os.listdir(error_logs_dir)]
@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+
+
+def lock_file(fp, shared=False):
+    """Blocks until fp is locked. Shared locks are only supported with fcntl, elsewhere every lock is exclusive."""
+    try:
+        import fcntl
+        fcntl.flock(fp.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    except ImportError:
+        import msvcrt
+        fp.seek(0)
+        while True:
+            try:
+                # Retries for 10 seconds before raising
+                msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass
+
+
+def unlock_file(fp):
+    try:
+        import fcntl
+        fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+    except ImportError:
+        import msvcrt
+        fp.seek(0)
+        msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Holds a lock on the file at path, which is created if needed, so processes can coordinate through it."""
+    with open(path, "a+b") as fp:
+        lock_file(fp, shared)
+        try:
+            yield
+        finally:
+            unlock_file(fp)
@@ -0,0 +1,90 @@
+import os
+from contextvars import copy_context
+from threading import Lock
+from . import cache_stats
+
+# Below this many items, the overhead of any pool outweighs the work
+SERIAL_MAX_ITEMS = 64
+# Above this average size, decoding JSON dominates over I/O and, as it holds the GIL, is better spread across processes
+PROCESSES_MIN_AVERAGE_SIZE = 1024 * 1024
+PROCESSES_MIN_ITEMS = 256
+MAX_CHUNK_SIZE = 512
+
+_executor = None
+_executor_lock = Lock()
+
+def get_io_workers():
+    return min(32, (os.cpu_count() or 1) * 4)
+
+def get_io_executor():
+    """Returns a thread pool shared by all file I/O, so threads are started once per process."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(max_workers=get_io_workers(), thread_name_prefix="botasaurus-io")
+    return _executor
+
+def estimate_average_file_size(file_paths, sample_size=16):
+    if not file_paths:
+        return 0
+    step = max(1, len(file_paths) // sample_size)
+    sizes = []
+    for path in file_paths[::step][:sample_size]:
+        try:
+            sizes.append(os.path.getsize(path))
+        except OSError:
+            pass
+    return sum(sizes) / len(sizes) if sizes else 0
+
+def choose_io_strategy(count, average_size=0):
+    """Returns "serial", "threads" or "processes" for running count tasks on files of average_size bytes."""
+    if count <= SERIAL_MAX_ITEMS:
+        return "serial"
+    if average_size >= PROCESSES_MIN_AVERAGE_SIZE and count >= PROCESSES_MIN_ITEMS:
+        return "processes"
+    return "threads"
+
+def _run_chunk(fn, chunk):
+    return [fn(item) for item in chunk]
+
+def map_io(fn, items, average_size=0, strategy=None):
+    """
+    Runs fn over items and returns the results in order, using the strategy best suited
+    for the number of items and their average file size.
+    """
+    items = list(items)
+    strategy = strategy or choose_io_strategy(len(items), average_size)
+
+    if strategy == "serial":
+        return [fn(item) for item in items]
+
+    if strategy == "processes" and cache_stats.stats_enabled:
+        # Worker processes have no access to the stats of this process, so what they read would not be counted
+        strategy = "threads"
+
+    if strategy == "processes":
+        from joblib import Parallel, delayed
+        return Parallel(n_jobs=-1)(delayed(fn)(item) for item in items)
+
+    # Chunks amortize the cost of a future over many small files, while keeping every thread busy
+    executor = get_io_executor()
+    chunk_size = max(1, min(MAX_CHUNK_SIZE, len(items) // (get_io_workers() * 4)))
+    # Each chunk runs in a copy of the caller's context, so context variables like the cache stats of the call are seen
+    context = copy_context()
+    futures = [
+        executor.submit(context.copy().run, _run_chunk, fn, items[i:i + chunk_size]) for i in range(0, len(items), chunk_size)
+    ]
+
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return results
+
+def map_files(fn, file_paths):
+    """Like map_io, for functions which read or remove the given files."""
+    file_paths = list(file_paths)
+    if len(file_paths) <= SERIAL_MAX_ITEMS:
+        return map_io(fn, file_paths, strategy="serial")
+    return map_io(fn, file_paths, estimate_average_file_size(file_paths))
@@ -417,6 +417,78 @@ def get_fields(data):
         return []
     return list(data[0].keys())
 
+# Writers appending results to a file as they arrive, used by the stream option of the decorators.
+# Rows can't be revisited, so CSV and Excel columns are those of the first row.
+
+class JsonStreamWriter:
+    def __init__(self, filename, indent=4):
+        self.filename = fix_json_filename(filename)
+        self.indent = indent
+        self.count = 0
+        self.fp = open(self.filename, "w", encoding="utf-8")
+        self.fp.write("[")
+
+    def write(self, item):
+        # Laid out like json.dump of the whole list
+        padding = " " * self.indent
+        text = padding + dumps(item, indent=self.indent).replace("\n", "\n" + padding)
+        self.fp.write(("," if self.count else "") + "\n" + text)
+        self.count += 1
+
+    def close(self):
+        self.fp.write("\n]" if self.count else "]")
+        self.fp.close()
+        return self.filename
+
+class CsvStreamWriter:
+    def __init__(self, filename):
+        self.filename = fix_csv_filename(filename)
+        self.fp = open(self.filename, "w", newline="", encoding="utf-8")
+        self.writer = None
+
+    def write(self, item):
+        import csv
+        for row in convert_nested_to_json(normalize_data([item])):
+            if self.writer is None:
+                self.writer = csv.DictWriter(self.fp, fieldnames=list(row.keys()), extrasaction="ignore")
+                self.writer.writeheader()
+            self.writer.writerow(row)
+
+    def close(self):
+        self.fp.close()
+        return self.filename
+
+class ExcelStreamWriter:
+    def __init__(self, filename):
+        import xlsxwriter
+        self.filename = fix_excel_filename(filename)
+        # constant_memory flushes each row to disk once the next one starts
+        self.workbook = xlsxwriter.Workbook(self.filename, {"constant_memory": True})
+        self.worksheet = self.workbook.add_worksheet()
+        self.fieldnames = None
+        self.row = 1
+
+    def write(self, item):
+        for row in convert_nested_to_json_for_excel(normalize_data([item])):
+            if self.fieldnames is None:
+                self.fieldnames = list(row.keys())
+                self.worksheet.write_row(0, 0, self.fieldnames)
+            values = [row.get(key) for key in self.fieldnames]
+            if self.worksheet.hlink_count > MAX_EXCEL_LINKS:
+                # Past the Excel link limit, strings are written as is instead of as links
+                for column, value in enumerate(values):
+                    if isinstance(value, str):
+                        self.worksheet.write_string(self.row, column, value)
+                    else:
+                        self.worksheet.write(self.row, column, value)
+            else:
+                self.worksheet.write_row(self.row, 0, values)
+            self.row += 1
+
+    def close(self):
+        self.workbook.close()
+        return self.filename
+
 def read_excel(filename):
     import openpyxl
 
@@ -1,15 +1,20 @@
 from functools import wraps
-from traceback import print_exc, format_exc
+from inspect import iscoroutinefunction
+from traceback import print_exc, print_exception, format_exc
 from datetime import timedelta
 from typing import Any, Callable, Optional, Union, List
 from .utils import is_errors_instance, NotFoundException
-from .create_request import create_request
+from .create_request import create_request, AsyncRequest
 from .beep_utils import beep_input
 from .list_utils import flatten
 
-from botasaurus.decorators_common import print_running, evaluate_proxy, write_output, IS_PRODUCTION, AsyncQueueResult, AsyncResult,  run_parallel, save_error_logs
+from botasaurus.decorators_common import print_running, evaluate_proxy, write_output, IS_PRODUCTION, AsyncQueueResult, AsyncResult,  run_parallel, save_error_logs, stream_results, iter_stream_input
 from .dontcache import is_dont_cache
-from .cache_storage import FileCacheStorage
+from .cache_storage import resolve_cache_storage
+from .cache_revalidation import get_cached, partition_cached, iter_partitioned, schedule_refresh
+from .single_flight import run_single_flight, run_with_file_lock
+from .cache import Cache
+from .io_executor import get_io_workers
 
 def request(
     _func: Optional[Callable] = None,
@@ -19,11 +24,14 @@ def request(
     metadata: Optional[Any] = None,
     cache: Union[bool, str] = False,
     expires_in: Optional[timedelta] = None,
+    stale_while_revalidate: Union[bool, timedelta] = False,
+    single_flight: Union[bool, str] = False,
     cache_storage=None,
     beep: bool = False,
     use_stealth: bool = False,
     run_async: bool = False,
     async_queue: bool = False,
+    stream: Union[bool, str] = False,
     proxy: Optional[Union[Callable[[Any], str], str]] = None,
     user_agent: Optional[Union[Callable[[Any], str], str]] = None,
     close_on_crash: bool = False,
@@ -39,24 +47,30 @@ def request(
         if not hasattr(func, '_scraper_type'):
             func._scraper_type = "request"
 
+        # async def scrapers run on an event loop instead of a thread per parallel request
+        is_async_func = iscoroutinefunction(func)
+
         if use_stealth:
             print("The use_stealth option has been deprecated and will be removed in future releases. Botasaurus now includes best stealth protection enabled by default. To avoid this warning, please remove use_stealth=True from your code.")
 
         @wraps(func)
         def wrapper_requests(*args, **kwargs) -> Any:
             print_running()
-            nonlocal parallel, data, cache, expires_in, cache_storage, beep, run_async, async_queue, metadata
+            nonlocal parallel, data, cache, expires_in, stale_while_revalidate, single_flight, cache_storage, beep, run_async, async_queue, stream, metadata
             nonlocal proxy, user_agent, close_on_crash, output, output_formats, max_retry, retry_wait, must_raise_exceptions, raise_exception, create_error_logs
 
             parallel = kwargs.get("parallel", parallel)
             data = kwargs.get("data", data)
             cache = kwargs.get("cache", cache)
             expires_in = kwargs.get("expires_in", expires_in)
-            storage = kwargs.get("cache_storage", cache_storage) or FileCacheStorage
+            stale_while_revalidate = kwargs.get("stale_while_revalidate", stale_while_revalidate)
+            single_flight = kwargs.get("single_flight", single_flight)
+            storage = resolve_cache_storage(kwargs.get("cache_storage", cache_storage))
             beep = kwargs.get("beep", beep)
             run_async = kwargs.get("run_async", run_async)
             metadata = kwargs.get("metadata", metadata)
             async_queue = kwargs.get("async_queue", async_queue)
+            stream = kwargs.get("stream", stream)
             proxy = kwargs.get("proxy", proxy)
             user_agent = kwargs.get("user_agent", user_agent)
             close_on_crash = kwargs.get("close_on_crash", close_on_crash)
@@ -80,17 +94,8 @@ def request(
                 cycled_proxy = cycle(proxy)         
             else:
                 cycled_proxy = None
-            def run_task(
-                data,
-                retry_attempt,
-            ) -> Any:
-                if cache is True:
-                    # Returns {"data": value} or None
-                    cached = storage.get(fn_name, data, expires_in)
-                    if cached is not None:
-                        return cached["data"]
-                    
-                    
+
+            def create_task_request(data):
                 if cycled_proxy:
                     evaluated_proxy = next(cycled_proxy)
                 else:
@@ -99,73 +104,204 @@ def request(
                     user_agent(data) if callable(user_agent) else user_agent
                 )
 
-                reqs = create_request(
+                return create_request(
                     evaluated_proxy, evaluated_user_agent
                 )
 
-                result = None
-                try:
-                    if "metadata" in kwargs or metadata is not None:
-                        result = func(reqs, data, metadata)
-                    else:
-                        result = func(reqs, data)
-                    if cache is True or cache == 'REFRESH':
-                        if is_dont_cache(result):
-                            storage.delete(fn_name, data)
-                        else:
-                            storage.put(fn_name, data, result)
+            def call_func(reqs, data):
+                if "metadata" in kwargs or metadata is not None:
+                    return func(reqs, data, metadata)
+                return func(reqs, data)
 
+            def store_result(data, result):
+                if cache is True or cache == 'REFRESH':
                     if is_dont_cache(result):
-                        if not return_dont_cache_as_is:
-                            result = result.data
-                    return result
-                except Exception as error:
-                    if isinstance(error, KeyboardInterrupt):
-                        raise  # Re-raise the KeyboardInterrupt to stop execution
-                    elif isinstance(error, NotFoundException) and not error.raised_once:
-                        if error.raise_maximum_1_time:
-                            error.raised_once = True
-                        raise
-                    elif (
-                        must_raise_exceptions
-                        and is_errors_instance(must_raise_exceptions, error)[0]
-                    ):
-                        if create_error_logs:
-                            save_error_logs(format_exc(), None)
-                        raise
-
-                    if max_retry is not None and (max_retry) > (retry_attempt):
-                        print_exc()
-                        if retry_wait:
-                            from time import sleep
-
-                            print("Waiting for " + str(retry_wait) + " seconds")
-                            sleep(retry_wait)
-                        return run_task(data, retry_attempt + 1)
+                        storage.delete(fn_name, data)
+                    else:
+                        storage.put(fn_name, data, result)
 
-                    if not raise_exception:
-                        print_exc()
+                if is_dont_cache(result):
+                    if not return_dont_cache_as_is:
+                        result = result.data
+                return result
 
-                    print("Task failed for input:", data)
+            def should_retry(error, data, retry_attempt):
+                """
+                Called while handling error. Raises it, or returns whether the task should be retried.
+                Tasks which are not retried are reported, then the caller pauses to debug and raises as configured.
+                """
+                if isinstance(error, KeyboardInterrupt):
+                    raise error  # Re-raise the KeyboardInterrupt to stop execution
+                elif isinstance(error, NotFoundException) and not error.raised_once:
+                    if error.raise_maximum_1_time:
+                        error.raised_once = True
+                    raise error
+                elif (
+                    must_raise_exceptions
+                    and is_errors_instance(must_raise_exceptions, error)[0]
+                ):
                     if create_error_logs:
                         save_error_logs(format_exc(), None)
-                    if not IS_PRODUCTION:
-                        if not close_on_crash:
-                            if raise_exception:
-                                print_exc()
-
-                            beep_input(
-                                "We've paused the browser to help you debug. Press 'Enter' to close.",
-                                beep,
-                            )
+                    raise error
+
+                if max_retry is not None and (max_retry) > (retry_attempt):
+                    print_exc()
+                    if retry_wait:
+                        print("Waiting for " + str(retry_wait) + " seconds")
+                    return True
+
+                if not raise_exception:
+                    print_exc()
+
+                print("Task failed for input:", data)
+                if create_error_logs:
+                    save_error_logs(format_exc(), None)
+                return False
+
+            def must_pause(is_refresh):
+                # Background refreshes never pause for debugging
+                return not IS_PRODUCTION and not is_refresh and not close_on_crash
+
+            def pause_to_debug(error):
+                if raise_exception:
+                    print_exception(type(error), error, error.__traceback__)
+
+                beep_input(
+                    "We've paused the browser to help you debug. Press 'Enter' to close.",
+                    beep,
+                )
+
+            def run_task(
+                data,
+                retry_attempt,
+                is_refresh=False,
+            ) -> Any:
+                if cache is True and not is_refresh:
+                    # Returns {"data": value} or None
+                    cached, is_stale = get_cached(storage, fn_name, data, expires_in, stale_while_revalidate, known_misses)
+                    if cached is not None:
+                        if is_stale:
+                            # Serve the stale value now, and refresh it in the background
+                            schedule_refresh(fn_name, data, lambda: run_task(data, 0, is_refresh=True))
+                        return cached["data"]
 
-                    
+                reqs = create_task_request(data)
+
+                result = None
+                try:
+                    return store_result(data, call_func(reqs, data))
+                except Exception as error:
+                    if should_retry(error, data, retry_attempt):
+                        if retry_wait:
+                            from time import sleep
 
+                            sleep(retry_wait)
+                        return run_task(data, retry_attempt + 1, is_refresh)
+
+                    if must_pause(is_refresh):
+                        pause_to_debug(error)
                     if raise_exception:
                         raise error
 
                     return result
 
+            async def run_task_async(
+                data,
+                retry_attempt,
+                is_refresh=False,
+            ) -> Any:
+                import asyncio
+                # Cache storages are blocking, so they are used from the event loop's thread pool
+                loop = asyncio.get_running_loop()
+                if cache is True and not is_refresh:
+                    cached, is_stale = await loop.run_in_executor(
+                        None, get_cached, storage, fn_name, data, expires_in, stale_while_revalidate, known_misses
+                    )
+                    if cached is not None:
+                        if is_stale:
+                            # The refresh runs in a background thread, on an event loop of its own
+                            schedule_refresh(fn_name, data, lambda: asyncio.run(run_task_async(data, 0, is_refresh=True)))
+                        return cached["data"]
+
+                reqs = AsyncRequest(create_task_request(data))
+
+                try:
+                    result = await call_func(reqs, data)
+                    return await loop.run_in_executor(None, store_result, data, result)
+                except Exception as error:
+                    # should_retry reports the exception being handled, so it is called here
+                    failure, retry = error, should_retry(error, data, retry_attempt)
+
+                # Waits and retries happen outside of the except block, so failed attempts aren't chained to each other
+                if retry:
+                    if retry_wait:
+                        await asyncio.sleep(retry_wait)
+                    return await run_task_async(data, retry_attempt + 1, is_refresh)
+
+                if must_pause(is_refresh):
+                    # beep_input blocks until Enter is pressed, so it runs in a thread to keep the event loop running
+                    await loop.run_in_executor(None, pause_to_debug, failure)
+                if raise_exception:
+                    raise failure
+
+                return None
+
+            def run_items_async(items, n):
+                """Runs the async def func over items with at most n of them in flight, on a new event loop."""
+                import asyncio
+                from concurrent.futures import ThreadPoolExecutor
+
+                async def run_all():
+                    loop = asyncio.get_running_loop()
+                    results = [None] * len(items)
+                    # Duplicate inputs running at the same time share one task
+                    in_flight = {}
+                    # Threads holding file locks wait on tasks which use the default pool, so they get a pool of their own
+                    lock_executor = ThreadPoolExecutor(max_workers=min(n, get_io_workers())) if single_flight == "cross_process" else None
+
+                    def run_item_async(data_item):
+                        if not (single_flight and cache is True):
+                            return run_task_async(data_item, 0)
+
+                        key = Cache.hash(data_item)
+                        task = in_flight.get(key)
+                        if task is None:
+                            if single_flight == "cross_process":
+                                # The file lock is held by a pool thread while the task runs on this loop
+                                coroutine = loop.run_in_executor(
+                                    lock_executor, run_with_file_lock, fn_name, key,
+                                    lambda: asyncio.run_coroutine_threadsafe(run_task_async(data_item, 0), loop).result(),
+                                )
+                            else:
+                                coroutine = run_task_async(data_item, 0)
+                            task = in_flight[key] = asyncio.ensure_future(coroutine)
+                            task.add_done_callback(lambda _, key=key: in_flight.pop(key, None))
+                        return task
+
+                    indexed_items = iter(enumerate(items))
+
+                    async def worker():
+                        # Workers share the iterator, so only n tasks are alive however many items there are
+                        for index, data_item in indexed_items:
+                            results[index] = await run_item_async(data_item)
+
+                    try:
+                        await asyncio.gather(*(worker() for _ in range(n)))
+                    finally:
+                        if lock_executor is not None:
+                            lock_executor.shutdown(wait=False)
+                    return results
+
+                return asyncio.run(run_all())
+
+            def run_item(data_item):
+                if single_flight and cache is True:
+                    # Duplicate inputs running at the same time share one execution
+                    return run_single_flight(
+                        fn_name, data_item, lambda: run_task(data_item, 0), single_flight == "cross_process"
+                    )
+                return run_task(data_item, 0)
+
             number_of_workers = parallel() if callable(parallel) else parallel
 
             if number_of_workers is not None and not isinstance(number_of_workers, int):
@@ -173,6 +309,22 @@ def request(
 
             used_data = args[0] if len(args) > 0 else data
             used_data = used_data() if callable(used_data) else used_data
+
+            if stream:
+                if is_async_func:
+                    raise ValueError("The option 'stream' cannot be applied to async def functions.")
+                # Results are yielded and written as they complete, so the input can be a generator of any size
+                known_misses = set()
+                stream_input = iter_stream_input(used_data)
+                if cache is True and not stale_while_revalidate:
+                    entries = iter_partitioned(
+                        storage, fn_name, stream_input, expires_in, known_misses, keep_misses=single_flight != "cross_process"
+                    )
+                else:
+                    entries = ((data_item, False, None) for data_item in stream_input)
+                n = int(number_of_workers) if number_of_workers and number_of_workers > 1 else 1
+                return stream_results(run_item, entries, n, stream == "ordered", output, output_formats, fn_name)
+
             orginal_data = used_data
 
             return_first = False
@@ -180,6 +332,17 @@ def request(
                 return_first = True
                 used_data = [used_data]
 
+            results_by_index, known_misses = {}, None
+            # Stale items are read with their age when their task runs, as reading them expired would delete them
+            if cache is True and not stale_while_revalidate:
+                # Cached inputs are resolved in bulk before any worker starts, so only misses take a worker.
+                # Misses are read again when another process may cache them first.
+                results_by_index, known_misses = partition_cached(
+                    storage, fn_name, used_data, expires_in, keep_misses=single_flight != "cross_process"
+                )
+            missed_indices = [index for index in range(len(used_data)) if index not in results_by_index]
+            missed_data = [used_data[index] for index in missed_indices]
+
             result = []
 
             has_number_of_workers = number_of_workers is not None and not (
@@ -189,24 +352,30 @@ def request(
             if not has_number_of_workers or number_of_workers <= 1:
                 n = 1
             else:
-                n = min(len(used_data), int(number_of_workers))
-
-            if n <= 1:
-                for index in range(len(used_data)):
-                    data_item = used_data[index]
-                    current_result = run_task(data_item, 0)
+                n = min(len(missed_data), int(number_of_workers))
+
+            if is_async_func:
+                # One event loop runs the misses, so n only bounds the requests in flight, not the threads
+                result = run_items_async(missed_data, max(n, 1))
+            elif n <= 1:
+                for data_item in missed_data:
+                    current_result = run_item(data_item)
                     result.append(current_result)
             else:
 
                 def run(data_item):
-                    current_result = run_task(data_item, 0)
+                    current_result = run_item(data_item)
                     return current_result
 
 
                 if callable(parallel):
                     print(f"Running {n} Requests in Parallel")
 
-                result = run_parallel(run, used_data, n, True)
+                result = run_parallel(run, missed_data, n, True)
+
+            # Merges the results of misses with the cached ones, in input order
+            results_by_index.update(zip(missed_indices, result))
+            result = [results_by_index[index] for index in range(len(used_data))]
 
 
             if return_first:
@@ -230,6 +399,10 @@ def request(
             raise ValueError(
                 "The options 'run_async' and 'async_queue' cannot be applied at the same time. Please set only one of them to True."
             )
+        if stream and async_queue:
+            raise ValueError(
+                "The options 'stream' and 'async_queue' cannot be applied at the same time. Please set only one of them to True."
+            )
 
         if run_async:
 
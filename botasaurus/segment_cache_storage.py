@@ -0,0 +1,366 @@
+import atexit
+import json
+import mmap
+import os
+import struct
+import zlib
+from datetime import timedelta
+from threading import Event, RLock, Thread
+from time import time
+from typing import Any, Dict, Optional
+
+from .cache import SEGMENT_MARKER, Cache, write_atomic
+from .cache_codecs import decode_cache_item, encode_cache_item, get_codec
+from .cache_stats import note_bytes_read, note_bytes_written, note_expired
+from .decorators_utils import create_directory_if_not_exists, relative_path
+
+__all__ = ['SegmentCacheStorage']
+
+# magic, flags, key length, value length, created_at, crc32 of key + value
+RECORD_HEADER = struct.Struct("<4sBHIdI")
+RECORD_MAGIC = b"BTSR"
+FLAG_TOMBSTONE = 1
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+INDEX_FILENAME = "index.json"
+
+
+def _segment_name(segment_id):
+    return f"{SEGMENT_PREFIX}{segment_id:06d}{SEGMENT_SUFFIX}"
+
+
+class SegmentCacheStorage:
+    """
+    Cache storage which appends items to a few large segment files instead of writing one file per item.
+
+    An in-memory index maps every key to the position of its latest value. It is saved to index.json
+    on close and periodically, and rebuilt from the segments if it is missing. Deleted, overwritten
+    and expired items are removed by a background compaction, which rewrites mostly dead segments.
+    Values are read through mmap.
+
+    A segment directory must only be used by one process at a time.
+
+    Example:
+        @request(cache=True, cache_storage=SegmentCacheStorage("segment_cache"))
+    """
+
+    def __init__(
+        self,
+        directory: str = "segment_cache",
+        max_segment_size: int = 256 * 1024 * 1024,
+        compression=None,
+        expires_in: Optional[timedelta] = None,
+        compaction_threshold: float = 0.5,
+        compaction_interval: Optional[float] = 60,
+        fsync: bool = False,
+    ):
+        """
+        Args:
+            directory: Folder holding the segments and the index.
+            max_segment_size: Size after which a new segment is started.
+            compression: None, "gzip", "zstd" or a codec from botasaurus.cache_codecs.
+            expires_in: Items older than this are dropped by compaction.
+            compaction_threshold: Fraction of dead bytes above which a segment is rewritten.
+            compaction_interval: Seconds between background compactions, None to only compact when compact() is called.
+            fsync: Flush every write to disk.
+        """
+        self.directory = relative_path(directory)
+        self.max_segment_size = max_segment_size
+        self.compression = compression
+        self.expires_in = expires_in
+        self.compaction_threshold = compaction_threshold
+        self.fsync = fsync
+
+        # key -> (segment_id, value offset, value length, created_at)
+        self._index: Dict[str, tuple] = {}
+        # segment_id -> {"size": bytes indexed, "dead": bytes of records no longer in use}
+        self._segments: Dict[int, dict] = {}
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._active_id = None
+        self._active_file = None
+        self._lock = RLock()
+        self._closed = False
+
+        create_directory_if_not_exists(self.directory + "/")
+        # Marks the directory, so the file cache never takes it for the cache of a function
+        open(os.path.join(self.directory, SEGMENT_MARKER), "a").close()
+        self._load()
+
+        self._stop = Event()
+        self._compaction_thread = None
+        if compaction_interval:
+            self._compaction_thread = Thread(target=self._compact_periodically, args=(compaction_interval,), daemon=True)
+            self._compaction_thread.start()
+        atexit.register(self.close)
+
+    def _make_key(self, func_name: str, key_data) -> str:
+        # Same hash as the file cache, which allows copying items between both
+        return f"{func_name}/{Cache.hash(key_data)}"
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, _segment_name(segment_id))
+
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    # Loading
+
+    def _list_segment_ids(self):
+        ids = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                ids.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(ids)
+
+    def _load(self):
+        segment_ids = self._list_segment_ids()
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as fp:
+                saved = json.load(fp)
+            self._index = {key: tuple(value) for key, value in saved["entries"].items()}
+            self._segments = {int(segment_id): info for segment_id, info in saved["segments"].items()}
+        except (FileNotFoundError, ValueError, KeyError):
+            self._index = {}
+            self._segments = {}
+
+        # Drop what the saved index knows about missing segments, then catch up with records written after it was saved
+        for segment_id in list(self._segments):
+            if segment_id not in segment_ids:
+                del self._segments[segment_id]
+        self._index = {key: value for key, value in self._index.items() if value[0] in self._segments}
+
+        for segment_id in segment_ids:
+            info = self._segments.setdefault(segment_id, {"size": 0, "dead": 0})
+            self._scan_segment(segment_id, info["size"])
+
+        if segment_ids:
+            self._open_active(segment_ids[-1])
+        else:
+            self._open_active(1)
+
+    def _iter_records(self, segment_id, start=0):
+        """Yields (offset, flags, key, value offset, value length, created_at, record length) of complete records."""
+        path = self._segment_path(segment_id)
+        with open(path, "rb") as fp:
+            fp.seek(start)
+            offset = start
+            while True:
+                header = fp.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                magic, flags, key_length, value_length, created_at, crc = RECORD_HEADER.unpack(header)
+                if magic != RECORD_MAGIC:
+                    break
+                body = fp.read(key_length + value_length)
+                if len(body) < key_length + value_length or zlib.crc32(body) != crc:
+                    break
+                key = body[:key_length].decode("utf-8")
+                value_offset = offset + RECORD_HEADER.size + key_length
+                record_length = RECORD_HEADER.size + key_length + value_length
+                yield offset, flags, key, value_offset, value_length, created_at, record_length
+                offset += record_length
+
+    def _scan_segment(self, segment_id, start):
+        info = self._segments[segment_id]
+        end = start
+        for offset, flags, key, value_offset, value_length, created_at, record_length in self._iter_records(segment_id, start):
+            self._mark_dead(key)
+            if flags & FLAG_TOMBSTONE:
+                self._index.pop(key, None)
+                info["dead"] += record_length
+            else:
+                self._index[key] = (segment_id, value_offset, value_length, created_at)
+            end = offset + record_length
+
+        # A partially written record is left behind if the process was killed while appending
+        if os.path.getsize(self._segment_path(segment_id)) > end:
+            with open(self._segment_path(segment_id), "r+b") as fp:
+                fp.truncate(end)
+        info["size"] = end
+
+    def _mark_dead(self, key):
+        previous = self._index.get(key)
+        if previous is not None:
+            segment_id, value_offset, value_length, _ = previous
+            key_length = len(key.encode("utf-8"))
+            self._segments[segment_id]["dead"] += RECORD_HEADER.size + key_length + value_length
+
+    def _open_active(self, segment_id):
+        if self._active_file is not None:
+            self._active_file.close()
+        self._active_id = segment_id
+        self._segments.setdefault(segment_id, {"size": 0, "dead": 0})
+        self._active_file = open(self._segment_path(segment_id), "ab")
+
+    # Writing
+
+    def _append(self, flags, key, value, created_at):
+        key_bytes = key.encode("utf-8")
+        body = key_bytes + value
+        header = RECORD_HEADER.pack(RECORD_MAGIC, flags, len(key_bytes), len(value), created_at, zlib.crc32(body))
+
+        if self._segments[self._active_id]["size"] >= self.max_segment_size:
+            self._open_active(self._active_id + 1)
+
+        info = self._segments[self._active_id]
+        offset = info["size"]
+        self._active_file.write(header + body)
+        self._active_file.flush()
+        if self.fsync:
+            os.fsync(self._active_file.fileno())
+        info["size"] += len(header) + len(body)
+        return self._active_id, offset + len(header) + len(key_bytes)
+
+    def _append_tombstone(self, key):
+        self._mark_dead(key)
+        self._index.pop(key, None)
+        segment_id, _ = self._append(FLAG_TOMBSTONE, key, b"", time())
+        key_length = len(key.encode("utf-8"))
+        self._segments[segment_id]["dead"] += RECORD_HEADER.size + key_length
+
+    # Reading
+
+    def _read(self, segment_id, value_offset, value_length):
+        mapped = self._maps.get(segment_id)
+        if mapped is None or len(mapped) < value_offset + value_length:
+            # The active segment grows, so its map is recreated when reading past its end
+            if mapped is not None:
+                mapped.close()
+            with open(self._segment_path(segment_id), "rb") as fp:
+                mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment_id] = mapped
+        return mapped[value_offset:value_offset + value_length]
+
+    def _is_expired(self, created_at, expires_in):
+        return expires_in is not None and time() - created_at > expires_in.total_seconds()
+
+    def get(self, func_name: str, key_data, expires_in: Optional[timedelta] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns:
+            {"data": value} if cache hit (value can be None)
+            None if cache miss or expired
+        """
+        key = self._make_key(func_name, key_data)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            segment_id, value_offset, value_length, created_at = entry
+            if self._is_expired(created_at, expires_in):
+                self._append_tombstone(key)
+                note_expired()
+                return None
+            value = self._read(segment_id, value_offset, value_length)
+        note_bytes_read(value_length)
+        return {"data": decode_cache_item(value)}
+
+    def get_with_age(self, func_name: str, key_data) -> Optional[Dict[str, Any]]:
+        """Returns {"data": value, "age": seconds since it was cached}, or None if not cached."""
+        key = self._make_key(func_name, key_data)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            segment_id, value_offset, value_length, created_at = entry
+            value = self._read(segment_id, value_offset, value_length)
+        note_bytes_read(value_length)
+        return {"data": decode_cache_item(value), "age": time() - created_at}
+
+    def put(self, func_name: str, key_data, data: Any) -> None:
+        key = self._make_key(func_name, key_data)
+        value = encode_cache_item(data, get_codec(self.compression))
+        note_bytes_written(len(value))
+        created_at = time()
+        with self._lock:
+            self._mark_dead(key)
+            segment_id, value_offset = self._append(0, key, value, created_at)
+            self._index[key] = (segment_id, value_offset, len(value), created_at)
+
+    def delete(self, func_name: str, key_data) -> None:
+        key = self._make_key(func_name, key_data)
+        with self._lock:
+            if key in self._index:
+                self._append_tombstone(key)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._index)
+
+    # Maintenance
+
+    def save_index(self):
+        with self._lock:
+            saved = {
+                "segments": {str(segment_id): info for segment_id, info in self._segments.items()},
+                "entries": self._index,
+            }
+            write_atomic(json.dumps(saved).encode("utf-8"), self._index_path())
+
+    def _drop_expired(self):
+        if self.expires_in is None:
+            return
+        expired = [key for key, entry in self._index.items() if self._is_expired(entry[3], self.expires_in)]
+        for key in expired:
+            self._append_tombstone(key)
+
+    def compact(self):
+        """Rewrite segments whose dead bytes exceed the compaction threshold. Returns the number of bytes freed."""
+        freed = 0
+        with self._lock:
+            self._drop_expired()
+            candidates = [
+                segment_id for segment_id, info in self._segments.items()
+                if segment_id != self._active_id and info["size"] and info["dead"] / info["size"] >= self.compaction_threshold
+            ]
+
+        for segment_id in candidates:
+            with self._lock:
+                freed += self._compact_segment(segment_id)
+        if candidates:
+            self.save_index()
+        return freed
+
+    def _compact_segment(self, segment_id):
+        has_older_segments = any(other < segment_id for other in self._segments)
+        for _, flags, key, value_offset, value_length, created_at, _ in self._iter_records(segment_id):
+            if flags & FLAG_TOMBSTONE:
+                # Tombstones must survive while an older segment may still hold the deleted value
+                if has_older_segments and key not in self._index:
+                    self._append(FLAG_TOMBSTONE, key, b"", created_at)
+                continue
+            if self._index.get(key) == (segment_id, value_offset, value_length, created_at):
+                value = self._read(segment_id, value_offset, value_length)
+                new_segment_id, new_value_offset = self._append(0, key, value, created_at)
+                self._index[key] = (new_segment_id, new_value_offset, value_length, created_at)
+
+        mapped = self._maps.pop(segment_id, None)
+        if mapped is not None:
+            mapped.close()
+        freed = self._segments.pop(segment_id)["size"]
+        os.remove(self._segment_path(segment_id))
+        return freed
+
+    def _compact_periodically(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.compact()
+                self.save_index()
+            except Exception as e:
+                print(f"Segment cache compaction failed: {e}")
+
+    def close(self):
+        """Save the index and release the segment files."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            self._compaction_thread.join()
+        with self._lock:
+            self.save_index()
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self._active_file.close()
+        atexit.unregister(self.close)
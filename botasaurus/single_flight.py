@@ -0,0 +1,69 @@
+import os
+from threading import Event, Lock
+from .file_lock import file_lock
+
+# Inputs are spread over this many lock files per function, so the number of files stays bounded
+LOCK_FILE_STRIPES_HEX_LENGTH = 4
+LOCKS_DIRECTORY = ".locks"
+
+_calls = {}
+_calls_lock = Lock()
+
+
+class _Call:
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+def run_with_file_lock(fn_name, data_hash, fn):
+    """
+    Runs fn() holding the lock file of data_hash, so processes sharing the cache directory run it one at a time.
+    Blocks until the lock is acquired, so async code should call it from a thread.
+    """
+    from .cache import Cache
+    from .utils import relative_path
+
+    directory = relative_path(os.path.join(Cache.cache_directory, fn_name, LOCKS_DIRECTORY))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, data_hash[:LOCK_FILE_STRIPES_HEX_LENGTH] + ".lock")
+    with file_lock(path):
+        return fn()
+
+
+def run_single_flight(fn_name, data, fn, cross_process=False):
+    """
+    Runs fn() once for concurrent calls with the same function name and input, all callers getting its result.
+    fn is expected to read the cache first, so with cross_process, a process waiting on the lock of another
+    process gets the item it cached.
+    """
+    from .cache import Cache
+    data_hash = Cache.hash(data)
+    key = (fn_name, data_hash)
+
+    with _calls_lock:
+        call = _calls.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _calls[key] = _Call()
+
+    if not is_leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        if cross_process:
+            call.result = run_with_file_lock(fn_name, data_hash, fn)
+        else:
+            call.result = fn()
+        return call.result
+    except BaseException as error:
+        call.error = error
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
@@ -6,9 +6,11 @@ from .utils import is_errors_instance, NotFoundException
 from .beep_utils import beep_input
 from .list_utils import flatten
 
-from botasaurus.decorators_common import print_running, write_output, IS_PRODUCTION, AsyncQueueResult, AsyncResult,  run_parallel, save_error_logs
+from botasaurus.decorators_common import print_running, write_output, IS_PRODUCTION, AsyncQueueResult, AsyncResult,  run_parallel, save_error_logs, stream_results, iter_stream_input
 from .dontcache import is_dont_cache
-from .cache_storage import FileCacheStorage
+from .cache_storage import resolve_cache_storage
+from .cache_revalidation import get_cached, partition_cached, iter_partitioned, schedule_refresh
+from .single_flight import run_single_flight
 
 def task(
     _func: Optional[Callable] = None,
@@ -18,10 +20,13 @@ def task(
     metadata: Optional[Any] = None,
     cache: Union[bool, str] = False,
     expires_in: Optional[timedelta] = None,
+    stale_while_revalidate: Union[bool, timedelta] = False,
+    single_flight: Union[bool, str] = False,
     cache_storage=None,
     beep: bool = False,
     run_async: bool = False,
     async_queue: bool = False,
+    stream: Union[bool, str] = False,
     close_on_crash: bool = False,
     output: Optional[Union[str, Callable]] = "default",
     output_formats: Optional[List[str]] = None,
@@ -39,18 +44,21 @@ def task(
         def wrapper_requests(*args, **kwargs) -> Any:
             print_running()
 
-            nonlocal parallel, data, cache, expires_in, cache_storage, beep, run_async, async_queue, metadata
+            nonlocal parallel, data, cache, expires_in, stale_while_revalidate, single_flight, cache_storage, beep, run_async, async_queue, stream, metadata
             nonlocal close_on_crash, output, output_formats, max_retry, retry_wait, must_raise_exceptions, raise_exception, create_error_logs
 
             parallel = kwargs.get("parallel", parallel)
             data = kwargs.get("data", data)
             cache = kwargs.get("cache", cache)
             expires_in = kwargs.get("expires_in", expires_in)
-            storage = kwargs.get("cache_storage", cache_storage) or FileCacheStorage
+            stale_while_revalidate = kwargs.get("stale_while_revalidate", stale_while_revalidate)
+            single_flight = kwargs.get("single_flight", single_flight)
+            storage = resolve_cache_storage(kwargs.get("cache_storage", cache_storage))
             beep = kwargs.get("beep", beep)
             run_async = kwargs.get("run_async", run_async)
             metadata = kwargs.get("metadata", metadata)
             async_queue = kwargs.get("async_queue", async_queue)
+            stream = kwargs.get("stream", stream)
             close_on_crash = kwargs.get("close_on_crash", close_on_crash)
             output = kwargs.get("output", output)
             output_formats = kwargs.get("output_formats", output_formats)
@@ -70,11 +78,15 @@ def task(
             def run_task(
                 data,
                 retry_attempt,
+                is_refresh=False,
             ) -> Any:
-                if cache is True:
+                if cache is True and not is_refresh:
                     # Returns {"data": value} or None
-                    cached = storage.get(fn_name, data, expires_in)
+                    cached, is_stale = get_cached(storage, fn_name, data, expires_in, stale_while_revalidate, known_misses)
                     if cached is not None:
+                        if is_stale:
+                            # Serve the stale value now, and refresh it in the background
+                            schedule_refresh(fn_name, data, lambda: run_task(data, 0, is_refresh=True))
                         return cached["data"]
                     
                 result = None
@@ -114,7 +126,7 @@ def task(
                             from time import sleep
                             print("Waiting for " + str(retry_wait) + " seconds")
                             sleep(retry_wait)
-                        return run_task(data, retry_attempt + 1)
+                        return run_task(data, retry_attempt + 1, is_refresh)
 
                     if not raise_exception:
                         print_exc()
@@ -124,7 +136,8 @@ def task(
                         save_error_logs(format_exc(), None)
 
                     
-                    if not IS_PRODUCTION:
+                    # Background refreshes never pause for debugging
+                    if not IS_PRODUCTION and not is_refresh:
                         if raise_exception:
                             print_exc()
 
@@ -141,6 +154,14 @@ def task(
 
                     return result
 
+            def run_item(data_item):
+                if single_flight and cache is True:
+                    # Duplicate inputs running at the same time share one execution
+                    return run_single_flight(
+                        fn_name, data_item, lambda: run_task(data_item, 0), single_flight == "cross_process"
+                    )
+                return run_task(data_item, 0)
+
             number_of_workers = parallel() if callable(parallel) else parallel
 
             if number_of_workers is not None and not isinstance(number_of_workers, int):
@@ -148,6 +169,20 @@ def task(
 
             used_data = args[0] if len(args) > 0 else data
             used_data = used_data() if callable(used_data) else used_data
+
+            if stream:
+                # Results are yielded and written as they complete, so the input can be a generator of any size
+                known_misses = set()
+                stream_input = iter_stream_input(used_data)
+                if cache is True and not stale_while_revalidate:
+                    entries = iter_partitioned(
+                        storage, fn_name, stream_input, expires_in, known_misses, keep_misses=single_flight != "cross_process"
+                    )
+                else:
+                    entries = ((data_item, False, None) for data_item in stream_input)
+                n = int(number_of_workers) if number_of_workers and number_of_workers > 1 else 1
+                return stream_results(run_item, entries, n, stream == "ordered", output, output_formats, fn_name)
+
             orginal_data = used_data
 
             return_first = False
@@ -155,6 +190,17 @@ def task(
                 return_first = True
                 used_data = [used_data]
 
+            results_by_index, known_misses = {}, None
+            # Stale items are read with their age when their task runs, as reading them expired would delete them
+            if cache is True and not stale_while_revalidate:
+                # Cached inputs are resolved in bulk before any worker starts, so only misses take a worker.
+                # Misses are read again when another process may cache them first.
+                results_by_index, known_misses = partition_cached(
+                    storage, fn_name, used_data, expires_in, keep_misses=single_flight != "cross_process"
+                )
+            missed_indices = [index for index in range(len(used_data)) if index not in results_by_index]
+            missed_data = [used_data[index] for index in missed_indices]
+
             result = []
 
             has_number_of_workers = number_of_workers is not None and not (
@@ -164,23 +210,26 @@ def task(
             if not has_number_of_workers or number_of_workers <= 1:
                 n = 1
             else:
-                n = min(len(used_data), int(number_of_workers))
+                n = min(len(missed_data), int(number_of_workers))
 
             if n <= 1:
-                for index in range(len(used_data)):
-                    data_item = used_data[index]
-                    current_result = run_task(data_item, 0)
+                for data_item in missed_data:
+                    current_result = run_item(data_item)
                     result.append(current_result)
             else:
 
                 def run(data_item):
-                    current_result = run_task(data_item, 0)
+                    current_result = run_item(data_item)
                     return current_result
 
                 if callable(parallel):
                     print(f"Running {n} Requests in Parallel")
 
-                result = run_parallel(run, used_data, n, True)
+                result = run_parallel(run, missed_data, n, True)
+
+            # Merges the results of misses with the cached ones, in input order
+            results_by_index.update(zip(missed_indices, result))
+            result = [results_by_index[index] for index in range(len(used_data))]
 
 
             if return_first:
@@ -204,6 +253,10 @@ def task(
             raise ValueError(
                 "The options 'run_async' and 'async_queue' cannot be applied at the same time. Please set only one of them to True."
             )
+        if stream and async_queue:
+            raise ValueError(
+                "The options 'stream' and 'async_queue' cannot be applied at the same time. Please set only one of them to True."
+            )
 
         if run_async:
 
@@ -284,4 +337,4 @@ def task(
     if _func is None:
         return decorator_requests
     else:
-        return decorator_requests(_func)
\ No newline at end of file
+        return decorator_requests(_func)
\ No newline at end of file
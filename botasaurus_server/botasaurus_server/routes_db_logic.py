@@ -468,9 +468,9 @@ def parallel_create_files(file_list):
     Parameters:
     file_list (list of dict): List of dictionaries with 'source_file' and 'destination_file' keys.
     """
-    from joblib import Parallel, delayed
+    from botasaurus.io_executor import map_io
 
-    Parallel(n_jobs=-1)(delayed(save)(file) for file in file_list)
+    map_io(save, file_list)
 
 def create_cache_details(cache_keys):
     existing_items = TaskResults.filter_items_in_cache(cache_keys)
@@ -5,6 +5,7 @@ import json
 import ndjson
 import os
 from botasaurus.cache import read_json, _has,_remove, _delete_items, write_json
+from botasaurus.io_executor import map_io, map_files
 from .utils import path_task_results_tasks,path_task_results_cache
 
 def _get(cache_path):
@@ -18,9 +19,7 @@ def _get(cache_path):
 
 
 def _read_json_files(file_paths):
-            from joblib import Parallel, delayed
-            results = Parallel(n_jobs=-1)(delayed(_get)(file_path) for file_path in file_paths)
-            return results
+            return map_files(_get, file_paths)
 
 def _get_task(id):
         task_path = os.path.join(path_task_results_tasks, str(id) + ".json")
@@ -45,10 +44,11 @@ def generate_cached_task_path(scraper_name, data):
 def get_files():
     return os.listdir(path_task_results_cache)
 
+def _read_cached_item(item):
+            return {"key":item, "result": _get( os.path.join(path_task_results_cache, item )) }
+
 def _read_json_files_dict(file_paths):
-            from joblib import Parallel, delayed
-            results = Parallel(n_jobs=-1)(delayed(lambda item: {"key":item, "result": _get( os.path.join(path_task_results_cache, item )) })(file_path) for file_path in file_paths)
-            return results
+            return map_io(_read_cached_item, file_paths)
 class TaskResults:
 
     @staticmethod
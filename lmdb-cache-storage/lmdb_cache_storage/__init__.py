@@ -0,0 +1,281 @@
+import atexit
+import json
+import struct
+from hashlib import sha256
+from threading import Lock
+from time import time
+
+from botasaurus.cache_codecs import CACHE_FILE_MAGIC, decode_cache_item, encode_cache_item, get_codec
+from botasaurus.cache_stats import note_bytes_read, note_bytes_written, note_expired
+
+__all__ = ['LmdbCacheStorage']
+
+# Each value is the time it was cached, followed by the JSON, or by the item encoded with botasaurus.cache_codecs when compressed
+CREATED_AT = struct.Struct("<d")
+_EXPIRED = object()
+
+
+class _LmdbBackend:
+    def __init__(self, path, map_size, max_readers, sync):
+        import lmdb
+        # metasync=False skips a flush of the meta page per commit, a crash can lose the last transactions but not corrupt the file
+        self.env = lmdb.open(
+            path, map_size=map_size, subdir=False, max_readers=max_readers, readahead=False, metasync=False, sync=sync
+        )
+
+    def read(self, keys, load):
+        results = []
+        # Values are memoryviews into the memory map, which are only valid during the transaction
+        with self.env.begin(buffers=True) as txn:
+            for key in keys:
+                value = txn.get(key)
+                results.append(None if value is None else load(value))
+        return results
+
+    def write(self, operations):
+        with self.env.begin(write=True) as txn:
+            for key, value in operations:
+                if value is None:
+                    txn.delete(key)
+                else:
+                    txn.put(key, value)
+
+    def rename(self, renames):
+        moved = 0
+        with self.env.begin(write=True) as txn:
+            for key, old_key in renames:
+                value = txn.get(old_key)
+                if value is not None and txn.get(key) is None:
+                    txn.put(key, value)
+                    txn.delete(old_key)
+                    moved += 1
+        return moved
+
+    def count(self):
+        return self.env.stat()["entries"]
+
+    def clear(self):
+        with self.env.begin(write=True) as txn:
+            txn.drop(self.env.open_db(), delete=False)
+
+    def close(self):
+        self.env.close()
+
+
+class _DbmBackend:
+    """Used when lmdb is not installed. Access is serialized and the file can't be shared between processes."""
+
+    def __init__(self, path):
+        import dbm
+        self.db = dbm.open(path, "c")
+        self.lock = Lock()
+
+    def _get(self, key):
+        try:
+            return self.db[key]
+        except KeyError:
+            return None
+
+    def read(self, keys, load):
+        with self.lock:
+            values = [self._get(key) for key in keys]
+        return [None if value is None else load(memoryview(value)) for value in values]
+
+    def write(self, operations):
+        with self.lock:
+            for key, value in operations:
+                if value is None:
+                    try:
+                        del self.db[key]
+                    except KeyError:
+                        pass
+                else:
+                    self.db[key] = value
+
+    def rename(self, renames):
+        moved = 0
+        with self.lock:
+            for key, old_key in renames:
+                value = self._get(old_key)
+                if value is not None and self._get(key) is None:
+                    self.db[key] = value
+                    del self.db[old_key]
+                    moved += 1
+        return moved
+
+    def count(self):
+        with self.lock:
+            return len(self.db)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.db.keys()):
+                del self.db[key]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class LmdbCacheStorage:
+    """Embedded cache storage using LMDB, or the stdlib dbm when lmdb is not installed."""
+
+    def __init__(self, path: str = 'cache.lmdb', map_size: int = 10 * 1024 ** 3, compression=None, key_hashing=None,
+                 max_readers: int = 126, sync: bool = True, backend=None):
+        """
+        Args:
+            path: The database file. LMDB also creates a lock file next to it.
+            map_size: Maximum size of the LMDB database in bytes, after which puts raise lmdb.MapFullError.
+                      Only the used part takes disk space, except on Windows. Pass a larger value to grow an existing database.
+            compression: None to store plain JSON, or "gzip", "zstd" or a codec like ZstdCodec(level=10)
+                         from botasaurus.cache_codecs.
+            key_hashing: None to follow Cache.set_key_hashing, or "legacy" or "canonical".
+            max_readers: Maximum number of threads and processes reading the LMDB database at the same time.
+            sync: If False, LMDB commits don't wait for the disk, which makes single puts much faster,
+                  but a system crash can lose recent items or corrupt the database.
+            backend: "lmdb", "dbm", or None to use lmdb if it is installed and dbm otherwise.
+        """
+        self.path = path
+        self.compression = compression
+        self.key_hashing = key_hashing
+        if backend is None:
+            try:
+                import lmdb  # noqa: F401
+                backend = "lmdb"
+            except ImportError:
+                backend = "dbm"
+        if backend == "lmdb":
+            self._backend = _LmdbBackend(path, map_size, max_readers, sync)
+        elif backend == "dbm":
+            self._backend = _DbmBackend(path)
+        else:
+            raise ValueError(f'Unknown backend "{backend}". Use one of: lmdb, dbm')
+        self.backend = backend
+        self._closed = False
+        atexit.register(self.close)
+
+    def _get_key_hashing(self):
+        if self.key_hashing is not None:
+            return self.key_hashing
+        from botasaurus.cache import Cache
+        return Cache.key_hashing
+
+    def _migrates_keys_on_read(self):
+        from botasaurus.cache import Cache
+        return self._get_key_hashing() == "canonical" and Cache.migrate_keys_on_read
+
+    def _hash(self, data, key_hashing=None) -> str:
+        """Generate sha256 hash from data, or blake2b of its canonical form."""
+        if (key_hashing or self._get_key_hashing()) == "canonical":
+            from botasaurus.cache_keys import canonical_hash
+            return canonical_hash(data, digest_size=32)
+        serialized = json.dumps(data).encode('utf-8')
+        return sha256(serialized).hexdigest()
+
+    def _make_key(self, func_name: str, key_data, key_hashing=None) -> bytes:
+        """Create cache key from func_name and key_data."""
+        return self._hash([func_name, key_data], key_hashing).encode('ascii')
+
+    def _encode(self, data, created_at):
+        if self.compression is None:
+            payload = json.dumps(data).encode('utf-8')
+        else:
+            payload = encode_cache_item(data, get_codec(self.compression))
+        note_bytes_written(len(payload))
+        return CREATED_AT.pack(created_at) + payload
+
+    def _loader(self, expires_in, read_data=True):
+        """Returns a function turning a stored value into (data, age), or _EXPIRED."""
+        now = time()
+        max_age = expires_in.total_seconds() if expires_in is not None else None
+
+        def load(value):
+            age = now - CREATED_AT.unpack_from(value)[0]
+            if max_age is not None and age > max_age:
+                return _EXPIRED
+            if not read_data:
+                return None, age
+            payload = value[CREATED_AT.size:]
+            note_bytes_read(len(payload))
+            if payload[:len(CACHE_FILE_MAGIC)] == CACHE_FILE_MAGIC:
+                return decode_cache_item(bytes(payload)), age
+            # Decoded straight from the memory map, without copying the JSON into bytes first
+            return json.loads(str(payload, 'utf-8')), age
+        return load
+
+    def _read(self, func_name, items, expires_in, read_data=True):
+        """Returns (data, age) or None for each of items, deleting the expired ones."""
+        key_hashing = self._get_key_hashing()
+        keys = [self._make_key(func_name, key_data, key_hashing) for key_data in items]
+        results = self._backend.read(keys, self._loader(expires_in, read_data))
+
+        missed = [key_data for key_data, result in zip(items, results) if result is None]
+        if missed and self._migrates_keys_on_read() and self.migrate_keys(func_name, missed):
+            missed_indexes = [index for index, result in enumerate(results) if result is None]
+            reread = self._backend.read([keys[index] for index in missed_indexes], self._loader(expires_in, read_data))
+            for index, result in zip(missed_indexes, reread):
+                results[index] = result
+
+        expired = [key for key, result in zip(keys, results) if result is _EXPIRED]
+        if expired:
+            self._backend.write([(key, None) for key in expired])
+            note_expired(len(expired))
+        return [None if result is _EXPIRED else result for result in results]
+
+    def get(self, func_name: str, key_data, expires_in=None):
+        """
+        Returns:
+            {"data": value} if cache hit (value can be None)
+            None if cache miss or expired
+        """
+        result = self._read(func_name, [key_data], expires_in)[0]
+        return None if result is None else {"data": result[0]}
+
+    def get_with_age(self, func_name: str, key_data):
+        """Returns {"data": value, "age": seconds since it was cached}, or None if not cached."""
+        result = self._read(func_name, [key_data], None)[0]
+        return None if result is None else {"data": result[0], "age": result[1]}
+
+    def put(self, func_name: str, key_data, data) -> None:
+        self.put_many(func_name, [(key_data, data)])
+
+    def delete(self, func_name: str, key_data) -> None:
+        self.delete_many(func_name, [key_data])
+
+    def get_many(self, func_name: str, items, expires_in=None):
+        """Returns the result of get for each of items, in order, read in one transaction."""
+        return [None if result is None else {"data": result[0]} for result in self._read(func_name, list(items), expires_in)]
+
+    def has_many(self, func_name: str, items, expires_in=None):
+        """Returns whether each of items is cached and not expired, without decoding the data."""
+        return [result is not None for result in self._read(func_name, list(items), expires_in, read_data=False)]
+
+    def put_many(self, func_name: str, entries) -> None:
+        """Stores each (key_data, data) of entries in one transaction."""
+        created_at, key_hashing = time(), self._get_key_hashing()
+        self._backend.write([(self._make_key(func_name, key_data, key_hashing), self._encode(data, created_at)) for key_data, data in entries])
+
+    def delete_many(self, func_name: str, items) -> None:
+        key_hashing = self._get_key_hashing()
+        self._backend.write([(self._make_key(func_name, key_data, key_hashing), None) for key_data in items])
+
+    def migrate_keys(self, func_name: str, items) -> int:
+        """Move the values cached under the legacy keys of items to their canonical keys. Returns the number of moved values."""
+        return self._backend.rename([
+            (self._make_key(func_name, item, "canonical"), self._make_key(func_name, item, "legacy")) for item in items
+        ])
+
+    def count(self) -> int:
+        """Returns the number of cached items."""
+        return self._backend.count()
+
+    def clear(self) -> None:
+        """Delete all cached items."""
+        self._backend.clear()
+
+    def close(self) -> None:
+        """Closes the database. Called at exit."""
+        if not self._closed:
+            self._closed = True
+            self._backend.close()
+            atexit.unregister(self.close)
@@ -1,23 +1,66 @@
+import atexit
 import json
 from hashlib import sha256
+from threading import Event, Thread
+from time import sleep
+from traceback import print_exc
+from typing import Optional
+
+from botasaurus.cache_codecs import decode_cache_item, encode_cache_item, get_codec
+from botasaurus.cache_stats import note_bytes_read, note_bytes_written, note_expired
 
 __all__ = ['PostgresCacheStorage']
 
+# Rows deleted per transaction by purge_expired, so the table is not locked for long
+PURGE_BATCH_SIZE = 10000
+STORAGE_FORMATS = ("text", "jsonb", "bytea")
+# Rows converted per transaction by migrate_storage_format
+MIGRATE_BATCH_SIZE = 1000
+# Keys per ANY(%s) query, which sends them as a single array parameter, cast to the key type so the index is used
+MAX_KEYS_PER_QUERY = 10000
+
 
 class PostgresCacheStorage:
     """PostgreSQL cache storage using psycopg3."""
     
-    def __init__(self, host: str='localhost', port: int=5432, username: str='postgres', password: str='postgres', db_name: str='cache', table_name: str = "botasaurus_cache"):
+    def __init__(self, host: str='localhost', port: int=5432, username: str='postgres', password: str='postgres', db_name: str='cache', table_name: str = "botasaurus_cache", compression=None, key_hashing=None,
+                 pool: bool = False, min_size: int = 1, max_size: int = 10, prepare_threshold: Optional[int] = 5,
+                 storage_format: Optional[str] = None):
+        """
+        Args:
+            compression: None to store plain JSON, or "gzip", "zstd" or a codec like ZstdCodec(level=10) 
+                         from botasaurus.cache_codecs. Compressed values are stored in the data_bin BYTEA column.
+            pool: If True, operations borrow connections from a psycopg_pool.ConnectionPool of min_size to max_size
+                  connections, checked before each use, instead of connecting each time.
+            prepare_threshold: With pool, the number of times a query runs on a connection before it is prepared
+                               on the server. None disables prepared statements, as needed behind PgBouncer in transaction mode.
+            storage_format: "text" stores JSON in the data TEXT column, "jsonb" in the data_jsonb JSONB column,
+                            which can be queried on the server but doesn't keep the order of dict keys, and
+                            "bytea" stores items encoded with compression
+                            in the data_bin BYTEA column. None uses "bytea" with compression, and "text" otherwise.
+        """
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.db_name = db_name
         self.table_name = table_name
+        if storage_format is None:
+            storage_format = "text" if compression is None else "bytea"
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f'Unknown storage_format "{storage_format}". Use one of: text, jsonb, bytea')
+        if storage_format == "jsonb" and compression is not None:
+            raise ValueError('storage_format "jsonb" is compressed by PostgreSQL, so compression must be None')
+        self.storage_format = storage_format
+        self.compression = compression
+        self.key_hashing = key_hashing
+        self.prepare_threshold = prepare_threshold
+        self._sweeper = None
         self._ensure_database()
+        self._pool = self._create_pool(min_size, max_size) if pool else None
         self._ensure_table()
     
-    def _get_admin_connection(self):
+    def _get_admin_connection(self, dbname='postgres'):
         """Connect to postgres database to perform admin operations."""
         import psycopg
         return psycopg.connect(
@@ -25,7 +68,7 @@ class PostgresCacheStorage:
             port=self.port,
             user=self.username,
             password=self.password,
-            dbname='postgres',
+            dbname=dbname,
             autocommit=True
         )
     
@@ -41,7 +84,31 @@ class PostgresCacheStorage:
                 # Create database (must be outside transaction, hence autocommit=True)
                 conn.execute(f'CREATE DATABASE "{self.db_name}"')
     
+    def _create_pool(self, min_size, max_size):
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise ImportError("pool=True requires the psycopg-pool package. Install it using: python -m pip install pg-cache-storage[pool]")
+        from psycopg.conninfo import make_conninfo
+        from psycopg.rows import dict_row
+
+        pool = ConnectionPool(
+            make_conninfo(host=self.host, port=self.port, user=self.username, password=self.password, dbname=self.db_name),
+            min_size=min_size,
+            max_size=max_size,
+            kwargs={"row_factory": dict_row, "prepare_threshold": self.prepare_threshold},
+            # Replaces connections dropped by the server, like idle connections closed by Cloud SQL
+            check=ConnectionPool.check_connection,
+            open=False,
+        )
+        pool.open(wait=True)
+        atexit.register(self.close)
+        return pool
+
     def _get_connection(self):
+        """Returns a context manager yielding a connection, which commits and closes it or returns it to the pool."""
+        if self._pool is not None:
+            return self._pool.connection()
         import psycopg
         from psycopg.rows import dict_row
         return psycopg.connect(
@@ -52,15 +119,60 @@ class PostgresCacheStorage:
             dbname=self.db_name,
             row_factory=dict_row
         )
+
+    def close(self) -> None:
+        """Stops the expiry sweeper and closes the connections of the pool. Called at exit when pool is enabled."""
+        self.stop_expiry_sweeper()
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.close()
+            atexit.unregister(self.close)
     
-    def _hash(self, data) -> str:
-        """Generate sha256 hash from data."""
+    def _get_key_hashing(self):
+        if self.key_hashing is not None:
+            return self.key_hashing
+        from botasaurus.cache import Cache
+        return Cache.key_hashing
+
+    def _migrates_keys_on_read(self):
+        from botasaurus.cache import Cache
+        return self._get_key_hashing() == "canonical" and Cache.migrate_keys_on_read
+
+    def _hash(self, data, key_hashing=None) -> str:
+        """Generate sha256 hash from data, or blake2b of its canonical form."""
+        if (key_hashing or self._get_key_hashing()) == "canonical":
+            from botasaurus.cache_keys import canonical_hash
+            return canonical_hash(data, digest_size=32)
         serialized = json.dumps(data).encode('utf-8')
         return sha256(serialized).hexdigest()
     
-    def _make_key(self, func_name: str, key_data) -> str:
+    def _encode(self, data, storage_format=None):
+        """Returns the (data, data_bin, data_jsonb) column values, only one of which is set."""
+        storage_format = storage_format or self.storage_format
+        if storage_format == "bytea":
+            data_bin = encode_cache_item(data, get_codec(self.compression))
+            note_bytes_written(len(data_bin))
+            return None, data_bin, None
+        data_json = json.dumps(data)
+        note_bytes_written(len(data_json))
+        if storage_format == "jsonb":
+            return None, None, data_json
+        return data_json, None, None
+
+    def _decode(self, row):
+        # Rows written with another storage_format remain readable
+        if row["data_bin"] is not None:
+            note_bytes_read(len(row["data_bin"]))
+            return decode_cache_item(bytes(row["data_bin"]))
+        if row["data"] is not None:
+            note_bytes_read(len(row["data"]))
+            return json.loads(row["data"])
+        # Parsed by psycopg
+        return row["data_jsonb"]
+
+    def _make_key(self, func_name: str, key_data, key_hashing=None) -> str:
         """Create cache key from func_name and key_data."""
-        return self._hash([func_name, key_data])
+        return self._hash([func_name, key_data], key_hashing)
     
     def _ensure_table(self):
         """Create cache table if not exists."""
@@ -72,8 +184,57 @@ class PostgresCacheStorage:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """ % self.table_name)
+            # ALTER TABLE locks the table even when the column exists, which would queue writes behind a running index build
+            columns = {
+                row["attname"] for row in conn.execute(
+                    "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND NOT attisdropped", (self.table_name,)
+                )
+            }
+            for column, column_type in (("data_bin", "BYTEA"), ("data_jsonb", "JSONB")):
+                if column not in columns:
+                    conn.execute("ALTER TABLE %s ADD COLUMN IF NOT EXISTS %s %s" % (self.table_name, column, column_type))
+            has_index = self._has_valid_index(conn, "%s_created_at" % self.table_name)
             conn.commit()
+        if not has_index:
+            self._create_created_at_index()
+
+    @staticmethod
+    def _has_valid_index(conn, index_name):
+        from psycopg.rows import tuple_row
+        # A failed or cancelled CREATE INDEX CONCURRENTLY leaves an invalid index, which queries don't use
+        query = "SELECT EXISTS (SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND indisvalid)"
+        return conn.cursor(row_factory=tuple_row).execute(query, (index_name,)).fetchone()[0]
+
+    def _create_created_at_index(self):
+        """Indexes created_at, which lets purge_expired find expired rows without scanning the table."""
+        index_name = "%s_created_at" % self.table_name
+        # CONCURRENTLY keeps the table writable while existing rows are indexed, and can't run in a transaction
+        with self._get_admin_connection(self.db_name) as conn:
+            # Concurrent builds on one table deadlock, so processes starting together build it one at a time.
+            # The lock is polled, as a backend waiting on it would hold a snapshot the build waits for.
+            while not conn.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (index_name,)).fetchone()[0]:
+                sleep(0.1)
+            try:
+                if not self._has_valid_index(conn, index_name):
+                    # Under the lock, an invalid index is left by a build that failed, so it is built again
+                    conn.execute("DROP INDEX CONCURRENTLY IF EXISTS %s" % index_name)
+                    conn.execute("CREATE INDEX CONCURRENTLY %s ON %s (created_at)" % (index_name, self.table_name))
+            finally:
+                conn.execute("SELECT pg_advisory_unlock(hashtext(%s))", (index_name,))
     
+    def _select(self, conn, key, expires_in):
+        if expires_in is not None:
+            # Expired rows are returned too, so they are told apart from missing rows without another query
+            return conn.execute(
+                f"""SELECT data, data_bin, data_jsonb, created_at <= NOW() - INTERVAL '{expires_in.total_seconds()} seconds' AS is_expired 
+                   FROM {self.table_name} WHERE key = %s""",
+                (key,)
+            ).fetchone()
+        return conn.execute(
+            "SELECT data, data_bin, data_jsonb, FALSE AS is_expired FROM %s WHERE key = %%s" % self.table_name,
+            (key,)
+        ).fetchone()
+
     def get(self, func_name: str, key_data, expires_in=None):
         """
         Returns:
@@ -82,40 +243,43 @@ class PostgresCacheStorage:
         """
         key = self._make_key(func_name, key_data)
         with self._get_connection() as conn:
-            if expires_in is not None:
-                row = conn.execute(
-                    f"""SELECT data FROM {self.table_name} 
-                       WHERE key = %s AND created_at > NOW() - INTERVAL '{expires_in.total_seconds()} seconds'""",
-                    (key,)
-                ).fetchone()
-                if row is None:
-                    conn.execute(
-                        "DELETE FROM %s WHERE key = %%s" % self.table_name, 
-                        (key,)
-                    )
-                    conn.commit()
-                    return None
-            else:
-                row = conn.execute(
-                    "SELECT data FROM %s WHERE key = %%s" % self.table_name,
-                    (key,)
-                ).fetchone()
-            
-            if row:
-                return {"data": json.loads(row["data"])}
+            row = self._select(conn, key, expires_in)
+            if row is None and self._migrates_keys_on_read() and self._migrate_keys(conn, func_name, [key_data]):
+                row = self._select(conn, key, expires_in)
+
+        if row is None:
             return None
-    
+        if row["is_expired"]:
+            # Left for purge_expired, or overwritten by the next put
+            note_expired()
+            return None
+        return {"data": self._decode(row)}
+
+    def get_with_age(self, func_name: str, key_data):
+        """Returns {"data": value, "age": seconds since it was cached}, or None if not cached."""
+        key = self._make_key(func_name, key_data)
+        with self._get_connection() as conn:
+            row = conn.execute(
+                "SELECT data, data_bin, data_jsonb, EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - created_at)) AS age FROM %s WHERE key = %%s" % self.table_name,
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            return {"data": self._decode(row), "age": float(row["age"])}
+
     def put(self, func_name: str, key_data, data) -> None:
         key = self._make_key(func_name, key_data)
-        data_json = json.dumps(data)
+        data_json, data_bin, data_jsonb = self._encode(data)
         with self._get_connection() as conn:
             conn.execute("""
-                INSERT INTO %s (key, data, created_at)
-                VALUES (%%s, %%s, CURRENT_TIMESTAMP)
+                INSERT INTO %s (key, data, data_bin, data_jsonb, created_at)
+                VALUES (%%s, %%s, %%s, %%s::jsonb, CURRENT_TIMESTAMP)
                 ON CONFLICT (key) DO UPDATE SET 
                     data = EXCLUDED.data,
+                    data_bin = EXCLUDED.data_bin,
+                    data_jsonb = EXCLUDED.data_jsonb,
                     created_at = CURRENT_TIMESTAMP
-            """ % self.table_name, (key, data_json))
+            """ % self.table_name, (key, data_json, data_bin, data_jsonb))
             conn.commit()
     
     def delete(self, func_name: str, key_data) -> None:
@@ -127,6 +291,167 @@ class PostgresCacheStorage:
             )
             conn.commit()
 
+    def _select_many(self, conn, keys, expires_in, columns):
+        """Returns {key: row} for the rows of keys, queried in chunks."""
+        rows = {}
+        for start in range(0, len(keys), MAX_KEYS_PER_QUERY):
+            query = "SELECT %s FROM %s WHERE key = ANY(%%s::CHAR(64)[])" % (columns, self.table_name)
+            if expires_in is not None:
+                query += f" AND created_at > NOW() - INTERVAL '{expires_in.total_seconds()} seconds'"
+            for row in conn.execute(query, (keys[start:start + MAX_KEYS_PER_QUERY],)):
+                # CHAR(64) pads shorter keys with spaces
+                rows[row["key"].rstrip()] = row
+        return rows
+
+    def _fetch_many(self, func_name, items, expires_in, columns):
+        """Returns (keys, {key: row}) for items."""
+        keys = [self._make_key(func_name, item) for item in items]
+        with self._get_connection() as conn:
+            rows = self._select_many(conn, keys, expires_in, columns)
+            missed = [item for item, key in zip(items, keys) if key not in rows]
+            if missed and self._migrates_keys_on_read() and self._migrate_keys(conn, func_name, missed):
+                rows.update(self._select_many(conn, [key for key in keys if key not in rows], expires_in, columns))
+        return keys, rows
+
+    def get_many(self, func_name: str, items, expires_in=None):
+        """Returns the result of get for each of items, in order, querying up to 10000 items at a time."""
+        keys, rows = self._fetch_many(func_name, items, expires_in, "key, data, data_bin, data_jsonb")
+        return [{"data": self._decode(rows[key])} if key in rows else None for key in keys]
+
+    def has_many(self, func_name: str, items, expires_in=None):
+        """Returns whether each of items is cached and not expired, without reading the data."""
+        keys, rows = self._fetch_many(func_name, items, expires_in, "key")
+        return [key in rows for key in keys]
+
+    def put_many(self, func_name: str, entries) -> None:
+        """Stores each (key_data, data) of entries, copying them to a temporary table and upserting from it."""
+        # Keyed by key, as one statement can't upsert a key twice
+        rows = {}
+        for key_data, data in entries:
+            rows[self._make_key(func_name, key_data)] = self._encode(data)
+        if not rows:
+            return
+        with self._get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TEMPORARY TABLE botasaurus_cache_put (key CHAR(64), data TEXT, data_bin BYTEA, data_jsonb JSONB) 
+                    ON COMMIT DROP
+                """)
+                with cursor.copy("COPY botasaurus_cache_put (key, data, data_bin, data_jsonb) FROM STDIN") as copy:
+                    for key, (data_json, data_bin, data_jsonb) in rows.items():
+                        copy.write_row((key, data_json, data_bin, data_jsonb))
+                cursor.execute("""
+                    INSERT INTO %s (key, data, data_bin, data_jsonb, created_at)
+                    SELECT key, data, data_bin, data_jsonb, CURRENT_TIMESTAMP FROM botasaurus_cache_put
+                    ON CONFLICT (key) DO UPDATE SET 
+                        data = EXCLUDED.data,
+                        data_bin = EXCLUDED.data_bin,
+                        data_jsonb = EXCLUDED.data_jsonb,
+                        created_at = CURRENT_TIMESTAMP
+                """ % self.table_name)
+            conn.commit()
+
+    def delete_many(self, func_name: str, items) -> None:
+        keys = [self._make_key(func_name, key_data) for key_data in items]
+        with self._get_connection() as conn:
+            for start in range(0, len(keys), MAX_KEYS_PER_QUERY):
+                conn.execute(
+                    "DELETE FROM %s WHERE key = ANY(%%s::CHAR(64)[])" % self.table_name,
+                    (keys[start:start + MAX_KEYS_PER_QUERY],)
+                )
+            conn.commit()
+
+    def _migrate_keys(self, conn, func_name: str, items) -> int:
+        keys = []
+        for item in items:
+            key, legacy_key = self._make_key(func_name, item, "canonical"), self._make_key(func_name, item, "legacy")
+            keys.append((key, legacy_key, key))
+        # Rows already cached under the canonical key are kept as is
+        with conn.cursor() as cursor:
+            cursor.executemany("""
+                UPDATE %s SET key = %%s 
+                WHERE key = %%s AND NOT EXISTS (SELECT 1 FROM %s WHERE key = %%s)
+            """ % (self.table_name, self.table_name), keys)
+            moved = cursor.rowcount
+        conn.commit()
+        return moved
+
+    def migrate_keys(self, func_name: str, items) -> int:
+        """Move the rows cached under the legacy keys of items to their canonical keys. Returns the number of moved rows."""
+        with self._get_connection() as conn:
+            return self._migrate_keys(conn, func_name, items)
+
+    def migrate_storage_format(self, storage_format: Optional[str] = None) -> int:
+        """
+        Rewrites the rows stored in another format to storage_format, by default the format of this storage,
+        in batches of 1000 rows, keeping their created_at. Returns the number of rewritten rows.
+        """
+        storage_format = storage_format or self.storage_format
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f'Unknown storage_format "{storage_format}". Use one of: text, jsonb, bytea')
+        other_formats = {
+            "text": "data IS NULL",
+            "jsonb": "data_jsonb IS NULL",
+            "bytea": "data_bin IS NULL",
+        }[storage_format]
+
+        migrated = 0
+        with self._get_connection() as conn:
+            while True:
+                rows = conn.execute(
+                    "SELECT key, data, data_bin, data_jsonb FROM %s WHERE %s LIMIT %%s" % (self.table_name, other_formats),
+                    (MIGRATE_BATCH_SIZE,)
+                ).fetchall()
+                if not rows:
+                    return migrated
+                with conn.cursor() as cursor:
+                    cursor.executemany(
+                        "UPDATE %s SET data = %%s, data_bin = %%s, data_jsonb = %%s::jsonb WHERE key = %%s" % self.table_name,
+                        [(*self._encode(self._decode(row), storage_format), row["key"]) for row in rows]
+                    )
+                conn.commit()
+                migrated += len(rows)
+
+    def purge_expired(self, older_than) -> int:
+        """Deletes the rows cached more than older_than (a timedelta) ago. Returns the number of deleted rows."""
+        deleted = 0
+        with self._get_connection() as conn:
+            while True:
+                count = conn.execute(
+                    f"""DELETE FROM {self.table_name} WHERE key IN (
+                        SELECT key FROM {self.table_name} 
+                        WHERE created_at <= NOW() - INTERVAL '{older_than.total_seconds()} seconds' LIMIT %s
+                    )""",
+                    (PURGE_BATCH_SIZE,)
+                ).rowcount
+                conn.commit()
+                deleted += count
+                if count < PURGE_BATCH_SIZE:
+                    return deleted
+
+    def start_expiry_sweeper(self, older_than, interval: float = 3600) -> None:
+        """Runs purge_expired(older_than) every interval seconds in a background thread, until stop_expiry_sweeper or close is called."""
+        self.stop_expiry_sweeper()
+        stop = Event()
+
+        def sweep():
+            while not stop.wait(interval):
+                try:
+                    self.purge_expired(older_than)
+                except Exception:
+                    print_exc()
+
+        thread = Thread(target=sweep, daemon=True, name="botasaurus-postgres-sweeper")
+        thread.start()
+        self._sweeper = (thread, stop)
+
+    def stop_expiry_sweeper(self) -> None:
+        if self._sweeper is not None:
+            thread, stop = self._sweeper
+            stop.set()
+            thread.join()
+            self._sweeper = None
+
     def clear(self) -> None:
         """Delete all entries from the cache table."""
         with self._get_connection() as conn:
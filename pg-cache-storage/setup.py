@@ -4,9 +4,12 @@ __author__ = "Chetan Jain <53407137+Chetan11-dev@users.noreply.github.com>"
 
 
 install_requires = [
+    "botasaurus>=4.0.98",
     "psycopg[binary]",
 ]
-extras_require = {}
+extras_require = {
+    "pool": ["psycopg-pool>=3.2"],
+}
 
 
 def get_description():
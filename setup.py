@@ -16,7 +16,9 @@ install_requires = [
     "botasaurus-proxy-authentication",
     "botasaurus-requests",
 ]
-extras_require = {}
+extras_require = {
+    "zstd": ["zstandard"],
+}
 cpython_dependencies = [
     "PyDispatcher>=2.0.5",
 ]
@@ -33,7 +35,7 @@ def get_description():
 setup(
     name="botasaurus",
     packages=["botasaurus"],
-    version='4.0.97',
+    version='4.0.98',
     license="MIT",
     project_urls={
         "Documentation": "https://omkar.cloud/botasaurus/",
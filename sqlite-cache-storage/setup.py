@@ -3,7 +3,9 @@ from setuptools import setup
 __author__ = "Chetan Jain <53407137+Chetan11-dev@users.noreply.github.com>"
 
 
-install_requires = []
+install_requires = [
+    "botasaurus>=4.0.98",
+]
 extras_require = {}
 
 
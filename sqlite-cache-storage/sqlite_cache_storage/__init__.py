@@ -1,31 +1,114 @@
+import atexit
 import json
 from hashlib import sha256
+from queue import Empty, Queue
+from threading import Event, Lock, Thread, current_thread, local
+from time import monotonic
+from traceback import print_exc
+
+from botasaurus.cache_codecs import decode_cache_item, encode_cache_item, get_codec
+from botasaurus.cache_stats import note_bytes_read, note_bytes_written, note_expired
 
 __all__ = ['SqliteCacheStorage']
 
+# Keys per IN query, below the limit of 999 variables of older SQLite versions
+MAX_KEYS_PER_QUERY = 500
+# Rows deleted per transaction by purge_expired, so readers and writers are not blocked for long
+PURGE_BATCH_SIZE = 10000
+
 
 class SqliteCacheStorage:
     """SQLite cache storage using sqlite3."""
     
-    def __init__(self, db_path: str = 'cache.db', table_name: str = "botasaurus_cache"):
+    def __init__(self, db_path: str = 'cache.db', table_name: str = "botasaurus_cache", compression=None, key_hashing=None,
+                 busy_timeout: float = 30, batch_writes: bool = False, batch_size: int = 100, batch_interval: float = 0.05):
+        """
+        Args:
+            compression: None to store plain JSON, or "gzip", "zstd" or a codec like ZstdCodec(level=10) 
+                         from botasaurus.cache_codecs. Compressed values are stored as BLOBs.
+            busy_timeout: Seconds a write waits for another connection to release its lock.
+            batch_writes: If True, puts and deletes are queued and a writer thread commits them
+                          every batch_size writes or batch_interval seconds.
+        """
         self.db_path = db_path
         self.table_name = table_name
+        self.compression = compression
+        self.key_hashing = key_hashing
+        self.busy_timeout = busy_timeout
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._local = local()
+        self._connections = {}  # thread -> connection, so close can reach the connections of every thread
+        self._connections_lock = Lock()
         self._ensure_table()
+
+        self._sweeper = None
+        self._pending = {}  # key -> queued write, so reads see writes that are not committed yet
+        self._pending_lock = Lock()
+        self._writer = None
+        if batch_writes:
+            self._queue = Queue()
+            self._writer = Thread(target=self._write_batches, daemon=True, name="botasaurus-sqlite-writer")
+            self._writer.start()
+            atexit.register(self.close)
     
-    def _get_connection(self):
+    def _connect(self):
         import sqlite3
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        # WAL lets readers proceed while a write is in progress
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _get_connection(self):
+        """Returns the connection of the current thread, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._connections_lock:
+                # The threads of a parallel run exit once it ends, so their connections are closed here
+                for thread in [thread for thread in self._connections if not thread.is_alive()]:
+                    self._connections.pop(thread).close()
+                self._connections[current_thread()] = conn
         return conn
     
-    def _hash(self, data) -> str:
-        """Generate sha256 hash from data."""
+    def _get_key_hashing(self):
+        if self.key_hashing is not None:
+            return self.key_hashing
+        from botasaurus.cache import Cache
+        return Cache.key_hashing
+
+    def _migrates_keys_on_read(self):
+        from botasaurus.cache import Cache
+        return self._get_key_hashing() == "canonical" and Cache.migrate_keys_on_read
+
+    def _hash(self, data, key_hashing=None) -> str:
+        """Generate sha256 hash from data, or blake2b of its canonical form."""
+        if (key_hashing or self._get_key_hashing()) == "canonical":
+            from botasaurus.cache_keys import canonical_hash
+            return canonical_hash(data, digest_size=32)
         serialized = json.dumps(data).encode('utf-8')
         return sha256(serialized).hexdigest()
     
-    def _make_key(self, func_name: str, key_data) -> str:
+    def _encode(self, data):
+        if self.compression is None:
+            value = json.dumps(data)
+        else:
+            value = encode_cache_item(data, get_codec(self.compression))
+        note_bytes_written(len(value))
+        return value
+
+    def _decode(self, value):
+        note_bytes_read(len(value))
+        # Values stored before compression was enabled are TEXT
+        if isinstance(value, str):
+            return json.loads(value)
+        return decode_cache_item(value)
+
+    def _make_key(self, func_name: str, key_data, key_hashing=None) -> str:
         """Create cache key from func_name and key_data."""
-        return self._hash([func_name, key_data])
+        return self._hash([func_name, key_data], key_hashing)
     
     def _ensure_table(self):
         """Create cache table if not exists."""
@@ -37,8 +120,29 @@ class SqliteCacheStorage:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """ % self.table_name)
+            # Lets purge_expired find expired rows without scanning the table
+            conn.execute("CREATE INDEX IF NOT EXISTS %s_created_at ON %s (created_at)" % (self.table_name, self.table_name))
             conn.commit()
     
+    def _select(self, conn, key, expires_in):
+        if expires_in is not None:
+            # Expired rows are returned too, so they are told apart from missing rows without another query
+            return conn.execute(
+                f"""SELECT data, created_at <= datetime('now', ?) AS is_expired FROM {self.table_name} 
+                   WHERE key = ?""",
+                (f'-{int(expires_in.total_seconds())} seconds', key)
+            ).fetchone()
+        return conn.execute(
+            "SELECT data, 0 AS is_expired FROM %s WHERE key = ?" % self.table_name,
+            (key,)
+        ).fetchone()
+
+    def _get_pending(self, key):
+        if self._writer is None:
+            return None
+        with self._pending_lock:
+            return self._pending.get(key)
+
     def get(self, func_name: str, key_data, expires_in=None):
         """
         Returns:
@@ -46,53 +150,249 @@ class SqliteCacheStorage:
             None if cache miss or expired
         """
         key = self._make_key(func_name, key_data)
+        pending = self._get_pending(key)
+        if pending is not None:
+            return None if pending[0] == "delete" else {"data": self._decode(pending[2])}
+
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            if expires_in is not None:
-                cursor.execute(
-                    f"""SELECT data FROM {self.table_name} 
-                       WHERE key = ? AND created_at > datetime('now', ?)""",
-                    (key, f'-{int(expires_in.total_seconds())} seconds')
-                )
-                row = cursor.fetchone()
-                if row is None:
-                    cursor.execute(
-                        "DELETE FROM %s WHERE key = ?" % self.table_name, 
-                        (key,)
-                    )
-                    conn.commit()
-                    return None
-            else:
-                cursor.execute(
-                    "SELECT data FROM %s WHERE key = ?" % self.table_name,
-                    (key,)
-                )
-                row = cursor.fetchone()
-            
-            if row:
-                return {"data": json.loads(row["data"])}
+            row = self._select(conn, key, expires_in)
+            if row is None and self._migrates_keys_on_read() and self._migrate_keys(conn, func_name, [key_data]):
+                row = self._select(conn, key, expires_in)
+
+        if row is None:
             return None
-    
-    def put(self, func_name: str, key_data, data) -> None:
+        if row["is_expired"]:
+            # Left for purge_expired, or overwritten by the next put
+            note_expired()
+            return None
+        return {"data": self._decode(row["data"])}
+
+    def get_with_age(self, func_name: str, key_data):
+        """Returns {"data": value, "age": seconds since it was cached}, or None if not cached."""
         key = self._make_key(func_name, key_data)
-        data_json = json.dumps(data)
+        pending = self._get_pending(key)
+        if pending is not None:
+            return None if pending[0] == "delete" else {"data": self._decode(pending[2]), "age": 0}
+
         with self._get_connection() as conn:
-            conn.execute("""
+            row = conn.execute(
+                "SELECT data, (julianday('now') - julianday(created_at)) * 86400 AS age FROM %s WHERE key = ?" % self.table_name,
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            return {"data": self._decode(row["data"]), "age": row["age"]}
+
+    def _enqueue(self, operation) -> bool:
+        with self._pending_lock:
+            if self._writer is None:
+                return False
+            self._pending[operation[1]] = operation
+            self._queue.put(operation)
+            return True
+
+    def _upsert_query(self):
+        return """
                 INSERT INTO %s (key, data, created_at)
                 VALUES (?, ?, CURRENT_TIMESTAMP)
                 ON CONFLICT (key) DO UPDATE SET 
                     data = excluded.data,
                     created_at = CURRENT_TIMESTAMP
-            """ % self.table_name, (key, data_json))
-            conn.commit()
-    
-    def delete(self, func_name: str, key_data) -> None:
-        key = self._make_key(func_name, key_data)
-        with self._get_connection() as conn:
+            """ % self.table_name
+
+    def _execute_write(self, conn, operation):
+        kind, key, value = operation
+        if kind == "put":
+            conn.execute(self._upsert_query(), (key, value))
+        else:
             conn.execute(
                 "DELETE FROM %s WHERE key = ?" % self.table_name,
                 (key,)
             )
-            conn.commit()
 
+    def put(self, func_name: str, key_data, data) -> None:
+        operation = ("put", self._make_key(func_name, key_data), self._encode(data))
+        if self._enqueue(operation):
+            return
+        with self._get_connection() as conn:
+            self._execute_write(conn, operation)
+    
+    def delete(self, func_name: str, key_data) -> None:
+        operation = ("delete", self._make_key(func_name, key_data), None)
+        if self._enqueue(operation):
+            return
+        with self._get_connection() as conn:
+            self._execute_write(conn, operation)
+
+    def _select_many(self, conn, keys, expires_in, columns):
+        """Returns {key: row} for the rows of keys, queried in chunks."""
+        rows = {}
+        for start in range(0, len(keys), MAX_KEYS_PER_QUERY):
+            chunk = keys[start:start + MAX_KEYS_PER_QUERY]
+            query = "SELECT %s FROM %s WHERE key IN (%s)" % (columns, self.table_name, ", ".join("?" * len(chunk)))
+            params = list(chunk)
+            if expires_in is not None:
+                query += " AND created_at > datetime('now', ?)"
+                params.append(f'-{int(expires_in.total_seconds())} seconds')
+            for row in conn.execute(query, params):
+                rows[row["key"]] = row
+        return rows
+
+    def _fetch_many(self, func_name, items, expires_in, columns):
+        """Returns (keys, {key: queued write}, {key: row}) for items."""
+        keys = [self._make_key(func_name, item) for item in items]
+        pending = {}
+        if self._writer is not None:
+            with self._pending_lock:
+                pending = {key: self._pending[key] for key in keys if key in self._pending}
+        rows = {}
+        queried = [key for key in keys if key not in pending]
+        if queried:
+            with self._get_connection() as conn:
+                rows = self._select_many(conn, queried, expires_in, columns)
+                missed = [item for item, key in zip(items, keys) if key not in pending and key not in rows]
+                if missed and self._migrates_keys_on_read() and self._migrate_keys(conn, func_name, missed):
+                    rows.update(self._select_many(conn, [key for key in queried if key not in rows], expires_in, columns))
+        return keys, pending, rows
 
+    def get_many(self, func_name: str, items, expires_in=None):
+        """Returns the result of get for each of items, in order, querying up to 500 items at a time."""
+        results = []
+        keys, pending, rows = self._fetch_many(func_name, items, expires_in, "key, data")
+        for key in keys:
+            if key in pending:
+                kind, _, value = pending[key]
+                results.append(None if kind == "delete" else {"data": self._decode(value)})
+            elif key in rows:
+                results.append({"data": self._decode(rows[key]["data"])})
+            else:
+                results.append(None)
+        return results
+
+    def has_many(self, func_name: str, items, expires_in=None):
+        """Returns whether each of items is cached and not expired, without reading the data."""
+        keys, pending, rows = self._fetch_many(func_name, items, expires_in, "key")
+        return [pending[key][0] == "put" if key in pending else key in rows for key in keys]
+
+    def put_many(self, func_name: str, entries) -> None:
+        """Stores each (key_data, data) of entries in one transaction."""
+        operations = [("put", self._make_key(func_name, key_data), self._encode(data)) for key_data, data in entries]
+        if all(self._enqueue(operation) for operation in operations):
+            return
+        with self._get_connection() as conn:
+            conn.executemany(self._upsert_query(), [(key, value) for _, key, value in operations])
+
+    def delete_many(self, func_name: str, items) -> None:
+        operations = [("delete", self._make_key(func_name, key_data), None) for key_data in items]
+        if all(self._enqueue(operation) for operation in operations):
+            return
+        with self._get_connection() as conn:
+            conn.executemany("DELETE FROM %s WHERE key = ?" % self.table_name, [(key,) for _, key, _ in operations])
+
+    def _write_batches(self):
+        stopping = False
+        while not stopping:
+            operation = self._queue.get()
+            if operation is None:
+                self._queue.task_done()
+                break
+            batch = [operation]
+            deadline = monotonic() + self.batch_interval
+            while len(batch) < self.batch_size:
+                try:
+                    operation = self._queue.get(timeout=max(deadline - monotonic(), 0))
+                except Empty:
+                    break
+                if operation is None:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(operation)
+
+            try:
+                # One transaction, so the batch costs a single commit
+                with self._get_connection() as conn:
+                    for operation in batch:
+                        self._execute_write(conn, operation)
+            except Exception:
+                print_exc()
+            finally:
+                with self._pending_lock:
+                    for operation in batch:
+                        # Unless a newer write of the same key is queued
+                        if self._pending.get(operation[1]) is operation:
+                            del self._pending[operation[1]]
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """Waits until the queued writes are committed."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def purge_expired(self, older_than) -> int:
+        """Deletes the rows cached more than older_than (a timedelta) ago. Returns the number of deleted rows."""
+        deleted = 0
+        with self._get_connection() as conn:
+            while True:
+                count = conn.execute(
+                    f"""DELETE FROM {self.table_name} WHERE key IN (
+                        SELECT key FROM {self.table_name} WHERE created_at <= datetime('now', ?) LIMIT ?
+                    )""",
+                    (f'-{int(older_than.total_seconds())} seconds', PURGE_BATCH_SIZE)
+                ).rowcount
+                conn.commit()
+                deleted += count
+                if count < PURGE_BATCH_SIZE:
+                    return deleted
+
+    def start_expiry_sweeper(self, older_than, interval: float = 3600) -> None:
+        """Runs purge_expired(older_than) every interval seconds in a background thread, until stop_expiry_sweeper or close is called."""
+        self.stop_expiry_sweeper()
+        stop = Event()
+
+        def sweep():
+            while not stop.wait(interval):
+                try:
+                    self.purge_expired(older_than)
+                except Exception:
+                    print_exc()
+
+        thread = Thread(target=sweep, daemon=True, name="botasaurus-sqlite-sweeper")
+        thread.start()
+        self._sweeper = (thread, stop)
+
+    def stop_expiry_sweeper(self) -> None:
+        if self._sweeper is not None:
+            thread, stop = self._sweeper
+            stop.set()
+            thread.join()
+            self._sweeper = None
+
+    def close(self) -> None:
+        """Commits the queued writes, stops the writer thread and closes the connections of every thread."""
+        self.stop_expiry_sweeper()
+        with self._pending_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+            atexit.unregister(self.close)
+
+        with self._connections_lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            self._local = local()
+
+    def _migrate_keys(self, conn, func_name: str, items) -> int:
+        keys = [(self._make_key(func_name, item, "canonical"), self._make_key(func_name, item, "legacy")) for item in items]
+        # Rows already cached under the canonical key are kept as is
+        cursor = conn.executemany("UPDATE OR IGNORE %s SET key = ? WHERE key = ?" % self.table_name, keys)
+        conn.commit()
+        return cursor.rowcount
+
+    def migrate_keys(self, func_name: str, items) -> int:
+        """Move the rows cached under the legacy keys of items to their canonical keys. Returns the number of moved rows."""
+        with self._get_connection() as conn:
+            return self._migrate_keys(conn, func_name, items)
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+# The storage packages of this repository are importable without installing them
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for package in ("sqlite-cache-storage", "pg-cache-storage", "lmdb-cache-storage"):
+    sys.path.insert(0, os.path.join(ROOT, package))
+
+from botasaurus.cache import Cache
+
+CACHE_SETTINGS = ("sharded", "indexed", "fsync", "compression", "limits", "key_hashing", "migrate_keys_on_read")
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+    """Runs each test in a temporary directory with an empty cache, restoring the Cache settings afterwards."""
+    monkeypatch.chdir(tmp_path)
+    saved = {name: getattr(Cache, name) for name in CACHE_SETTINGS}
+    Cache.set_cache_directory(str(tmp_path / "cache"))
+    yield tmp_path / "cache"
+    for name, value in saved.items():
+        setattr(Cache, name, value)
+    Cache.limits = dict(saved["limits"])
+    Cache.set_cache_directory("cache/")
+
+
+@pytest.fixture
+def postgres_storage():
+    """
+    Returns a function creating PostgresCacheStorage instances on a new table of the server in the PGHOST,
+    PGPORT, PGUSER, PGPASSWORD and PGDATABASE environment variables. Skips the test without PGHOST.
+    """
+    if not os.environ.get("PGHOST"):
+        pytest.skip("set PGHOST to run the PostgreSQL tests")
+    pytest.importorskip("psycopg")
+    from uuid import uuid4
+    from pg_cache_storage import PostgresCacheStorage
+
+    table_name = "botasaurus_test_" + uuid4().hex[:12]
+    storages = []
+
+    def create(**kwargs):
+        storage = PostgresCacheStorage(
+            host=os.environ["PGHOST"],
+            port=int(os.environ.get("PGPORT", 5432)),
+            username=os.environ.get("PGUSER", "postgres"),
+            password=os.environ.get("PGPASSWORD", "postgres"),
+            db_name=os.environ.get("PGDATABASE", "cache"),
+            table_name=table_name,
+            **kwargs,
+        )
+        storages.append(storage)
+        return storage
+
+    create.table_name = table_name
+    yield create
+    for storage in storages:
+        storage.close()
+    if storages:
+        with storages[0]._get_admin_connection(storages[0].db_name) as conn:
+            conn.execute("DROP TABLE IF EXISTS %s" % table_name)
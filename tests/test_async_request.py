@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("botasaurus_requests")
+
+from botasaurus.create_request import AsyncRequest
+from botasaurus.request import request
+
+
+def test_async_scrapers_return_results_in_order():
+    in_flight, peak = [], []
+
+    @request(parallel=3, output=None, close_on_crash=True, create_error_logs=False)
+    async def scrape(reqs, data):
+        in_flight.append(data)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01 * (data % 3))
+        in_flight.remove(data)
+        return data * 2
+
+    assert scrape(list(range(12))) == [data * 2 for data in range(12)]
+    assert max(peak) == 3
+    assert scrape(5) == 10
+
+
+def test_async_scrapers_use_the_cache():
+    calls = []
+
+    @request(cache=True, parallel=4, output=None, close_on_crash=True, create_error_logs=False)
+    async def scrape(reqs, data):
+        calls.append(data)
+        return data * 2
+
+    assert scrape([1, 2, 3]) == [2, 4, 6]
+    assert scrape([1, 2, 3, 4]) == [2, 4, 6, 8]
+    assert sorted(calls) == [1, 2, 3, 4]
+
+
+def test_async_scrapers_retry():
+    attempts = []
+
+    @request(max_retry=2, output=None, close_on_crash=True, create_error_logs=False, raise_exception=True)
+    async def scrape(reqs, data):
+        attempts.append(data)
+        if len(attempts) < 3:
+            raise ConnectionError("reset")
+        return data
+
+    assert scrape(1) == 1
+    assert attempts == [1, 1, 1]
+
+
+def test_async_scrapers_raise_after_the_last_retry():
+    @request(max_retry=1, output=None, close_on_crash=True, create_error_logs=False, raise_exception=True)
+    async def scrape(reqs, data):
+        raise ConnectionError("reset")
+
+    with pytest.raises(ConnectionError):
+        scrape(1)
+
+
+def test_async_scrapers_cannot_stream():
+    @request(stream=True, output=None, close_on_crash=True)
+    async def scrape(reqs, data):
+        return data
+
+    with pytest.raises(ValueError, match="stream"):
+        list(scrape([1, 2]))
+
+
+def test_async_request_runs_blocking_methods_in_threads():
+    class Request:
+        headers = {"User-Agent": "test"}
+
+        def get(self, url, timeout=None):
+            return (url, timeout, threading.current_thread().name)
+
+    async def fetch():
+        reqs = AsyncRequest(Request())
+        return await reqs.get("https://example.com", timeout=5), reqs.headers
+
+    (url, timeout, thread_name), headers = asyncio.run(fetch())
+    assert (url, timeout) == ("https://example.com", 5)
+    assert thread_name != threading.current_thread().name
+    assert headers == {"User-Agent": "test"}
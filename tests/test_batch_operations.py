@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+
+import pytest
+
+from botasaurus.cache_storage import FileCacheStorage, MemoryCache, delete_many, get_many, has_many, put_many
+
+
+class PerItemStorage:
+    """Implements only the required get, put and delete."""
+
+    def __init__(self):
+        self.items = {}
+
+    def get(self, func_name, key_data, expires_in=None):
+        key = (func_name, repr(key_data))
+        return {"data": self.items[key]} if key in self.items else None
+
+    def put(self, func_name, key_data, data):
+        self.items[(func_name, repr(key_data))] = data
+
+    def delete(self, func_name, key_data):
+        self.items.pop((func_name, repr(key_data)), None)
+
+
+@pytest.fixture(params=["file", "file-gzip", "memory", "per-item", "segment", "sqlite", "lmdb", "postgres"])
+def storage(request, tmp_path):
+    name = request.param
+    if name == "postgres":
+        storage = request.getfixturevalue("postgres_storage")()
+        yield storage
+        return
+
+    if name == "file":
+        storage = FileCacheStorage()
+    elif name == "file-gzip":
+        storage = FileCacheStorage(compression="gzip")
+    elif name == "memory":
+        storage = MemoryCache(FileCacheStorage())
+    elif name == "per-item":
+        storage = PerItemStorage()
+    elif name == "segment":
+        from botasaurus.segment_cache_storage import SegmentCacheStorage
+        storage = SegmentCacheStorage(str(tmp_path / "segments"), compaction_interval=None)
+    elif name == "sqlite":
+        from sqlite_cache_storage import SqliteCacheStorage
+        storage = SqliteCacheStorage(str(tmp_path / "cache.db"))
+    else:
+        from lmdb_cache_storage import LmdbCacheStorage
+        storage = LmdbCacheStorage(str(tmp_path / "cache.lmdb"))
+    yield storage
+    if hasattr(storage, "close"):
+        storage.close()
+
+
+def test_batch_operations_keep_the_order_of_items(storage):
+    put_many(storage, "double", [(key, {"value": key * 2}) for key in range(20)])
+    put_many(storage, "double", [({"nested": [1, 2]}, None)])
+
+    items = [19, 25, 0, {"nested": [1, 2]}]
+    assert get_many(storage, "double", items) == [{"data": {"value": 38}}, None, {"data": {"value": 0}}, {"data": None}]
+    assert has_many(storage, "double", items) == [True, False, True, True]
+    assert get_many(storage, "other", [0]) == [None]
+
+    delete_many(storage, "double", [0, 1, 25])
+    assert has_many(storage, "double", [0, 1, 2]) == [False, False, True]
+    assert get_many(storage, "double", []) == []
+
+
+def test_batch_operations_match_single_item_calls(storage):
+    put_many(storage, "double", [(1, 2)])
+    storage.put("double", 2, 4)
+    assert get_many(storage, "double", [1, 2]) == [storage.get("double", 1), storage.get("double", 2)]
+
+    delete_many(storage, "double", [1])
+    storage.delete("double", 2)
+    assert get_many(storage, "double", [1, 2]) == [None, None]
+
+
+def test_batch_reads_skip_expired_items(storage):
+    if isinstance(storage, PerItemStorage):
+        pytest.skip("does not expire items")
+    put_many(storage, "double", [(1, 2)])
+    time.sleep(1.1)
+    put_many(storage, "double", [(2, 4)])
+
+    assert get_many(storage, "double", [1, 2], timedelta(seconds=1)) == [None, {"data": 4}]
+    assert has_many(storage, "double", [1, 2], timedelta(seconds=1)) == [False, True]
+    assert has_many(storage, "double", [2], timedelta(days=1)) == [True]
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from botasaurus.cache import Cache
+
+
+@pytest.fixture
+def cached():
+    for key in range(5):
+        Cache.put("double", key, {"value": key * 2})
+
+
+@pytest.mark.parametrize("filename", ["cache.ndjson", "cache.ndjson.gz", "cache.ndjson.zst"])
+def test_export_and_import_every_item(cached, tmp_path, filename):
+    if filename.endswith(".zst"):
+        pytest.importorskip("zstandard")
+    path = tmp_path / filename
+    assert Cache.export("double", path, batch_size=2) == 5
+
+    Cache.clear()
+    assert Cache.import_(path, batch_size=2) == 5
+    assert Cache.get_items("double", list(range(5))) == [{"value": key * 2} for key in range(5)]
+
+
+def test_export_writes_a_header_and_one_record_per_item(cached, tmp_path):
+    path = tmp_path / "cache.ndjson"
+    assert Cache.export("double", path, items=[1, 2, 9]) == 2
+
+    with open(path) as fp:
+        header, *records = [json.loads(line) for line in fp]
+    assert header == {"format": "botasaurus-cache", "version": 1, "key_hashing": "legacy"}
+    assert records == [
+        {"func": "double", "hash": Cache.hash(1), "data": {"value": 2}, "key": 1},
+        {"func": "double", "hash": Cache.hash(2), "data": {"value": 4}, "key": 2},
+    ]
+
+
+def test_items_exported_with_their_inputs_follow_the_key_hashing_of_the_import(cached, tmp_path):
+    path = tmp_path / "cache.ndjson"
+    Cache.export("double", path, items=list(range(5)))
+    Cache.clear()
+
+    Cache.set_key_hashing("canonical")
+    assert Cache.import_(path) == 5
+    assert Cache.get("double", 3) == {"value": 6}
+
+
+def test_items_exported_without_inputs_need_the_same_key_hashing(cached, tmp_path):
+    path = tmp_path / "cache.ndjson"
+    Cache.export("double", path)
+    Cache.clear()
+
+    Cache.set_key_hashing("canonical")
+    with pytest.raises(ValueError, match="legacy key hashing"):
+        Cache.import_(path)
+
+
+def test_import_into_a_cache_storage(cached, tmp_path, capsys):
+    from sqlite_cache_storage import SqliteCacheStorage
+    with_inputs, without_inputs = tmp_path / "with.ndjson", tmp_path / "without.ndjson"
+    Cache.export("double", with_inputs, items=[0, 1])
+    Cache.export("double", without_inputs)
+
+    storage = SqliteCacheStorage(str(tmp_path / "cache.db"))
+    try:
+        assert Cache.import_(with_inputs, cache_storage=storage) == 2
+        assert storage.get_many("double", [0, 1]) == [{"data": {"value": 0}}, {"data": {"value": 2}}]
+
+        assert Cache.import_(without_inputs, cache_storage=storage) == 0
+        assert "Skipped 5 items" in capsys.readouterr().out
+    finally:
+        storage.close()
+
+
+def test_import_updates_the_index(cached, tmp_path):
+    path = tmp_path / "cache.ndjson"
+    Cache.export("double", path)
+    Cache.clear()
+
+    Cache.set_index_enabled()
+    Cache.import_(path)
+    assert Cache.get_cached_items_count("double") == 5
+
+
+def test_import_rejects_other_files(tmp_path):
+    path = tmp_path / "items.ndjson"
+    path.write_text('{"name": "item"}\n')
+    with pytest.raises(ValueError, match="not a botasaurus cache archive"):
+        Cache.import_(path)
@@ -0,0 +1,103 @@
+import os
+import time
+
+import pytest
+
+from botasaurus.cache import Cache, CacheMissException, is_cache_item_corrupted, write_atomic
+
+
+def _path(fn_name, key_data):
+    return Cache.generate_cache_path_from_hash(fn_name, Cache.hash(key_data))
+
+
+def test_writes_leave_no_temporary_files(cache_directory):
+    Cache.put("double", 1, {"value": 2})
+    Cache.put("double", 1, {"value": 3})
+
+    assert os.listdir(cache_directory / "double") == [Cache.hash(1) + ".json"]
+    # Uncompressed items stay plain JSON
+    with open(_path("double", 1), "rb") as fp:
+        assert fp.read() == b'{"value": 3}'
+
+
+def test_failed_rename_removes_the_temporary_file(tmp_path, monkeypatch):
+    def replace(src, dst):
+        raise PermissionError(dst)
+    monkeypatch.setattr(os, "replace", replace)
+
+    with pytest.raises(PermissionError):
+        write_atomic(b"{}", str(tmp_path / "items" / "item.json"))
+    assert os.listdir(tmp_path / "items") == []
+
+
+def test_writes_create_missing_directories(tmp_path):
+    path = tmp_path / "a" / "b" / "item.json"
+    write_atomic(b"[]", str(path))
+    assert path.read_bytes() == b"[]"
+
+
+def test_fsync_is_opt_in(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", synced.append)
+    write_atomic(b"1", str(tmp_path / "a.json"))
+    assert synced == []
+
+    Cache.set_fsync(True)
+    write_atomic(b"1", str(tmp_path / "b.json"))
+    assert len(synced) == 1
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_truncated_items_are_corrupted(compression):
+    Cache.put("double", 1, "x" * 100, compression=compression)
+    path = _path("double", 1)
+    assert not is_cache_item_corrupted(path)
+
+    with open(path, "rb") as fp:
+        content = fp.read()
+    with open(path, "wb") as fp:
+        fp.write(content[:-5])
+    assert is_cache_item_corrupted(path)
+
+
+def test_compressed_items_have_a_header():
+    Cache.put("double", 1, 2, compression="gzip")
+    with open(_path("double", 1), "rb") as fp:
+        assert fp.read().startswith(b"#btc1 ")
+    assert Cache.get("double", 1) == 2
+
+
+def test_delete_corrupted_items(cache_directory):
+    for key in range(3):
+        Cache.put("double", key, key * 2)
+    with open(_path("double", 1), "wb") as fp:
+        fp.write(b'{"trunc')
+
+    assert Cache.delete_corrupted_items("double") == 1
+    assert Cache.get_items("double", [0, 1, 2]) == [0, None, 4]
+
+
+def test_delete_corrupted_items_removes_stale_temporary_files(cache_directory):
+    Cache.put("double", 1, 2)
+    stale = cache_directory / "double" / "item.json.1.1.tmp"
+    recent = cache_directory / "double" / "item.json.2.2.tmp"
+    stale.write_bytes(b"{")
+    recent.write_bytes(b"{")
+    old = time.time() - 3600
+    os.utime(stale, (old, old))
+
+    Cache.delete_corrupted_items("double")
+    assert not stale.exists()
+    assert recent.exists()
+    assert Cache.get("double", 1) == 2
+
+
+def test_reading_a_corrupted_item_is_a_miss():
+    Cache.put("double", 1, 2)
+    with open(_path("double", 1), "wb") as fp:
+        fp.write(b"[1, ")
+
+    assert Cache.get("double", 1, raise_exception=False) is None
+    assert not os.path.exists(_path("double", 1))
+    with pytest.raises(CacheMissException):
+        Cache.get("double", 1)
@@ -0,0 +1,92 @@
+import zlib
+
+import pytest
+
+from botasaurus import cache_codecs
+from botasaurus.cache import Cache
+from botasaurus.cache_codecs import (
+    CodecUnavailableError, CorruptedCacheItemException, GzipCodec, ZstdCodec, decode_cache_item, encode_cache_item,
+    get_codec, load_zstd_dictionary, register_codec, train_zstd_dictionary,
+)
+
+ITEM = {"title": "Example", "tags": ["a", "b"], "price": 1.5, "missing": None}
+
+
+class ZlibCodec:
+    name = "test-zlib"
+
+    def compress(self, payload):
+        return zlib.compress(payload)
+
+    def decompress(self, payload):
+        return zlib.decompress(payload)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd", GzipCodec(level=9)])
+def test_compressed_items_round_trip(compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    content = encode_cache_item(ITEM, get_codec(compression))
+    name = compression if isinstance(compression, str) else compression.name
+    assert content.startswith(b"#btc1 %d %s\n" % (len(content) - content.index(b"\n") - 1, name.encode()))
+    assert decode_cache_item(content) == ITEM
+
+
+def test_uncompressed_items_are_plain_json():
+    for compression in (None, False, "none"):
+        assert encode_cache_item(ITEM, get_codec(compression)) == b'{"title": "Example", "tags": ["a", "b"], "price": 1.5, "missing": null}'
+    assert decode_cache_item(b"[1, 2]") == [1, 2]
+    assert decode_cache_item("[1, 2]") == [1, 2]
+
+
+@pytest.mark.parametrize("content", [b"#btc1 10 gzip", b"#btc1 ten gzip\nabc", b"#btc1 10 gzip\nabc"])
+def test_truncated_or_malformed_items_are_corrupted(content):
+    with pytest.raises(CorruptedCacheItemException):
+        decode_cache_item(content)
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError, match="Unknown compression"):
+        get_codec("brotli")
+    with pytest.raises(ValueError, match="Unknown compression"):
+        Cache.set_compression("brotli")
+
+
+def test_custom_codecs_are_registered_when_used(monkeypatch):
+    monkeypatch.setattr(cache_codecs, "_default_codecs", dict(cache_codecs._default_codecs))
+    content = b"#btc1 %d test-zlib\n%s" % (len(zlib.compress(b"1")), zlib.compress(b"1"))
+    with pytest.raises(CodecUnavailableError):
+        decode_cache_item(content)
+
+    Cache.put("double", 1, ITEM, compression=ZlibCodec())
+    assert Cache.get("double", 1) == ITEM
+    assert decode_cache_item(content) == 1
+    assert register_codec(ZlibCodec()).name == "test-zlib"
+
+
+def test_items_are_read_whatever_compression_they_were_written_with():
+    Cache.put("double", 1, 2)
+    Cache.set_compression("gzip")
+    Cache.put("double", 2, 4)
+    Cache.set_compression(None)
+    Cache.put("double", 3, 6, compression="gzip")
+
+    assert Cache.get_items("double", [1, 2, 3]) == [2, 4, 6]
+    assert Cache.delete_corrupted_items("double") == 0
+
+
+def test_zstd_dictionaries(monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(cache_codecs, "_zstd_dictionaries", {})
+    samples = [{"id": index, "url": f"https://example.com/products/{index}", "in_stock": index % 2 == 0} for index in range(500)]
+    dictionary = train_zstd_dictionary(samples, dict_size=4096)
+
+    content = encode_cache_item(samples[0], ZstdCodec(dictionary=dictionary))
+    assert decode_cache_item(content) == samples[0]
+
+    # Another process must load the dictionary before reading the items
+    monkeypatch.setattr(cache_codecs, "_zstd_dictionaries", {})
+    with pytest.raises(CodecUnavailableError):
+        decode_cache_item(content)
+    load_zstd_dictionary(dictionary)
+    assert decode_cache_item(content) == samples[0]
@@ -0,0 +1,28 @@
+from botasaurus.cache import Cache
+from botasaurus.task import task
+
+
+def test_duplicate_inputs_run_once(tmp_path):
+    Cache.set_cache_directory(str(tmp_path / "cache"))
+    calls = []
+
+    @task(cache=True, output=None)
+    def double(data):
+        calls.append(data)
+        return data * 2
+
+    assert double([1, 2, 1, 3, 2]) == [2, 4, 2, 6, 4]
+    assert calls == [1, 2, 3]
+
+
+def test_duplicate_inputs_run_once_when_streaming(tmp_path):
+    Cache.set_cache_directory(str(tmp_path / "cache"))
+    calls = []
+
+    @task(cache=True, output=None, stream="ordered")
+    def double(data):
+        calls.append(data)
+        return data * 2
+
+    assert list(double([1, 2, 1, 3, 2])) == [(1, 2), (2, 4), (1, 2), (3, 6), (2, 4)]
+    assert calls == [1, 2, 3]
@@ -0,0 +1,105 @@
+import os
+import time
+from datetime import timedelta
+
+import pytest
+
+from botasaurus.cache import Cache
+
+
+def _put_aged(fn_name, key, data, age_seconds):
+    Cache.put(fn_name, key, data)
+    path = Cache.generate_cache_path_from_hash(fn_name, Cache.hash(key))
+    modified = time.time() - age_seconds
+    os.utime(path, (modified, modified))
+
+
+def test_gc_removes_expired_items():
+    _put_aged("double", 1, 2, 3600)
+    _put_aged("double", 2, 4, 10)
+    Cache.set_limits("double", expires_in=timedelta(minutes=30))
+
+    result = Cache.gc("double")
+    assert result["deleted"] == 1
+    assert result["freed_bytes"] == 1
+    assert Cache.get_items("double", [1, 2]) == [None, 4]
+
+
+def test_gc_evicts_the_oldest_items_over_max_entries():
+    for key in range(5):
+        _put_aged("double", key, key * 2, 100 - key)
+    Cache.set_limits("double", max_entries=2, policy="fifo")
+
+    assert Cache.gc("double")["deleted"] == 3
+    assert Cache.get_items("double", list(range(5))) == [None, None, None, 6, 8]
+
+
+def test_gc_evicts_the_least_recently_read_items():
+    for key in range(3):
+        _put_aged("double", key, key, 100)
+    path = Cache.generate_cache_path_from_hash("double", Cache.hash(0))
+    os.utime(path, (time.time(), time.time() - 100))
+    Cache.set_limits("double", max_entries=1, policy="lru")
+
+    assert Cache.gc("double")["deleted"] == 2
+    assert Cache.get_items("double", [0, 1, 2]) == [0, None, None]
+
+
+def test_gc_evicts_items_over_max_size_bytes():
+    for key in range(4):
+        _put_aged("double", key, "x" * 98, 100 - key)  # 100 bytes of JSON each
+    Cache.set_limits("double", max_size_bytes=250, policy="fifo")
+
+    assert Cache.gc("double") == {"deleted": 2, "freed_bytes": 200}
+    assert Cache.get_cached_items_count("double") == 2
+
+
+def test_global_limits_apply_to_the_whole_cache():
+    _put_aged("double", 1, 2, 300)
+    _put_aged("triple", 1, 3, 200)
+    _put_aged("double", 2, 4, 100)
+    Cache.set_limits(max_entries=2, policy="fifo")
+
+    assert Cache.gc()["deleted"] == 1
+    assert Cache.get_items("double", [1, 2]) == [None, 4]
+    assert Cache.get("triple", 1) == 3
+
+
+def test_function_limits_override_the_global_expiry():
+    _put_aged("double", 1, 2, 3600)
+    _put_aged("triple", 1, 3, 3600)
+    Cache.set_limits(expires_in=timedelta(minutes=30))
+    Cache.set_limits("triple", expires_in=timedelta(days=1))
+
+    assert Cache.gc()["deleted"] == 1
+    assert Cache.get("triple", 1) == 3
+
+
+def test_gc_updates_the_index():
+    Cache.set_index_enabled()
+    for key in range(3):
+        _put_aged("double", key, key, 100 - key)
+    Cache.set_limits("double", max_entries=1, policy="fifo")
+
+    Cache.gc("double")
+    assert Cache.get_cached_items_count("double") == 1
+    assert Cache.filter_items_in_cache("double", [0, 1, 2]) == [2]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError, match="Unknown eviction policy"):
+        Cache.set_limits(policy="lfu")
+
+
+def test_gc_sweeper():
+    _put_aged("double", 1, 2, 3600)
+    Cache.set_limits("double", expires_in=timedelta(minutes=30))
+
+    Cache.start_gc_sweeper(interval=0.05, func="double")
+    try:
+        deadline = time.time() + 5
+        while Cache.has("double", 1) and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        Cache.stop_gc_sweeper()
+    assert not Cache.has("double", 1)
@@ -0,0 +1,143 @@
+import os
+
+from botasaurus import cache_index
+from botasaurus.cache import Cache
+from botasaurus.cache_index import KeyIndex
+from botasaurus.task import task
+
+
+def test_index_sees_lines_appended_by_another_instance(tmp_path):
+    path = str(tmp_path / ".index")
+    writer = KeyIndex(path)
+    reader = KeyIndex(path)
+
+    writer.add("a")
+    writer.add("b")
+    assert sorted(reader.keys()) == ["a", "b"]
+
+    writer.discard("a")
+    writer.discard_many(["b"])
+    writer.add("c")
+    assert reader.keys() == ["c"]
+    assert reader.count() == 1
+
+
+def test_index_ignores_a_partial_trailing_line(tmp_path):
+    path = str(tmp_path / ".index")
+    with open(path, "w") as fp:
+        fp.write("+a\n+b")
+
+    index = KeyIndex(path)
+    assert index.keys() == ["a"]
+
+    with open(path, "a") as fp:
+        fp.write("c\n")
+    assert sorted(index.keys()) == ["a", "bc"]
+
+
+def test_index_compacts_when_dead_lines_outnumber_live_keys(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_index, "MIN_LINES_TO_COMPACT", 10)
+    path = str(tmp_path / ".index")
+    index = KeyIndex(path)
+    for key in range(20):
+        index.add(str(key))
+    index.discard_many([str(key) for key in range(15)])
+    lines_before = 35
+
+    assert sorted(index.keys(), key=int) == [str(key) for key in range(15, 20)]
+    with open(path) as fp:
+        lines = fp.read().splitlines()
+    assert len(lines) < lines_before
+    assert sorted(lines) == sorted(f"+{key}" for key in range(15, 20))
+
+    # Other instances notice the new file and read it from the start
+    assert sorted(KeyIndex(path).keys()) == sorted(lines[i][1:] for i in range(5))
+
+
+def test_index_does_not_compact_a_mostly_live_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_index, "MIN_LINES_TO_COMPACT", 10)
+    path = str(tmp_path / ".index")
+    index = KeyIndex(path)
+    for key in range(20):
+        index.add(str(key))
+    index.discard("0")
+    inode = os.stat(path).st_ino
+
+    assert index.count() == 19
+    assert os.stat(path).st_ino == inode
+
+
+def test_appends_check_for_compaction_without_reads(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_index, "MIN_LINES_TO_COMPACT", 10)
+    monkeypatch.setattr(cache_index, "CHECK_INTERVAL_LINES", 50)
+    path = str(tmp_path / ".index")
+    index = KeyIndex(path)
+    for _ in range(30):
+        index.add("a")
+        index.discard("a")
+
+    with open(path) as fp:
+        assert len(fp.read().splitlines()) < 50
+
+
+def test_rebuild_keeps_lines_appended_after_the_mark(tmp_path):
+    path = str(tmp_path / ".index")
+    index = KeyIndex(path)
+    index.add("old")
+
+    since = index.mark()
+    listed = ["old", "listed"]
+    # Another process writes while the directory is being listed
+    other = KeyIndex(path)
+    other.add("new")
+    other.discard("old")
+
+    index.rebuild(listed, since)
+    assert sorted(index.keys()) == ["listed", "new"]
+    assert sorted(KeyIndex(path).keys()) == ["listed", "new"]
+
+
+def test_rebuild_without_a_mark_replaces_the_log(tmp_path):
+    path = str(tmp_path / ".index")
+    index = KeyIndex(path)
+    index.add("a")
+    index.rebuild(["b"])
+    assert index.keys() == ["b"]
+
+
+def test_cache_index_tracks_puts_and_deletes():
+    Cache.set_index_enabled()
+    calls = []
+
+    @task(cache=True, output=None)
+    def double(data):
+        calls.append(data)
+        return data * 2
+
+    double([1, 2, 3])
+    assert Cache.get_cached_items_count(double) == 3
+    assert Cache.has(double, 2)
+
+    Cache.delete(double, 2)
+    assert Cache.get_cached_items_count(double) == 2
+    assert Cache.filter_items_not_in_cache(double, [1, 2, 3]) == [2]
+
+    assert double([1, 2, 3]) == [2, 4, 6]
+    assert calls == [1, 2, 3, 2]
+
+
+def test_rebuild_index_picks_up_files_written_without_the_index():
+    @task(cache=True, output=None)
+    def double(data):
+        return data * 2
+
+    double([1, 2])
+    Cache.set_index_enabled()
+    assert Cache.get_cached_items_count(double) == 2
+
+    Cache.set_index_enabled(False)
+    double([3])
+    Cache.set_index_enabled()
+    assert Cache.get_cached_items_count(double) == 2
+    assert Cache.rebuild_index(double) == 3
+    assert Cache.get_cached_items_count(double) == 3
@@ -0,0 +1,51 @@
+import itertools
+
+import pytest
+
+from botasaurus.cache import Cache
+
+
+@pytest.fixture
+def items():
+    for key in range(10):
+        Cache.put("double", key, key * 2)
+    return list(range(10))
+
+
+@pytest.mark.parametrize("n_workers", [None, 2])
+def test_iter_items_keeps_the_order_of_items(items, n_workers):
+    keys = items + [10]
+    assert list(Cache.iter_items("double", keys, batch_size=3, n_workers=n_workers)) == [key * 2 for key in items] + [None]
+    assert list(Cache.iter_items("double", keys)) == Cache.get_items("double", keys)
+
+
+def test_iter_items_without_items_yields_every_cached_item_by_hash(items):
+    pairs = dict(Cache.iter_items_with_keys("double", batch_size=4))
+    assert pairs == {Cache.hash(key): key * 2 for key in items}
+    assert sorted(Cache.iter_items("double")) == sorted(key * 2 for key in items)
+
+
+@pytest.mark.parametrize("setting", ["sharded", "indexed"])
+def test_iter_items_reads_every_layout(setting):
+    if setting == "sharded":
+        Cache.set_sharded_layout()
+    else:
+        Cache.set_index_enabled()
+    Cache.put("double", 1, 2)
+    Cache.put("double", 2, 4)
+    assert sorted(Cache.iter_items("double")) == [2, 4]
+    assert list(Cache.iter_items_with_keys("double", [2, 3])) == [(2, 4), (3, None)]
+
+
+def test_iter_items_reads_at_most_two_batches_ahead(items):
+    consumed = []
+
+    def keys():
+        for key in itertools.count():
+            consumed.append(key)
+            yield key
+
+    results = Cache.iter_items("double", keys(), batch_size=3)
+    assert [next(results) for _ in range(4)] == [0, 2, 4, 6]
+    assert len(consumed) <= 9
+    results.close()
@@ -0,0 +1,78 @@
+import pytest
+
+from botasaurus.cache import Cache
+from botasaurus.cache_keys import canonical_dumps, canonical_hash
+from botasaurus.task import task
+
+
+def test_canonical_form_ignores_dict_key_order():
+    assert canonical_dumps({"a": 1, "b": {"d": [1, 2], "c": None}}) == canonical_dumps({"b": {"c": None, "d": [1, 2]}, "a": 1})
+    assert canonical_hash({"a": 1, "b": 2}) == canonical_hash({"b": 2, "a": 1})
+    assert canonical_hash([1, 2]) != canonical_hash([2, 1])
+
+
+def test_canonical_form_normalizes_equal_values():
+    assert canonical_dumps(1.0) == canonical_dumps(1) == "1"
+    assert canonical_dumps(-0.0) == "0"
+    assert canonical_dumps((1, 2)) == canonical_dumps([1, 2])
+    assert canonical_dumps({1: "a", "2": "b"}) == '{"1":"a","2":"b"}'
+    assert canonical_dumps("é") == '"é"'
+    assert canonical_hash(1.5) != canonical_hash(1)
+
+
+def test_canonical_hash_digest_size():
+    assert len(canonical_hash("a")) == 32
+    assert len(canonical_hash("a", digest_size=32)) == 64
+
+
+def test_unknown_key_hashing():
+    with pytest.raises(ValueError, match="Unknown key hashing"):
+        Cache.set_key_hashing("sorted")
+
+
+def test_legacy_hashing_depends_on_key_order():
+    Cache.put("double", {"a": 1, "b": 2}, 3)
+    assert not Cache.has("double", {"b": 2, "a": 1})
+
+    Cache.set_key_hashing("canonical")
+    Cache.put("double", {"a": 1, "b": 2}, 3)
+    assert Cache.get("double", {"b": 2, "a": 1}) == 3
+
+
+def test_migrate_keys():
+    Cache.put("double", {"a": 1, "b": 2}, 3)
+    Cache.put("double", 4, 8)
+
+    Cache.set_key_hashing("canonical")
+    assert not Cache.has("double", {"b": 2, "a": 1})
+    assert Cache.migrate_keys("double", [{"a": 1, "b": 2}, 4, 5]) == 2
+    assert Cache.get_items("double", [{"b": 2, "a": 1}, 4, 5]) == [3, 8, None]
+    assert Cache.migrate_keys("double", [4]) == 0
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_migrate_on_read(indexed):
+    Cache.set_index_enabled(indexed)
+    Cache.put("double", {"a": 1, "b": 2}, 3)
+
+    Cache.set_key_hashing("canonical", migrate_on_read=True)
+    # Items are found by the legacy hash of the key as it is read
+    assert Cache.get("double", {"a": 1, "b": 2}) == 3
+    assert Cache.get("double", {"b": 2, "a": 1}) == 3
+    assert Cache.get_cached_items_count("double") == 1
+    assert Cache.get_items_hashes("double") == [Cache.hash({"a": 1, "b": 2})]
+
+
+def test_decorators_reuse_items_cached_with_legacy_keys():
+    calls = []
+
+    @task(cache=True, output=None)
+    def double(data):
+        calls.append(data)
+        return data["n"] * 2
+
+    double({"n": 1, "x": 0})
+    Cache.set_key_hashing("canonical", migrate_on_read=True)
+    assert double({"n": 1, "x": 0}) == 2
+    assert double({"x": 0, "n": 1}) == 2
+    assert calls == [{"n": 1, "x": 0}]
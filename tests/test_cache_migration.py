@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from botasaurus.cache import Cache
+from botasaurus.cache_cli import main
+from botasaurus.cache_migration import migrate_cache
+from botasaurus.cache_storage import FileCacheStorage, get_many, put_many
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    from sqlite_cache_storage import SqliteCacheStorage
+    storage = SqliteCacheStorage(str(tmp_path / "cache.db"))
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def links():
+    links = [f"https://example.com/{index}" for index in range(25)]
+    for link in links:
+        Cache.put("scrape", link, {"link": link, "title": link[-2:]})
+    return links
+
+
+def test_copies_the_given_items(links, sqlite_storage):
+    assert Cache.migrate_storage("scrape", destination=sqlite_storage, items=links + ["https://example.com/missing"], batch_size=4) == 25
+    assert get_many(sqlite_storage, "scrape", links[:2]) == [
+        {"data": {"link": links[0], "title": "/0"}},
+        {"data": {"link": links[1], "title": "/1"}},
+    ]
+
+
+def test_copies_every_file_cache_item_keyed_by_key_field(links, sqlite_storage):
+    Cache.put("scrape", "https://example.com/other", {"link": "https://example.com/changed"})
+    Cache.put("scrape", "https://example.com/list", ["not", "a", "dict"])
+
+    # Items whose key_field does not hash to their file name are skipped, as their input is unknown
+    assert Cache.migrate_storage("scrape", destination=sqlite_storage, key_field="link", batch_size=7, n_workers=2) == 25
+    assert sqlite_storage.get("scrape", links[24]) == {"data": {"link": links[24], "title": "24"}}
+
+
+def test_copies_to_the_file_cache(links, sqlite_storage):
+    put_many(sqlite_storage, "scrape", [(link, {"copied": True}) for link in links[:3]])
+    Cache.clear()
+
+    assert Cache.migrate_storage("scrape", source=sqlite_storage, destination=FileCacheStorage, items=links) == 3
+    assert Cache.get_items("scrape", links[:4]) == [{"copied": True}] * 3 + [None]
+
+
+def test_resume_skips_items_the_destination_has(links, sqlite_storage):
+    sqlite_storage.put("scrape", links[0], "kept")
+
+    assert migrate_cache("scrape", destination=sqlite_storage, items=links, progress=False) == 24
+    assert sqlite_storage.get("scrape", links[0]) == {"data": "kept"}
+    assert migrate_cache("scrape", destination=sqlite_storage, items=links, progress=False) == 0
+
+    assert migrate_cache("scrape", destination=sqlite_storage, items=links, resume=False, progress=False) == 25
+    assert sqlite_storage.get("scrape", links[0])["data"]["link"] == links[0]
+
+
+def test_invalid_migrations(sqlite_storage):
+    with pytest.raises(ValueError, match="must be different"):
+        Cache.migrate_storage("scrape", source=FileCacheStorage, items=[1])
+    with pytest.raises(ValueError, match="items must be passed"):
+        Cache.migrate_storage("scrape", source=sqlite_storage)
+    with pytest.raises(ValueError, match="items must be passed"):
+        Cache.migrate_storage("scrape", destination=sqlite_storage)
+
+
+def test_command_line(links, tmp_path, capsys):
+    items_path = tmp_path / "links.json"
+    items_path.write_text(json.dumps(links[:5]))
+    database = tmp_path / "cli.db"
+
+    main(["migrate", "scrape", "--to", f"sqlite:{database}", "--items", str(items_path), "--cache-directory", str(tmp_path / "cache")])
+    assert "Copied 5 cached items of scrape from file to sqlite:" in capsys.readouterr().out
+    main(["migrate", "scrape", "--to", f"lmdb:{tmp_path / 'cache.lmdb'}", "--key-field", "link", "--cache-directory", str(tmp_path / "cache")])
+    assert "Copied 25 cached items" in capsys.readouterr().out
+
+    from sqlite_cache_storage import SqliteCacheStorage
+    storage = SqliteCacheStorage(str(database))
+    try:
+        assert storage.has_many("scrape", links[4:6]) == [True, False]
+    finally:
+        storage.close()
@@ -0,0 +1,61 @@
+import os
+
+from botasaurus.cache import Cache
+
+
+def _files(cache_directory, fn_name):
+    root = cache_directory / fn_name
+    return sorted(
+        os.path.relpath(os.path.join(dirpath, filename), root)
+        for dirpath, _, filenames in os.walk(root) for filename in filenames if filename.endswith(".json")
+    )
+
+
+def test_sharded_layout_stores_items_in_nested_directories(cache_directory):
+    Cache.set_sharded_layout()
+    Cache.put("double", 1, 2)
+    Cache.put("double", 2, 4)
+
+    data_hash = Cache.hash(1)
+    assert os.path.join(data_hash[:2], data_hash[2:4], data_hash + ".json") in _files(cache_directory, "double")
+    assert os.path.exists(cache_directory / "double" / ".sharded")
+
+    assert Cache.get("double", 1) == 2
+    assert Cache.has("double", 2)
+    assert Cache.get_cached_items_count("double") == 2
+    assert sorted(Cache.get_items("double")) == [2, 4]
+
+    Cache.delete("double", 1)
+    assert not Cache.has("double", 1)
+    assert Cache.get_cached_items_count("double") == 1
+
+
+def test_flat_caches_keep_their_layout_when_sharding_is_enabled(cache_directory):
+    Cache.put("double", 1, 2)
+    Cache.set_sharded_layout()
+    Cache.set_cache_directory(str(cache_directory))
+    Cache.put("double", 2, 4)
+
+    assert _files(cache_directory, "double") == sorted([Cache.hash(1) + ".json", Cache.hash(2) + ".json"])
+    assert Cache.get("double", 1) == 2
+    assert Cache.get_cached_items_count("double") == 2
+
+
+def test_migrate_to_sharded_layout(cache_directory):
+    Cache.put("double", 1, 2)
+    Cache.put("double", 2, 4)
+    Cache.put("triple", 1, 3)
+
+    assert Cache.migrate_to_sharded_layout("double") == 2
+    assert all(os.sep in path for path in _files(cache_directory, "double"))
+    assert _files(cache_directory, "triple") == [Cache.hash(1) + ".json"]
+    assert Cache.get("double", 1) == 2
+    assert Cache.get_cached_items_count("double") == 2
+
+    # Already migrated caches are skipped, and func=None migrates every cache
+    assert Cache.migrate_to_sharded_layout() == 1
+    assert Cache.get("triple", 1) == 3
+
+    # New items of a migrated cache go to the sharded layout, without enabling it for new caches
+    Cache.put("double", 3, 6)
+    assert all(os.sep in path for path in _files(cache_directory, "double"))
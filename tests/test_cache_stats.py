@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+from botasaurus.cache import Cache
+from botasaurus.cache_storage import get_many, put_many, resolve_cache_storage, default_file_cache_storage
+
+
+def test_batch_reads_report_bytes_and_every_expiration(tmp_path):
+    Cache.set_cache_directory(str(tmp_path / "cache"))
+    Cache.set_stats_enabled(True)
+    Cache.reset_stats()
+    try:
+        storage = resolve_cache_storage(default_file_cache_storage)
+        put_many(storage, "double", [(i, i * 2) for i in range(20)])
+        time.sleep(1.1)
+        put_many(storage, "double", [(i, i * 2) for i in range(10)])
+
+        results = get_many(storage, "double", list(range(20)), timedelta(seconds=1))
+        assert sum(cached is not None for cached in results) == 10
+
+        stats = Cache.stats()["double"]["FileCacheStorage"]
+        assert stats["hits"] == 10
+        assert stats["expirations"] == 10
+        assert stats["bytes_read"] > 0
+    finally:
+        Cache.set_stats_enabled(False)
+        Cache.reset_stats()
+
+
+def test_map_io_uses_threads_for_processes_when_stats_are_enabled(monkeypatch):
+    import joblib
+    from botasaurus import cache_stats
+    from botasaurus.io_executor import map_io
+
+    def parallel(*args, **kwargs):
+        raise AssertionError("worker processes do not see the stats of the call")
+    monkeypatch.setattr(joblib, "Parallel", parallel)
+    Cache.set_stats_enabled(True)
+    usage = cache_stats._Usage()
+    token = cache_stats._current_usage.set(usage)
+    try:
+        map_io(cache_stats.note_bytes_read, [10] * 300, strategy="processes")
+        assert usage.bytes_read == 3000
+    finally:
+        cache_stats._current_usage.reset(token)
+        Cache.set_stats_enabled(False)
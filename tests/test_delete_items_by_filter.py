@@ -0,0 +1,76 @@
+import builtins
+import json
+
+import pytest
+
+from botasaurus.cache import Cache
+
+
+def is_odd(key, data):
+    return data % 2 == 1
+
+
+@pytest.fixture
+def items():
+    for key in range(10):
+        Cache.put("identity", key, key)
+    return list(range(10))
+
+
+def _remaining(items):
+    return [data for data in Cache.get_items("identity", items) if data is not None]
+
+
+def _no_input(prompt):
+    raise AssertionError("asked for confirmation")
+
+
+@pytest.mark.parametrize("batch_size", [1000, 2])
+def test_deletes_without_confirmation(items, monkeypatch, batch_size):
+    monkeypatch.setattr(builtins, "input", _no_input)
+    assert Cache.delete_items_by_filter("identity", is_odd, confirm=False, batch_size=batch_size) == 5
+    assert _remaining(items) == [0, 2, 4, 6, 8]
+
+
+def test_dry_run_only_counts(items, monkeypatch):
+    monkeypatch.setattr(builtins, "input", _no_input)
+    assert Cache.delete_items_by_filter("identity", is_odd, dry_run=True) == 5
+    assert _remaining(items) == items
+
+
+def test_filters_the_given_items(items):
+    assert Cache.delete_items_by_filter("identity", is_odd, items=[1, 2, 3, 20], confirm=False, n_workers=2) == 2
+    assert _remaining(items) == [0, 2, 4, 5, 6, 7, 8, 9]
+
+
+@pytest.mark.parametrize("answer, remaining", [("y", [0, 2, 4, 6, 8]), ("n", list(range(10)))])
+def test_confirmation_lists_the_matched_items(items, monkeypatch, tmp_path, answer, remaining):
+    (tmp_path / "output").mkdir()
+    monkeypatch.setattr(builtins, "input", lambda prompt: answer)
+    Cache.delete_items_by_filter("identity", is_odd, items=items)
+
+    with open("output/items_to_be_deleted.json") as fp:
+        assert json.load(fp) == [1, 3, 5, 7, 9]
+    assert _remaining(items) == remaining
+
+
+def test_updates_the_index(items):
+    Cache.set_index_enabled()
+    Cache.rebuild_index("identity")
+    Cache.delete_items_by_filter("identity", is_odd, confirm=False)
+    assert Cache.get_cached_items_count("identity") == 5
+
+
+def test_filters_a_cache_storage():
+    from sqlite_cache_storage import SqliteCacheStorage
+    storage = SqliteCacheStorage("cache.db")
+    try:
+        for key in range(4):
+            storage.put("identity", key, key)
+        assert Cache.delete_items_by_filter("identity", is_odd, items=range(4), confirm=False, cache_storage=storage) == 2
+        assert storage.has_many("identity", range(4)) == [True, False, True, False]
+
+        with pytest.raises(ValueError, match="items must be passed"):
+            Cache.delete_items_by_filter("identity", is_odd, cache_storage=storage)
+    finally:
+        storage.close()
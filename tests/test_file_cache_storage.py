@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from botasaurus.cache import Cache
+from botasaurus.cache_storage import FileCacheStorage, default_file_cache_storage
+
+
+def test_class_level_calls_use_the_default_storage():
+    FileCacheStorage.put("double", 1, 2)
+    assert FileCacheStorage.get("double", 1) == {"data": 2}
+    assert FileCacheStorage.get("double", 1, timedelta(days=1)) == {"data": 2}
+    assert default_file_cache_storage.get("double", 1) == {"data": 2}
+    assert Cache.get("double", 1) == 2
+
+    FileCacheStorage.put_many("double", [(2, 4), (3, 6)])
+    assert FileCacheStorage.get_many("double", [1, 2, 4]) == [{"data": 2}, {"data": 4}, None]
+    assert FileCacheStorage.has_many("double", [3, 4]) == [True, False]
+    assert FileCacheStorage.get_with_age("double", 3)["data"] == 6
+
+    FileCacheStorage.delete("double", 1)
+    FileCacheStorage.delete_many("double", [2, 3])
+    assert FileCacheStorage.get_many("double", [1, 2, 3]) == [None, None, None]
+
+
+def test_instances_keep_their_own_compression():
+    storage = FileCacheStorage(compression="gzip")
+    storage.put("double", 1, 2)
+    FileCacheStorage.put("double", 2, 4)
+
+    with open(_path("double", 1), "rb") as fp:
+        assert fp.read().startswith(b"#btc1 ")
+    with open(_path("double", 2), "rb") as fp:
+        assert fp.read() == b"4"
+    assert storage.get("double", 2) == {"data": 4}
+
+
+def _path(func_name, key_data):
+    from botasaurus.cache import _get_cache_path
+    return _get_cache_path(func_name, key_data)
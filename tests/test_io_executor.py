@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from botasaurus import io_executor
+from botasaurus.io_executor import choose_io_strategy, estimate_average_file_size, get_io_executor, map_files, map_io
+
+
+def test_choose_io_strategy():
+    assert choose_io_strategy(io_executor.SERIAL_MAX_ITEMS) == "serial"
+    assert choose_io_strategy(io_executor.SERIAL_MAX_ITEMS + 1) == "threads"
+    assert choose_io_strategy(10000, 1024) == "threads"
+    assert choose_io_strategy(io_executor.PROCESSES_MIN_ITEMS, io_executor.PROCESSES_MIN_AVERAGE_SIZE) == "processes"
+    assert choose_io_strategy(io_executor.PROCESSES_MIN_ITEMS - 1, io_executor.PROCESSES_MIN_AVERAGE_SIZE) == "threads"
+
+
+@pytest.mark.parametrize("strategy", ["serial", "threads", "processes"])
+def test_map_io_keeps_the_order_of_items(strategy):
+    items = list(range(1000))
+    assert map_io(abs, (-item for item in items), strategy=strategy) == items
+
+
+def test_map_io_runs_small_batches_in_the_calling_thread():
+    threads = set(map_io(lambda _: threading.get_ident(), range(10)))
+    assert threads == {threading.get_ident()}
+
+
+def test_map_io_uses_the_shared_thread_pool():
+    threads = set(map_io(lambda _: threading.current_thread().name, range(1000)))
+    assert all(name.startswith("botasaurus-io") for name in threads)
+    assert get_io_executor() is get_io_executor()
+
+
+def test_map_io_raises_the_errors_of_fn():
+    def fail(item):
+        if item == 500:
+            raise KeyError(item)
+        return item
+
+    with pytest.raises(KeyError):
+        map_io(fail, range(1000), strategy="threads")
+
+
+def test_estimate_average_file_size(tmp_path):
+    paths = []
+    for size in (100, 300):
+        path = tmp_path / f"{size}.json"
+        path.write_bytes(b"x" * size)
+        paths.append(str(path))
+
+    assert estimate_average_file_size(paths) == 200
+    assert estimate_average_file_size(paths + [str(tmp_path / "missing.json")]) == 200
+    assert estimate_average_file_size([]) == 0
+
+
+def test_map_files(tmp_path):
+    paths = []
+    for index in range(100):
+        path = tmp_path / f"{index}.json"
+        path.write_text(str(index))
+        paths.append(str(path))
+
+    assert map_files(lambda path: int(open(path).read()), paths) == list(range(100))
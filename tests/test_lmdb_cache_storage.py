@@ -0,0 +1,128 @@
+import atexit
+import time
+from datetime import timedelta
+
+import pytest
+
+from botasaurus.cache import Cache
+from lmdb_cache_storage import LmdbCacheStorage
+
+
+@pytest.fixture(params=["dbm", "lmdb"])
+def create_storage(request, tmp_path):
+    if request.param == "lmdb":
+        pytest.importorskip("lmdb")
+    storages = []
+
+    def create(**kwargs):
+        storage = LmdbCacheStorage(str(tmp_path / "cache.lmdb"), backend=request.param, **kwargs)
+        storages.append(storage)
+        return storage
+
+    yield create
+    for storage in storages:
+        storage.close()
+
+
+def test_round_trip(create_storage):
+    storage = create_storage()
+    storage.put("double", {"a": 1}, {"result": [1, 2]})
+    storage.put("double", 2, None)
+
+    assert storage.get("double", {"a": 1}) == {"data": {"result": [1, 2]}}
+    assert storage.get("double", 2) == {"data": None}
+    assert storage.get("double", 3) is None
+    assert storage.get("other", 2) is None
+    assert storage.count() == 2
+
+    storage.delete("double", 2)
+    assert storage.get("double", 2) is None
+
+    storage.clear()
+    assert storage.count() == 0
+
+
+def test_batch_operations(create_storage):
+    storage = create_storage()
+    storage.put_many("double", [(i, i * 2) for i in range(5)])
+
+    assert storage.get_many("double", [0, 4, 5]) == [{"data": 0}, {"data": 8}, None]
+    assert storage.has_many("double", [1, 5]) == [True, False]
+
+    storage.delete_many("double", [0, 1])
+    assert storage.has_many("double", [0, 1, 2]) == [False, False, True]
+
+
+def test_expired_items_are_deleted(create_storage):
+    storage = create_storage()
+    storage.put("double", 1, 2)
+    time.sleep(1.1)
+    storage.put("double", 2, 4)
+
+    assert storage.get_many("double", [1, 2], timedelta(seconds=1)) == [None, {"data": 4}]
+    assert storage.get_with_age("double", 1) is None
+    assert storage.get_with_age("double", 2)["age"] < 1
+
+
+@pytest.mark.parametrize("compression", ["gzip", None])
+def test_items_are_kept_after_reopening(create_storage, compression):
+    storage = create_storage(compression=compression)
+    storage.put("double", 1, "x" * 1000)
+    storage.close()
+
+    assert create_storage().get("double", 1) == {"data": "x" * 1000}
+
+
+def test_migrate_keys_moves_legacy_items(create_storage):
+    legacy = create_storage(key_hashing="legacy")
+    legacy.put_many("double", [({"a": 1, "b": 2}, 3), (4, 8)])
+    legacy.close()
+
+    storage = create_storage(key_hashing="canonical")
+    assert storage.get("double", {"b": 2, "a": 1}) is None
+    assert storage.migrate_keys("double", [{"a": 1, "b": 2}, 5]) == 1
+    assert storage.get("double", {"b": 2, "a": 1}) == {"data": 3}
+
+
+def test_migrate_on_read(create_storage):
+    legacy = create_storage(key_hashing="legacy")
+    legacy.put("double", 4, 8)
+    legacy.close()
+
+    Cache.set_key_hashing("canonical", migrate_on_read=True)
+    storage = create_storage()
+    assert storage.get("double", 4) == {"data": 8}
+    assert storage.count() == 1
+
+
+def test_close_unregisters_its_exit_hook(create_storage, monkeypatch):
+    unregistered = []
+    monkeypatch.setattr(atexit, "unregister", unregistered.append)
+    storage = create_storage()
+    storage.close()
+    storage.close()
+    assert unregistered == [storage.close]
+
+
+def test_dbm_is_used_without_lmdb(tmp_path, monkeypatch):
+    import builtins
+    real_import = builtins.__import__
+
+    def import_without_lmdb(name, *args, **kwargs):
+        if name == "lmdb":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", import_without_lmdb)
+    storage = LmdbCacheStorage(str(tmp_path / "cache.lmdb"))
+    try:
+        assert storage.backend == "dbm"
+        storage.put("double", 1, 2)
+        assert storage.get("double", 1) == {"data": 2}
+    finally:
+        storage.close()
+
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(ValueError, match="Unknown backend"):
+        LmdbCacheStorage(str(tmp_path / "cache.lmdb"), backend="redis")
@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+from botasaurus.cache import Cache
+from botasaurus.cache_storage import FileCacheStorage, MemoryCache
+
+
+class CountingStorage(FileCacheStorage):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get(self, func_name, key_data, expires_in=None):
+        self.reads += 1
+        return super().get(func_name, key_data, expires_in)
+
+    def get_with_age(self, func_name, key_data):
+        self.reads += 1
+        return super().get_with_age(func_name, key_data)
+
+
+def test_items_loaded_from_inner_storage_are_served_from_memory_with_expires_in(tmp_path):
+    Cache.set_cache_directory(str(tmp_path / "cache"))
+    inner = CountingStorage()
+    inner.put("double", 1, 2)
+    inner.put("double", 2, 4)
+    storage = MemoryCache(inner)
+
+    assert storage.get("double", 1, timedelta(days=1)) == {"data": 2}
+    assert storage.get_many("double", [1, 2], timedelta(days=1)) == [{"data": 2}, {"data": 4}]
+    assert storage.get("double", 2, timedelta(days=1)) == {"data": 4}
+    assert inner.reads == 2
+
+
+def test_items_loaded_from_inner_storage_expire_by_their_real_age(tmp_path):
+    Cache.set_cache_directory(str(tmp_path / "cache"))
+    inner = FileCacheStorage()
+    inner.put("double", 1, 2)
+    time.sleep(1.1)
+    storage = MemoryCache(inner)
+
+    assert storage.get("double", 1, timedelta(days=1)) == {"data": 2}
+    assert storage.get("double", 1, timedelta(seconds=1)) is None
+    assert not Cache.has("double", 1)
@@ -0,0 +1,174 @@
+import gc
+import os
+import shutil
+import weakref
+
+from botasaurus.segment_cache_storage import FLAG_TOMBSTONE, INDEX_FILENAME, SegmentCacheStorage
+
+
+def open_storage(directory, **kwargs):
+    return SegmentCacheStorage(str(directory), compaction_interval=None, **kwargs)
+
+
+def iter_all_records(storage):
+    for segment_id in storage._list_segment_ids():
+        for _, flags, key, value_offset, value_length, created_at, _ in storage._iter_records(segment_id):
+            yield segment_id, flags, key, (segment_id, value_offset, value_length, created_at)
+
+
+def test_put_get_delete(tmp_path):
+    storage = open_storage(tmp_path / "segments")
+    storage.put("double", 1, 2)
+    storage.put("double", {"a": 1}, [1, 2])
+    storage.put("double", 1, 3)
+
+    assert storage.get("double", 1) == {"data": 3}
+    assert storage.get("double", {"a": 1}) == {"data": [1, 2]}
+    assert storage.get("double", 2) is None
+    assert storage.count() == 2
+
+    storage.delete("double", 1)
+    assert storage.get("double", 1) is None
+    assert storage.count() == 1
+    storage.close()
+
+
+def test_compressed_items(tmp_path):
+    storage = open_storage(tmp_path / "segments", compression="gzip")
+    storage.put("double", 1, {"text": "x" * 1000})
+    assert storage.get("double", 1) == {"data": {"text": "x" * 1000}}
+    storage.close()
+
+
+def test_reopen_with_saved_index(tmp_path):
+    directory = tmp_path / "segments"
+    storage = open_storage(directory)
+    storage.put("double", 1, 2)
+    storage.put("double", 2, 4)
+    storage.delete("double", 2)
+    storage.close()
+    assert os.path.exists(directory / INDEX_FILENAME)
+
+    storage = open_storage(directory)
+    assert storage.get("double", 1) == {"data": 2}
+    assert storage.get("double", 2) is None
+    storage.close()
+
+
+def test_reopen_rebuilds_the_index_from_the_segments(tmp_path):
+    directory = tmp_path / "segments"
+    storage = open_storage(directory, max_segment_size=200)
+    for i in range(10):
+        storage.put("double", i, i * 2)
+    storage.delete("double", 3)
+    storage.put("double", 4, "overwritten")
+    storage.close()
+    os.remove(directory / INDEX_FILENAME)
+
+    storage = open_storage(directory)
+    assert storage.count() == 9
+    assert storage.get("double", 3) is None
+    assert storage.get("double", 4) == {"data": "overwritten"}
+    assert storage.get("double", 9) == {"data": 18}
+    storage.close()
+
+
+def test_reopen_catches_up_with_records_written_after_the_index_was_saved(tmp_path):
+    directory = tmp_path / "segments"
+    storage = open_storage(directory)
+    storage.put("double", 1, 2)
+    storage.save_index()
+    storage.put("double", 2, 4)
+    storage.delete("double", 1)
+    # A copy taken before close is what a killed process leaves behind
+    shutil.copytree(directory, tmp_path / "copy")
+    storage.close()
+
+    storage = open_storage(tmp_path / "copy")
+    assert storage.get("double", 1) is None
+    assert storage.get("double", 2) == {"data": 4}
+    storage.close()
+
+
+def test_compaction_keeps_only_live_records_and_needed_tombstones(tmp_path):
+    directory = tmp_path / "segments"
+    storage = open_storage(directory, max_segment_size=200)
+    for i in range(12):
+        storage.put("double", i, i * 2)
+    for i in range(4):
+        storage.put("double", i, "new")
+    storage.delete("double", 5)
+    segments_before = storage._list_segment_ids()
+
+    assert storage.compact() > 0
+    assert segments_before[0] not in storage._list_segment_ids()
+
+    live = 0
+    for segment_id, flags, key, entry in iter_all_records(storage):
+        if flags & FLAG_TOMBSTONE:
+            # Only kept while an older segment may still hold the deleted value
+            assert key not in storage._index
+            assert any(other < segment_id for other in storage._list_segment_ids())
+        elif storage._index.get(key) == entry:
+            live += 1
+        else:
+            # Dead records are only left in segments below the compaction threshold
+            info = storage._segments[segment_id]
+            assert info["dead"] / info["size"] < storage.compaction_threshold
+    assert live == storage.count() == 11
+
+    storage.close()
+    os.remove(directory / INDEX_FILENAME)
+    storage = open_storage(directory)
+    assert [storage.get("double", i) for i in (0, 4, 5, 11)] == [{"data": "new"}, {"data": 8}, None, {"data": 22}]
+    storage.close()
+
+
+def test_truncated_tail_record_is_ignored(tmp_path):
+    directory = tmp_path / "segments"
+    storage = open_storage(directory)
+    storage.put("double", 1, 2)
+    storage.put("double", 2, "last")
+    segment_path = storage._segment_path(storage._active_id)
+    storage.close()
+    os.remove(directory / INDEX_FILENAME)
+
+    size = os.path.getsize(segment_path)
+    with open(segment_path, "r+b") as fp:
+        fp.truncate(size - 3)
+
+    storage = open_storage(directory)
+    assert storage.get("double", 1) == {"data": 2}
+    assert storage.get("double", 2) is None
+    storage.put("double", 3, 6)
+    assert storage.get("double", 3) == {"data": 6}
+    storage.close()
+
+
+def test_corrupted_tail_record_is_ignored_by_its_crc(tmp_path):
+    directory = tmp_path / "segments"
+    storage = open_storage(directory)
+    storage.put("double", 1, 2)
+    storage.put("double", 2, "last")
+    segment_path = storage._segment_path(storage._active_id)
+    storage.close()
+    os.remove(directory / INDEX_FILENAME)
+
+    with open(segment_path, "r+b") as fp:
+        fp.seek(-2, os.SEEK_END)
+        fp.write(b"XX")
+
+    storage = open_storage(directory)
+    assert storage.get("double", 1) == {"data": 2}
+    assert storage.get("double", 2) is None
+    storage.close()
+
+
+def test_closed_storages_are_not_kept_alive_by_atexit(tmp_path):
+    storage = open_storage(tmp_path / "segments")
+    storage.put("double", 1, 2)
+    storage.close()
+    reference = weakref.ref(storage)
+    del storage
+    gc.collect()
+    assert reference() is None
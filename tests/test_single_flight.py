@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from botasaurus.cache import Cache
+from botasaurus.single_flight import run_single_flight, run_with_file_lock
+from botasaurus.task import task
+
+
+def _run_concurrently(fn, count=4):
+    barrier = threading.Barrier(count)
+
+    def run(_):
+        barrier.wait()
+        return fn()
+
+    with ThreadPoolExecutor(count) as executor:
+        return list(executor.map(run, range(count)))
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"page": 1}
+
+    results = _run_concurrently(lambda: run_single_flight("fetch", 1, fetch))
+    assert results == [{"page": 1}] * 4
+    assert len(calls) == 1
+
+    # Later calls run again
+    assert run_single_flight("fetch", 1, fetch) == {"page": 1}
+    assert len(calls) == 2
+
+
+def test_different_inputs_run_separately():
+    calls = []
+
+    def fetch(data):
+        calls.append(data)
+        time.sleep(0.1)
+        return data
+
+    with ThreadPoolExecutor(2) as executor:
+        results = list(executor.map(lambda data: run_single_flight("fetch", data, lambda: fetch(data)), [1, 2]))
+    assert results == [1, 2]
+    assert sorted(calls) == [1, 2]
+
+
+def test_errors_reach_every_caller():
+    def fetch():
+        time.sleep(0.2)
+        raise KeyError("page")
+
+    def call():
+        try:
+            run_single_flight("fetch", 1, fetch)
+        except KeyError as error:
+            return error
+
+    errors = _run_concurrently(call)
+    assert all(isinstance(error, KeyError) for error in errors)
+
+
+def test_file_lock_runs_one_call_at_a_time(cache_directory):
+    running, overlaps = [], []
+
+    def fetch():
+        running.append(1)
+        if len(running) > 1:
+            overlaps.append(1)
+        time.sleep(0.05)
+        running.pop()
+
+    _run_concurrently(lambda: run_with_file_lock("fetch", Cache.hash(1), fetch))
+    assert overlaps == []
+    assert os.listdir(cache_directory / "fetch" / ".locks") == [Cache.hash(1)[:4] + ".lock"]
+
+
+@pytest.mark.parametrize("single_flight", [True, "cross_process"])
+def test_task_runs_concurrent_calls_once(single_flight):
+    calls = []
+
+    @task(cache=True, output=None, single_flight=single_flight)
+    def fetch(data):
+        calls.append(data)
+        time.sleep(0.2)
+        return data * 2
+
+    assert _run_concurrently(lambda: fetch(3)) == [6] * 4
+    assert calls == [3]
@@ -0,0 +1,136 @@
+import atexit
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from sqlite_cache_storage import SqliteCacheStorage
+
+
+@pytest.fixture
+def create_storage(tmp_path):
+    storages = []
+
+    def create(**kwargs):
+        storage = SqliteCacheStorage(str(tmp_path / "cache.db"), **kwargs)
+        storages.append(storage)
+        return storage
+
+    yield create
+    for storage in storages:
+        storage.close()
+
+
+def _count_rows(tmp_path):
+    with sqlite3.connect(str(tmp_path / "cache.db")) as conn:
+        return conn.execute("SELECT COUNT(*) FROM botasaurus_cache").fetchone()[0]
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_round_trip(create_storage, compression):
+    storage = create_storage(compression=compression)
+    storage.put("double", {"a": 1}, [1, 2])
+    storage.put("double", 2, None)
+
+    assert storage.get("double", {"a": 1}) == {"data": [1, 2]}
+    assert storage.get("double", 2) == {"data": None}
+    assert storage.get("double", 3) is None
+    assert storage.get_with_age("double", 2)["age"] < 5
+
+    storage.delete("double", 2)
+    assert storage.get("double", 2) is None
+
+
+def test_uncompressed_rows_stay_readable_after_enabling_compression(create_storage):
+    create_storage().put("double", 1, 2)
+    assert create_storage(compression="gzip").get("double", 1) == {"data": 2}
+
+
+def test_connections_use_wal(create_storage):
+    storage = create_storage()
+    assert storage._get_connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_each_thread_reuses_its_own_connection(create_storage):
+    storage = create_storage()
+    conn = storage._get_connection()
+    assert storage._get_connection() is conn
+
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(storage._get_connection()))
+    thread.start()
+    thread.join()
+    assert connections[0] is not conn
+
+    # Connections of exited threads are closed when another thread connects
+    thread = threading.Thread(target=storage._get_connection)
+    thread.start()
+    thread.join()
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[0].execute("SELECT 1")
+
+
+def test_parallel_writes(create_storage, tmp_path):
+    storage = create_storage()
+    threads = [
+        threading.Thread(target=lambda offset=offset: [storage.put("double", offset + i, i) for i in range(50)])
+        for offset in range(0, 400, 50)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert _count_rows(tmp_path) == 400
+
+
+def test_batched_writes_are_read_before_they_are_committed(create_storage, tmp_path):
+    storage = create_storage(batch_writes=True, batch_interval=1)
+    storage.put("double", 1, 2)
+    storage.put("double", 2, 4)
+    storage.delete("double", 2)
+
+    assert storage.get("double", 1) == {"data": 2}
+    assert storage.get("double", 2) is None
+    assert storage.get_with_age("double", 1) == {"data": 2, "age": 0}
+
+    storage.flush()
+    assert _count_rows(tmp_path) == 1
+    assert create_storage().get("double", 1) == {"data": 2}
+
+
+def test_batched_writes_are_committed_every_batch_size_writes(create_storage, tmp_path):
+    storage = create_storage(batch_writes=True, batch_size=10, batch_interval=60)
+    storage.put_many("double", [(i, i) for i in range(10)])
+
+    deadline = time.time() + 5
+    while _count_rows(tmp_path) < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    assert _count_rows(tmp_path) == 10
+
+
+def test_close_commits_the_queued_writes(create_storage, tmp_path, monkeypatch):
+    unregistered = []
+    monkeypatch.setattr(atexit, "unregister", unregistered.append)
+    storage = create_storage(batch_writes=True, batch_interval=60)
+    storage.put_many("double", [(i, i) for i in range(5)])
+
+    storage.close()
+    assert _count_rows(tmp_path) == 5
+    assert unregistered == [storage.close]
+
+    # Writes after close are not queued
+    storage.put("double", 5, 5)
+    assert _count_rows(tmp_path) == 6
+
+
+def test_purge_expired(create_storage, tmp_path):
+    storage = create_storage()
+    storage.put_many("double", [(i, i) for i in range(3)])
+    with sqlite3.connect(str(tmp_path / "cache.db")) as conn:
+        conn.execute("UPDATE botasaurus_cache SET created_at = datetime('now', '-2 days') WHERE key != ?", (storage._make_key("double", 2),))
+
+    assert storage.get("double", 0, timedelta(days=1)) is None
+    assert storage.purge_expired(timedelta(days=1)) == 2
+    assert storage.get_many("double", [0, 1, 2]) == [None, None, {"data": 2}]
@@ -0,0 +1,137 @@
+import csv
+import json
+import threading
+import time
+
+import pytest
+
+from botasaurus.decorators_common import iter_stream
+from botasaurus.output import CsvStreamWriter, JsonStreamWriter
+from botasaurus.task import task
+
+
+@pytest.fixture(autouse=True)
+def output_directory(tmp_path):
+    (tmp_path / "output").mkdir()
+
+
+def test_results_are_yielded_as_they_complete():
+    @task(parallel=4, output=None, stream=True, close_on_crash=True)
+    def wait(seconds):
+        time.sleep(seconds)
+        return seconds
+
+    results = list(wait([0.3, 0.0, 0.1]))
+    assert [data for data, _ in results] == [0.0, 0.1, 0.3]
+    assert all(data == result for data, result in results)
+
+
+def test_ordered_results_keep_the_input_order():
+    @task(parallel=4, output=None, stream="ordered", close_on_crash=True)
+    def wait(seconds):
+        time.sleep(seconds)
+        return seconds * 2
+
+    assert list(wait([0.2, 0.0, 0.1])) == [(0.2, 0.4), (0.0, 0.0), (0.1, 0.2)]
+
+
+def test_nothing_runs_until_iterated_and_generators_are_consumed_lazily():
+    calls, consumed = [], []
+
+    def inputs():
+        for data in range(1000):
+            consumed.append(data)
+            yield data
+
+    @task(parallel=2, output=None, stream="ordered", close_on_crash=True)
+    def double(data):
+        calls.append(data)
+        return data * 2
+
+    results = double(inputs())
+    assert calls == []
+    assert next(results) == (0, 0)
+    results.close()
+    assert len(consumed) < 100
+
+
+def test_cached_results_are_streamed_without_running():
+    calls = []
+
+    @task(parallel=2, cache=True, output=None, stream=True, close_on_crash=True)
+    def double(data):
+        calls.append(data)
+        return data * 2
+
+    assert sorted(double([1, 2])) == [(1, 2), (2, 4)]
+    assert sorted(double([1, 2, 3])) == [(1, 2), (2, 4), (3, 6)]
+    assert sorted(calls) == [1, 2, 3]
+
+
+def test_output_files_are_written_incrementally(tmp_path):
+    @task(output="items", output_formats=["JSON", "CSV"], stream=True, close_on_crash=True)
+    def scrape(data):
+        return {"id": data, "tags": ["a", "b"]}
+
+    results = scrape([1, 2])
+    next(results)
+    assert (tmp_path / "output" / "items.json").exists()
+    list(results)
+
+    with open(tmp_path / "output" / "items.json") as fp:
+        assert json.load(fp) == [{"id": 1, "tags": ["a", "b"]}, {"id": 2, "tags": ["a", "b"]}]
+    with open(tmp_path / "output" / "items.csv", newline="") as fp:
+        assert [row["id"] for row in csv.DictReader(fp)] == ["1", "2"]
+
+
+def test_output_functions_are_called_for_each_item():
+    written = []
+
+    @task(output=lambda data, result: written.append((data, result)), stream="ordered", close_on_crash=True)
+    def double(data):
+        return data * 2
+
+    list(double([1, 2]))
+    assert written == [(1, 2), (2, 4)]
+
+
+def test_json_stream_writer_matches_json_dump(tmp_path):
+    items = [{"a": [1, {"b": None}]}, "é", 3]
+    writer = JsonStreamWriter(str(tmp_path / "output" / "items.json"))
+    for item in items:
+        writer.write(item)
+    path = writer.close()
+
+    with open(path, encoding="utf-8") as fp:
+        assert fp.read() == json.dumps(items, indent=4)
+
+    empty = JsonStreamWriter(str(tmp_path / "output" / "empty.json"))
+    with open(empty.close()) as fp:
+        assert json.load(fp) == []
+
+
+def test_csv_stream_writer_uses_the_columns_of_the_first_result(tmp_path):
+    writer = CsvStreamWriter(str(tmp_path / "output" / "items.csv"))
+    writer.write({"id": 1, "name": "a"})
+    writer.write({"id": 2, "extra": True})
+    with open(writer.close(), newline="") as fp:
+        assert list(csv.DictReader(fp)) == [{"id": "1", "name": "a"}, {"id": "2", "name": ""}]
+
+
+def test_iter_stream_limits_the_queued_runs():
+    running, peak = [], []
+    lock = threading.Lock()
+
+    def run(data):
+        with lock:
+            running.append(data)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(data)
+        return data
+
+    entries = ((data, data % 5 == 0, "cached") for data in range(50))
+    results = dict(iter_stream(run, entries, 3, ordered=False))
+    assert max(peak) <= 3
+    assert results[5] == "cached" and results[6] == 6 and len(results) == 50